@@ -151,6 +151,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "sesame.middleware.AuthenticationMiddleware",
+    "squarelet.organizations.middleware.MembershipCacheMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "oidc_provider.middleware.SessionManagementMiddleware",
@@ -346,11 +347,61 @@ OIDC_USERINFO = "squarelet.users.oidc.userinfo"
 OIDC_EXTRA_SCOPE_CLAIMS = "squarelet.users.oidc.CustomScopeClaims"
 OIDC_SESSION_MANAGEMENT_ENABLE = True
 OIDC_GRANT_TYPE_PASSWORD_ENABLE = True
+# seconds to cache each user's claims - they are also cleared whenever a cache
+# invalidation is sent for the user or their organizations
+OIDC_CLAIMS_CACHE_TIMEOUT = env.int("OIDC_CLAIMS_CACHE_TIMEOUT", default=3600)
 # required due to changes in Django 2.1
 SESSION_COOKIE_SAMESITE = None
 ENABLE_SEND_CACHE_INVALIDATIONS = env.bool(
     "ENABLE_SEND_CACHE_INVALIDATIONS", default=True
 )
+# write cache invalidations to an outbox table to be coalesced and sent by the
+# drain_cache_invalidations command
+CACHE_INVALIDATION_OUTBOX = env.bool("CACHE_INVALIDATION_OUTBOX", default=True)
+# how many seconds the drainer coalesces cache invalidations for
+CACHE_INVALIDATION_WINDOW = env.float("CACHE_INVALIDATION_WINDOW", default=0.5)
+# maximum number of outbox rows to process in a single drain
+CACHE_INVALIDATION_BATCH_SIZE = env.int("CACHE_INVALIDATION_BATCH_SIZE", default=5000)
+# maximum number of UUIDs to send to a client in a single webhook
+CACHE_INVALIDATION_CHUNK_SIZE = env.int("CACHE_INVALIDATION_CHUNK_SIZE", default=100)
+# maximum number of changes returned by each page of the change feed
+CHANGE_FEED_PAGE_SIZE = env.int("CHANGE_FEED_PAGE_SIZE", default=500)
+# days to keep changes for the change feed
+CHANGE_FEED_RETENTION = env.int("CHANGE_FEED_RETENTION", default=30)
+# maximum number of UUIDs which may be fetched at once with `uuid__in` - this
+# matches the number of UUIDs sent in each cache invalidation, and should be no
+# more than the API page size
+API_BULK_MAX_UUIDS = env.int("API_BULK_MAX_UUIDS", default=100)
+
+# webhooks
+# ------------------------------------------------------------------------------
+# seconds to wait for a client's webhook endpoint to respond
+WEBHOOK_TIMEOUT = env.float("WEBHOOK_TIMEOUT", default=5)
+# how many times to retry a failed webhook, backing off exponentially
+WEBHOOK_RETRIES = env.int("WEBHOOK_RETRIES", default=3)
+WEBHOOK_BACKOFF = env.float("WEBHOOK_BACKOFF", default=0.5)
+# maximum simultaneous requests to a single webhook host
+WEBHOOK_MAX_CONCURRENCY = env.int("WEBHOOK_MAX_CONCURRENCY", default=4)
+# maximum threads used to send webhooks to all clients at once
+WEBHOOK_WORKERS = env.int("WEBHOOK_WORKERS", default=10)
+# stop contacting a webhook host for WEBHOOK_CIRCUIT_RESET seconds after
+# WEBHOOK_CIRCUIT_THRESHOLD consecutive failures
+WEBHOOK_CIRCUIT_THRESHOLD = env.int("WEBHOOK_CIRCUIT_THRESHOLD", default=5)
+WEBHOOK_CIRCUIT_RESET = env.float("WEBHOOK_CIRCUIT_RESET", default=60)
+# how many times to requeue a cache invalidation for the clients it could not be
+# delivered to, and the seconds to wait before the first, doubling each time
+WEBHOOK_TASK_RETRIES = env.int("WEBHOOK_TASK_RETRIES", default=8)
+WEBHOOK_TASK_BACKOFF = env.float("WEBHOOK_TASK_BACKOFF", default=60)
+
+# bearer token cache
+# ------------------------------------------------------------------------------
+# seconds to cache access tokens in redis, set to 0 to disable the token cache
+OIDC_TOKEN_CACHE_TIMEOUT = env.int("OIDC_TOKEN_CACHE_TIMEOUT", default=300)
+# seconds each process keeps its own copy of a token in front of redis - this
+# bounds how long a revoked token may still be accepted by other processes
+OIDC_TOKEN_LOCAL_TIMEOUT = env.float("OIDC_TOKEN_LOCAL_TIMEOUT", default=5)
+# maximum number of tokens each process keeps
+OIDC_TOKEN_LOCAL_SIZE = env.int("OIDC_TOKEN_LOCAL_SIZE", default=1000)
 
 
 # rest framework
@@ -360,7 +411,7 @@ REST_FRAMEWORK = {
         "squarelet.oidc.authentication.OidcOauth2Authentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "squarelet.core.pagination.KeysetPagination",
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "PAGE_SIZE": 100,
 }
@@ -382,6 +433,36 @@ PRESSPASS_COOKIE_DOMAIN = env("PRESSPASS_COOKIE_DOMAIN", default="")
 STRIPE_PUB_KEYS = env.list("STRIPE_PUB_KEYS")
 STRIPE_SECRET_KEYS = env.list("STRIPE_SECRET_KEYS")
 STRIPE_WEBHOOK_SECRETS = env.list("STRIPE_WEBHOOK_SECRETS")
+# seconds to cache customers and subscriptions retrieved from stripe, shared
+# between all processes - set to 0 to disable
+STRIPE_CACHE_TIMEOUT = env.int("STRIPE_CACHE_TIMEOUT", default=60)
+# seconds to wait for a response from stripe
+STRIPE_TIMEOUT = env.int("STRIPE_TIMEOUT", default=30)
+# times to retry a failed call to stripe, where it is safe to do so
+STRIPE_MAX_RETRIES = env.int("STRIPE_MAX_RETRIES", default=2)
+# connections to stripe to keep open in each process
+STRIPE_POOL_SIZE = env.int("STRIPE_POOL_SIZE", default=10)
+# log a warning for calls to stripe which take longer than this many seconds
+STRIPE_SLOW_CALL = env.float("STRIPE_SLOW_CALL", default=2.0)
+# dotted path to a function called as (method, endpoint, status code, seconds)
+# after every call to stripe, to record metrics
+STRIPE_METRICS_HOOK = env("STRIPE_METRICS_HOOK", default="")
+# number of subscriptions to restore in each transaction
+RESTORE_CHUNK_SIZE = env.int("RESTORE_CHUNK_SIZE", default=500)
+# number of slots, at most 24, which subscription renewals are spread across
+# during the day - run assign_renewal_slots after changing this
+RESTORE_SLOTS = env.int("RESTORE_SLOTS", default=24)
+# seconds to keep product names retrieved from stripe in each process
+STRIPE_NAME_CACHE_TIMEOUT = env.int("STRIPE_NAME_CACHE_TIMEOUT", default=3600)
+# number of webhook events to claim at a time for processing
+STRIPE_EVENT_BATCH_SIZE = env.int("STRIPE_EVENT_BATCH_SIZE", default=100)
+# give up on a webhook event after it has failed this many times
+STRIPE_EVENT_MAX_ATTEMPTS = env.int("STRIPE_EVENT_MAX_ATTEMPTS", default=5)
+# seconds to wait before first retrying a failed webhook event, doubling each time
+STRIPE_EVENT_RETRY_DELAY = env.int("STRIPE_EVENT_RETRY_DELAY", default=60)
+# seconds a worker has to process the webhook events it claims, before they may
+# be claimed by another worker
+STRIPE_EVENT_LEASE = env.int("STRIPE_EVENT_LEASE", default=600)
 
 # mailgun
 # ------------------------------------------------------------------------------
@@ -62,3 +62,8 @@ EMAIL_PORT = 1025
 STRIPE_PUB_KEYS = ["pk_muckrock", "pk_presspass"]
 STRIPE_SECRET_KEYS = ["sk_muckrock", "sk_presspass"]
 STRIPE_WEBHOOK_SECRETS = [None, None]
+# Do not wait between webhook retries during tests
+WEBHOOK_BACKOFF = 0
+# Do not share stripe objects between tests
+STRIPE_CACHE_TIMEOUT = 0
+STRIPE_NAME_CACHE_TIMEOUT = 0
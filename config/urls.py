@@ -20,7 +20,7 @@ from squarelet.email_api.viewsets import (
     PressPassEmailAddressViewSet,
     PressPassEmailConfirmationUpdateView,
 )
-from squarelet.oidc.viewsets import ClientViewSet
+from squarelet.oidc.viewsets import ChangeViewSet, ClientViewSet
 from squarelet.organizations.viewsets import (
     ChargeViewSet,
     OrganizationViewSet,
@@ -59,6 +59,7 @@ router.register("users", UserViewSet)
 router.register("url_auth_tokens", UrlAuthTokenViewSet, base_name="url_auth_token")
 router.register("organizations", OrganizationViewSet)
 router.register("charges", ChargeViewSet)
+router.register("changes", ChangeViewSet, base_name="change")
 
 presspass_router = routers.DefaultRouter()
 presspass_router.register("clients", ClientViewSet)
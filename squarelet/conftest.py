@@ -47,3 +47,18 @@ def client():
 @pytest.fixture
 def entitlement():
     return EntitlementFactory()
+
+
+@pytest.fixture
+def subscription_with_card_factory():
+    """Create subscriptions for organizations with a card on file"""
+
+    def create_batch(size, **kwargs):
+        return SubscriptionFactory.create_batch(
+            size,
+            organization__customer__card_brand="Visa",
+            organization__customer__card_last4="4242",
+            **kwargs,
+        )
+
+    return create_batch
@@ -0,0 +1,22 @@
+# Django
+from django.conf import settings
+
+# Third Party
+import django_filters
+from rest_framework.exceptions import ValidationError
+
+
+class UUIDInFilter(django_filters.BaseInFilter, django_filters.UUIDFilter):
+    """Filter on a comma separated list of UUIDs, so clients may fetch many
+    objects in a single request
+
+    The number of UUIDs is capped at `settings.API_BULK_MAX_UUIDS`, which should
+    be no more than the page size, so that they are all returned in one page
+    """
+
+    def filter(self, qs, value):
+        if value and len(value) > settings.API_BULK_MAX_UUIDS:
+            raise ValidationError(
+                f"At most {settings.API_BULK_MAX_UUIDS} UUIDs may be requested at once"
+            )
+        return super().filter(qs, value)
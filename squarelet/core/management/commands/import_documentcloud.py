@@ -14,10 +14,7 @@ from dateutil.parser import parse
 from smart_open.smart_open_lib import smart_open
 
 # Squarelet
-from squarelet.oidc.middleware import (
-    delete_cache_invalidation_set,
-    init_cache_invalidation_set,
-)
+from squarelet.oidc.middleware import suppress_cache_invalidations
 from squarelet.organizations.models import Membership, Organization
 from squarelet.users.models import User
 from squarelet.users.serializers import UserWriteSerializer
@@ -47,38 +44,35 @@ class Command(BaseCommand):
         )
         with transaction.atomic():
             sid = transaction.savepoint()
-            # we initialize the cache invalidation set here in order to
-            # not send a cache invalidation for users and orgs during the
+            # we do not send cache invalidations for users and orgs during the
             # import
-            init_cache_invalidation_set()
-            organization, created = self.import_org()
-            self.import_users(organization)
-
-            if created:
-                organization.set_receipt_emails(
-                    [
-                        u.email
-                        for u in organization.users.filter(memberships__admin=True)
-                    ]
-                )
-            if organization.user_count() > organization.max_users:
-                if not organization.plan or organization.plan.free:
-                    organization.max_users = organization.user_count()
-                    organization.save()
-                else:
-                    self.stdout.write(
-                        f"WARNING: Organization {organization.name} "
-                        f"({organization.pk}) has {organization.user_count()} users, "
-                        f"but max users is {organization.max_users} with plan "
-                        f"{organization.plan}"
-                    )
-            # we do not send the batched invalidations, but just delete them
-            delete_cache_invalidation_set()
+            with suppress_cache_invalidations():
+                self.import_all()
 
             if dry_run:
                 self.stdout.write("Dry run, not commiting changes")
                 transaction.savepoint_rollback(sid)
 
+    def import_all(self):
+        organization, created = self.import_org()
+        self.import_users(organization)
+
+        if created:
+            organization.set_receipt_emails(
+                [u.email for u in organization.users.filter(memberships__admin=True)]
+            )
+        if organization.user_count() > organization.max_users:
+            if not organization.plan or organization.plan.free:
+                organization.max_users = organization.user_count()
+                organization.save()
+            else:
+                self.stdout.write(
+                    f"WARNING: Organization {organization.name} "
+                    f"({organization.pk}) has {organization.user_count()} users, "
+                    f"but max users is {organization.max_users} with plan "
+                    f"{organization.plan}"
+                )
+
     def import_org(self):
         self.stdout.write("Begin Organization Import {}".format(timezone.now()))
         with smart_open(
@@ -14,6 +14,7 @@ from dateutil.parser import parse
 from smart_open.smart_open_lib import smart_open
 
 # Squarelet
+from squarelet.oidc.middleware import batch_cache_invalidations
 from squarelet.organizations.models import Membership, Organization, Plan
 from squarelet.users.models import User
 
@@ -33,14 +34,15 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         # pylint: disable=unused-argument
-        if kwargs["date_joined"]:
-            with transaction.atomic():
-                self.import_date_joined()
-        else:
-            with transaction.atomic():
-                self.import_orgs()
-                self.import_users()
-                self.import_members()
+        with batch_cache_invalidations():
+            if kwargs["date_joined"]:
+                with transaction.atomic():
+                    self.import_date_joined()
+            else:
+                with transaction.atomic():
+                    self.import_orgs()
+                    self.import_users()
+                    self.import_members()
 
     def import_users(self):
         print("Begin User Import {}".format(timezone.now()))
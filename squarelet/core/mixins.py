@@ -1,7 +1,11 @@
 # Django
 from django.conf import settings
+from django.db import models
 from django.urls import reverse
 
+# Standard Library
+from copy import deepcopy
+
 
 class AvatarMixin(object):
     """Mixin for models with an avatar"""
@@ -24,3 +28,67 @@ class AdminLinkMixin(object):
                 args=(self.object.pk,),
             )
         return context
+
+
+class ChangeTrackingMixin(object):
+    """Mixin for models which need to know which fields have been changed since
+    they were loaded from or last saved to the database
+
+    Side effects of saving can then depend on the fields which matter to them.
+    By convention, a model's `client_fields` are the fields which are sent to
+    client sites, so the clients must be told when any of them change.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.reset_changed_fields()
+        return instance
+
+    def _tracked_value(self, field):
+        value = self.__dict__[field.attname]
+        if isinstance(field, models.FileField):
+            # compare files by name
+            return getattr(value, "name", value)
+        if isinstance(value, (dict, list)):
+            return deepcopy(value)
+        return value
+
+    def reset_changed_fields(self, fields=None):
+        """Mark all of the given fields, or all fields, as unchanged"""
+        if not hasattr(self, "_loaded_values"):
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            # deferred fields are not loaded
+            if field.attname in self.__dict__ and (
+                fields is None or field.name in fields or field.attname in fields
+            ):
+                self._loaded_values[field.attname] = self._tracked_value(field)
+
+    @property
+    def changed_fields(self):
+        """The names of the fields which have changed - every field for an object
+        which has not been saved yet"""
+        if self._state.adding or not hasattr(self, "_loaded_values"):
+            return {field.name for field in self._meta.concrete_fields}
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and (
+                field.attname not in self._loaded_values
+                or self._loaded_values[field.attname] != self._tracked_value(field)
+            )
+        }
+
+    def has_changed(self, *fields):
+        """Have any of the given fields changed?"""
+        return not self.changed_fields.isdisjoint(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.reset_changed_fields(kwargs.get("update_fields"))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self.reset_changed_fields(fields)
@@ -1,7 +1,7 @@
 """Misc database utilities"""
 
 # Django
-from django.db.models import Func
+from django.db.models import BigIntegerField, Func
 from django.db.models.expressions import Value
 
 
@@ -14,3 +14,13 @@ class Interval(Func):
 
     def __init__(self, expression, **extra):
         super().__init__(Value(expression), **extra)
+
+
+class TxidCurrent(Func):
+    """The ID of the current PostgreSQL transaction, assigning one if needed"""
+
+    # pylint: disable=abstract-method
+
+    function = "txid_current"
+    template = "%(function)s()"
+    output_field = BigIntegerField()
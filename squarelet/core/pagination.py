@@ -0,0 +1,105 @@
+# Django
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Standard Library
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+
+# Third Party
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, values):
+    """Filter for the rows after `values` in `ordering`
+
+    The first field is compared with both >= and >, so the database can use an
+    index on the ordering to find the start of the page
+    """
+    field, *ordering = ordering
+    value, *values = values
+    name = field.lstrip("-")
+    after = "lt" if field.startswith("-") else "gt"
+    if not ordering:
+        return Q(**{f"{name}__{after}": value})
+    return Q(**{f"{name}__{after}e": value}) & (
+        Q(**{f"{name}__{after}": value}) | keyset_filter(ordering, values)
+    )
+
+
+class KeysetPagination(PageNumberPagination):
+    """Page number pagination, with keyset pagination available for clients which
+    need to page through every object
+
+    Passing the `cursor` parameter, empty for the first page, switches to keyset
+    pagination, ordered by the view's `cursor_ordering`.  Each page then starts
+    directly after the last object of the previous one, instead of counting and
+    skipping over all of the objects before it.  The ordering must be unique, so
+    it should end with the primary key, and should be indexed.
+    """
+
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_ordering = getattr(view, "cursor_ordering", None)
+        if self.cursor_ordering is None or (
+            self.cursor_query_param not in request.query_params
+        ):
+            self.cursor_ordering = None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.cursor_ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            try:
+                queryset = queryset.filter(
+                    keyset_filter(self.cursor_ordering, self.decode_cursor(cursor))
+                )
+            except (ValidationError, ValueError):
+                raise NotFound("Invalid cursor")
+        # fetch one extra object to know if there is a next page
+        page = list(queryset[: page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if self.cursor_ordering is None:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+    def get_next_link(self):
+        if self.cursor_ordering is None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip("-")) for field in self.cursor_ordering]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(values),
+        )
+
+    def encode_cursor(self, values):
+        # values such as dates and UUIDs are stored as strings, which the
+        # database converts back when filtering
+        return b64encode(json.dumps(values, default=str).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(b64decode(cursor.encode()).decode())
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(values, list) or len(values) != len(self.cursor_ordering):
+            raise NotFound("Invalid cursor")
+        return values
@@ -1,6 +1,15 @@
+# Django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
 # Standard Library
 import json
 import os.path
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
 
 
 def mixpanel_event(request, event, props=None, **kwargs):
@@ -34,3 +43,107 @@ def file_path(base, _instance, filename):
         # directory, the file extensions, plus one for the '/'
         file_base = file_base[: path_limit - (len(base) + len(file_ext) + 1)]
         return os.path.join(base, f"{file_base}{file_ext}")
+
+
+def clone(obj, count, overrides):
+    """Insert `count` copies of `obj` with one query, for seeding benchmarks
+
+    The columns in `overrides` are set to SQL expressions of the copy's number,
+    `n`, which runs from 1 to `count` - any % in them must be escaped as %%
+    """
+    # pylint: disable=protected-access
+    meta = obj._meta
+    quote_name = connection.ops.quote_name
+    columns = [f.column for f in meta.concrete_fields if not f.primary_key]
+    values = [overrides.get(c, f"template.{quote_name(c)}") for c in columns]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote_name(meta.db_table)} "
+            f"({', '.join(quote_name(c) for c in columns)}) "
+            f"SELECT {', '.join(values)} "
+            f"FROM {quote_name(meta.db_table)} AS template, generate_series(1, %s) n "
+            f"WHERE template.{quote_name(meta.pk.column)} = %s",
+            [count, obj.pk],
+        )
+
+
+def seed_users(users, organizations=None, organization_overrides=None):
+    """Seed `users` users named benchmark-n, each with their own individual
+    organization, for benchmarks
+
+    If more `organizations` are given, the extra ones are seeded after the
+    individual organizations.  `organization_overrides` are passed to `clone`
+    for the organizations.
+    """
+    template = get_user_model().objects.create_user(
+        "benchmark", "benchmark@example.com"
+    )
+    uuid = "md5('benchmark-' || n)::uuid"
+    name = "'benchmark-' || n"
+    clone(
+        template.individual_organization,
+        organizations or users,
+        {"uuid": uuid, "name": name, "slug": name, **(organization_overrides or {})},
+    )
+    clone(
+        template,
+        users,
+        {
+            "individual_organization_id": uuid,
+            "username": name,
+            "email": "'benchmark-' || n || '@example.com'",
+            "last_login": "now() - n %% 30 * interval '1 day'",
+            "is_agency": "n %% 100 = 0",
+        },
+    )
+
+
+def insert_memberships(select, params):
+    """Insert non-admin memberships for seeding benchmarks, with one query
+
+    `select` is a SELECT statement returning the user and organization IDs
+    """
+    meta = apps.get_model("organizations", "Membership")._meta
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote_name(meta.db_table)} "
+            f"({quote_name(meta.get_field('user').column)}, "
+            f"{quote_name(meta.get_field('organization').column)}, "
+            f"{quote_name(meta.get_field('admin').column)}) "
+            f"SELECT seed.*, false FROM ({select}) seed",
+            params,
+        )
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction which is always rolled back, so benchmarks
+    may seed and change data without keeping it"""
+    with transaction.atomic():
+        try:
+            yield
+        finally:
+            transaction.set_rollback(True)
+
+
+@contextmanager
+def seeding(stdout):
+    """Time seeding the database for a benchmark, and update the statistics the
+    query planner uses once it is done"""
+    start = time.perf_counter()
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    stdout.write(f"seeded in {time.perf_counter() - start:.1f}s")
+
+
+@contextmanager
+def measure():
+    """Measure the time taken, in seconds, and the queries made by the block"""
+    result = SimpleNamespace(elapsed=0, queries=0)
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        yield result
+        result.elapsed = time.perf_counter() - start
+    result.queries = len(context)
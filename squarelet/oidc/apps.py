@@ -5,3 +5,7 @@ from django.apps import AppConfig
 class OidcConfig(AppConfig):
     name = "squarelet.oidc"
     verbose_name = "OpenID Connect"
+
+    def ready(self):
+        # pylint: disable=unused-variable
+        from . import signals
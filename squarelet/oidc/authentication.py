@@ -1,8 +1,13 @@
+# Django
+from django.utils.functional import SimpleLazyObject
+
 # Third Party
 from oidc_provider.lib.utils.oauth2 import extract_access_token
-from oidc_provider.models import Token
 from rest_framework import authentication, exceptions
 
+# Squarelet
+from squarelet.oidc.tokens import get_token
+
 
 class OidcOauth2Authentication(authentication.BaseAuthentication):
     """Authentcation backend for django rest framework for checking against OIDC
@@ -15,12 +20,17 @@ class OidcOauth2Authentication(authentication.BaseAuthentication):
             # not this kind of auth
             return None
 
-        try:
-            oauth2_token = Token.objects.get(access_token=access_token)
-        except Token.DoesNotExist:
+        oauth2_token = get_token(access_token)
+        if oauth2_token is None:
             raise exceptions.AuthenticationFailed("The oauth2 token is invalid")
 
         if oauth2_token.has_expired():
             raise exceptions.AuthenticationFailed("The oauth2 token has expired")
 
-        return oauth2_token.user, oauth2_token
+        # many API clients authenticate as themselves and never look at the user,
+        # so only load it from the database if it is used
+        if oauth2_token.user_id is None:
+            user = None
+        else:
+            user = SimpleLazyObject(lambda: oauth2_token.user)
+        return user, oauth2_token
@@ -0,0 +1,60 @@
+"""A cache of the OIDC claims for each user
+
+Building the claims for the userinfo and token endpoints touches the user, their
+email addresses, every organization they belong to, its plan and entitlements and
+Stripe.  The result is cached per user, and each client's organizations are
+cached alongside it.
+
+All of a user's claims are cached under a version token, and a cache
+invalidation for the user or one of their organizations removes the token.
+Changes to a plan or entitlement send invalidations for the organizations
+subscribed to it.  The
+next request starts a new version, so claims which were built before the
+invalidation, but stored after it, are never read.
+"""
+
+# Django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+# Standard Library
+from uuid import uuid4
+
+# bump this whenever the contents of the bundle change
+CLAIMS_VERSION = 1
+
+
+def claims_version_key(uuid):
+    return f"oidc:claims:v{CLAIMS_VERSION}:version:{uuid}"
+
+
+def claims_version(uuid):
+    """The version token the user's claims are currently cached under"""
+    key = claims_version_key(uuid)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        # the token outlives the claims cached under it, so they are not rebuilt
+        # early, but still expires for users who are not seen again
+        if not cache.add(key, version, 2 * settings.OIDC_CLAIMS_CACHE_TIMEOUT):
+            # another request started a version first - if it has already been
+            # invalidated again, our own version is never stored or read
+            version = cache.get(key) or version
+    return version
+
+
+def claims_cache_key(uuid, version, part="user"):
+    return f"oidc:claims:v{CLAIMS_VERSION}:{uuid}:{version}:{part}"
+
+
+def invalidate_claims(model, uuids):
+    """Remove the cached claims for the given users or the members of the given
+    organizations"""
+    if model == "organization":
+        uuids = (
+            get_user_model()
+            .objects.filter(organizations__uuid__in=uuids)
+            .values_list("individual_organization_id", flat=True)
+        )
+    cache.delete_many([claims_version_key(uuid) for uuid in uuids])
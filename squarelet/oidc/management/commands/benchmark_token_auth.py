@@ -0,0 +1,65 @@
+# Django
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+
+# Standard Library
+from datetime import timedelta
+from uuid import uuid4
+
+# Third Party
+from oidc_provider.models import Client, Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+# Squarelet
+from squarelet.core.utils import measure, rolled_back
+from squarelet.oidc.authentication import OidcOauth2Authentication
+from squarelet.oidc.permissions import ScopePermission
+from squarelet.oidc.tokens import local_cache
+
+
+class Command(BaseCommand):
+    """Compare the database queries and time needed to authenticate API requests
+    with and without the token cache"""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=1000, help="Number of requests to time"
+        )
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        with rolled_back():
+            token = Token.objects.create(
+                client=Client.objects.create(name="Benchmark", client_id=uuid4().hex),
+                expires_at=timezone.now() + timedelta(hours=1),
+                access_token=uuid4().hex,
+                refresh_token=uuid4().hex,
+                _scope="read_user read_organization",
+            )
+            for name, timeout in (("uncached", 0), ("cached", 300)):
+                with override_settings(OIDC_TOKEN_CACHE_TIMEOUT=timeout):
+                    local_cache.clear()
+                    self.benchmark(name, token, kwargs["requests"])
+
+    def benchmark(self, name, token, requests):
+        factory = APIRequestFactory()
+        authentication = OidcOauth2Authentication()
+        permission = ScopePermission()
+        view = type("View", (), {"scopes": ("read_user",)})()
+        with measure() as result:
+            for _ in range(requests):
+                request = Request(
+                    factory.get(
+                        "/api/users/", HTTP_AUTHORIZATION=f"Bearer {token.access_token}"
+                    )
+                )
+                request.user, request.auth = authentication.authenticate(request)
+                permission.has_permission(request, view)
+        self.stdout.write(
+            f"{name}: {result.queries / requests:.3f} queries/request, "
+            f"{result.elapsed / requests * 1000:.3f} ms/request"
+        )
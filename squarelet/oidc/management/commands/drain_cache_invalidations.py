@@ -0,0 +1,39 @@
+# Django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Standard Library
+import time
+
+# Squarelet
+from squarelet.oidc.utils import drain_cache_invalidations
+
+
+class Command(BaseCommand):
+    """Continuously send coalesced cache invalidations from the outbox"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--window",
+            type=float,
+            default=settings.CACHE_INVALIDATION_WINDOW,
+            help="Seconds to coalesce cache invalidations for between sends",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the outbox once and exit"
+        )
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        while True:
+            start = time.monotonic()
+            total = 0
+            count = drain_cache_invalidations()
+            while count:
+                total += count
+                count = drain_cache_invalidations()
+            if total:
+                self.stdout.write(f"Sent {total} cache invalidations")
+            if kwargs["once"]:
+                return
+            time.sleep(max(kwargs["window"] - (time.monotonic() - start), 0))
@@ -1,11 +1,17 @@
 """Middleware for the OIDC app"""
 
+# Django
+from django.conf import settings
+from django.db import transaction
+
 # Standard Library
 import threading
 from collections import defaultdict
+from contextlib import contextmanager
 
 # Squarelet
-from squarelet.oidc import utils
+from squarelet.oidc import claims, utils
+from squarelet.oidc.models import CacheInvalidation, Change
 
 CACHE_INVALIDATION_SET = threading.local()
 
@@ -33,17 +39,73 @@ class CacheInvalidationSenderMiddleware:
 
 
 def send_cache_invalidations(model, uuids):
-    """Set a cache invalidation to be sent at the end of the request"""
+    """Set a cache invalidation to be sent at the end of the request
+
+    This should be called from inside of the transaction making the change
+    """
     if not isinstance(uuids, list):
         uuids = [uuids]
-    if hasattr(CACHE_INVALIDATION_SET, "set"):
+    # our own cached claims must be cleared even if the clients are not notified
+    transaction.on_commit(lambda: claims.invalidate_claims(model, uuids))
+    # the change feed records every change, including those clients are not
+    # notified of
+    Change.objects.bulk_create([Change(model=model, uuid=uuid) for uuid in uuids])
+    if getattr(CACHE_INVALIDATION_SET, "suppressed", False):
+        return
+    if settings.CACHE_INVALIDATION_OUTBOX:
+        # write to the outbox as part of the current transaction - the drainer
+        # will coalesce these across all requests and tasks and send them
+        written = outbox_written()
+        if written is not None:
+            uuids = [uuid for uuid in uuids if str(uuid) not in written[model]]
+            written[model].update(str(uuid) for uuid in uuids)
+        CacheInvalidation.objects.bulk_create(
+            [CacheInvalidation(model=model, uuid=uuid) for uuid in uuids]
+        )
+    elif hasattr(CACHE_INVALIDATION_SET, "set"):
         for uuid in uuids:
             CACHE_INVALIDATION_SET.set[model].add(uuid)
     else:
         # if there is no set, we are not in a request-response cycle
         # (ie celery or the REPL) and we have not manually initalized a batch set
-        # just send immediately
-        utils.send_cache_invalidations(model, uuids)
+        # send as soon as the current transaction commits
+        transaction.on_commit(lambda: utils.send_cache_invalidations(model, uuids))
+
+
+def outbox_written():
+    """The invalidations the current batch has written to the outbox in the
+    current transaction, or None if there is no batch or transaction
+
+    Rows written in the same transaction, and savepoint, are committed or
+    rolled back together, so there is no need to write the same one twice.
+    Once the transaction ends the drainer may already have sent them, so later
+    changes write their own rows.
+    """
+    connection = transaction.get_connection()
+    if not hasattr(CACHE_INVALIDATION_SET, "set") or not connection.in_atomic_block:
+        return None
+    outbox = getattr(CACHE_INVALIDATION_SET, "outbox", None)
+    savepoints = list(connection.savepoint_ids)
+    # the outbox's on commit callback is discarded if its transaction or
+    # savepoint is rolled back, and it is cleared if the transaction commits
+    if (
+        outbox is None
+        or outbox.savepoints != savepoints
+        or not any(func is outbox.reset for _sids, func in connection.run_on_commit)
+    ):
+        outbox = CACHE_INVALIDATION_SET.outbox = OutboxWritten(savepoints)
+        transaction.on_commit(outbox.reset)
+    return outbox
+
+
+class OutboxWritten(defaultdict):
+    """The UUIDs written to the outbox for each model in one savepoint"""
+
+    def __init__(self, savepoints):
+        super().__init__(set)
+        self.savepoints = savepoints
+        # kept so the same callback can be found in the on commit callbacks
+        self.reset = self.clear
 
 
 # these are pulled out to allow manually batching cache invalidations in
@@ -61,3 +123,35 @@ def send_cache_invalidation_set():
 
 def delete_cache_invalidation_set():
     del CACHE_INVALIDATION_SET.set
+    if hasattr(CACHE_INVALIDATION_SET, "outbox"):
+        del CACHE_INVALIDATION_SET.outbox
+
+
+@contextmanager
+def batch_cache_invalidations():
+    """Batch cache invalidations the same way as the middleware, for use in
+    management commands and other code outside of the request-response cycle.
+    The invalidations are only sent if the block finishes without an exception.
+    If a batch is already in progress, this joins it.
+    """
+    if hasattr(CACHE_INVALIDATION_SET, "set"):
+        yield
+        return
+
+    init_cache_invalidation_set()
+    try:
+        yield
+        send_cache_invalidation_set()
+    finally:
+        delete_cache_invalidation_set()
+
+
+@contextmanager
+def suppress_cache_invalidations():
+    """Do not send any cache invalidations for changes made inside the block"""
+    suppressed = getattr(CACHE_INVALIDATION_SET, "suppressed", False)
+    CACHE_INVALIDATION_SET.suppressed = True
+    try:
+        yield
+    finally:
+        CACHE_INVALIDATION_SET.suppressed = suppressed
@@ -0,0 +1,27 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+import squarelet.core.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oidc', '0004_auto_20200407_1248'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheInvalidation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('user', 'User'), ('organization', 'Organization')], help_text='The type of object which should be invalidated', max_length=12, verbose_name='model')),
+                ('uuid', models.UUIDField(help_text='The UUID of the object which should be invalidated', verbose_name='UUID')),
+                ('created_at', squarelet.core.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, help_text='When this cache invalidation was queued', verbose_name='created at')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oidc', '0005_cacheinvalidation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientprofile',
+            name='compress_webhooks',
+            field=models.BooleanField(default=False, help_text='Send cache invalidations to this client as gzip compressed JSON instead of form encoded data', verbose_name='compress webhooks'),
+        ),
+    ]
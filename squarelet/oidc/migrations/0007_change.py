@@ -0,0 +1,27 @@
+# Generated by Django 2.1.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.utils.timezone
+import squarelet.core.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oidc', '0006_clientprofile_compress_webhooks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('user', 'User'), ('organization', 'Organization')], help_text='The type of object which changed', max_length=12, verbose_name='model')),
+                ('uuid', models.UUIDField(help_text='The UUID of the object which changed', verbose_name='UUID')),
+                ('created_at', squarelet.core.fields.AutoCreatedField(db_index=True, default=django.utils.timezone.now, editable=False, help_text='When this change was made', verbose_name='created at')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+    ]
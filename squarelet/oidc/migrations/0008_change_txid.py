@@ -0,0 +1,33 @@
+# Generated by Django 2.1.7 on 2026-10-18 21:05
+
+from django.db import migrations, models
+import squarelet.core.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oidc', '0007_change'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='change',
+            options={'ordering': ('txid', 'pk')},
+        ),
+        migrations.AddField(
+            model_name='change',
+            name='txid',
+            field=models.BigIntegerField(default=0, help_text='The ID of the database transaction which made this change', verbose_name='transaction ID'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='change',
+            name='txid',
+            field=models.BigIntegerField(default=squarelet.core.models.TxidCurrent, help_text='The ID of the database transaction which made this change', verbose_name='transaction ID'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['txid', 'id'], name='oidc_change_txid_idx'),
+        ),
+    ]
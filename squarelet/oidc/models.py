@@ -4,13 +4,10 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-# Standard Library
-import hashlib
-import hmac
-import time
-
-# Third Party
-import requests
+# Squarelet
+from squarelet.core.fields import AutoCreatedField
+from squarelet.core.models import TxidCurrent
+from squarelet.oidc import webhooks
 
 
 class ClientProfile(models.Model):
@@ -34,22 +31,102 @@ class ClientProfile(models.Model):
         default="muckrock",
         help_text=_("Which application did this client originate from?"),
     )
+    compress_webhooks = models.BooleanField(
+        _("compress webhooks"),
+        default=False,
+        help_text=_(
+            "Send cache invalidations to this client as gzip compressed JSON "
+            "instead of form encoded data"
+        ),
+    )
 
     def __str__(self):
         return str(self.client)
 
+    @property
+    def webhook_target(self):
+        """The information needed to send webhooks to this client"""
+        return webhooks.WebhookTarget(
+            pk=self.pk,
+            name=str(self),
+            url=self.webhook_url,
+            secret=self.client.client_secret,
+            compress=self.compress_webhooks,
+        )
+
+    def cache_invalidation_data(self, model, uuids):
+        """The signed webhook payload for a cache invalidation"""
+        return self.webhook_target.cache_invalidation_data(model, uuids)
+
+    def cache_invalidation_requests(self, model, uuids):
+        """Keyword arguments for each request needed to send a cache invalidation"""
+        return self.webhook_target.cache_invalidation_requests(model, uuids)
+
     def send_cache_invalidation(self, model, uuids):
         """Send a cache invalidation to this client"""
-        timestamp = int(time.time())
-        signature = hmac.new(
-            key=self.client.client_secret.encode("utf8"),
-            msg="{}{}{}".format(timestamp, model, "".join(uuids)).encode("utf8"),
-            digestmod=hashlib.sha256,
-        ).hexdigest()
-        data = {
-            "type": model,
-            "uuids": uuids,
-            "timestamp": timestamp,
-            "signature": signature,
-        }
-        requests.post(self.webhook_url, data=data)
+        for kwargs in self.cache_invalidation_requests(model, uuids):
+            webhooks.deliver(str(self), self.webhook_url, **kwargs)
+
+
+class CacheInvalidation(models.Model):
+    """An outbox of cache invalidations waiting to be sent to the clients
+
+    These are written in the same transaction as the change which caused them,
+    and are coalesced and sent out by the drainer
+    """
+
+    model = models.CharField(
+        _("model"),
+        max_length=12,
+        choices=(("user", _("User")), ("organization", _("Organization"))),
+        help_text=_("The type of object which should be invalidated"),
+    )
+    uuid = models.UUIDField(
+        _("UUID"), help_text=_("The UUID of the object which should be invalidated")
+    )
+    created_at = AutoCreatedField(
+        _("created at"), help_text=_("When this cache invalidation was queued")
+    )
+
+    class Meta:
+        ordering = ("pk",)
+
+    def __str__(self):
+        return f"Cache Invalidation: {self.model} {self.uuid}"
+
+
+class Change(models.Model):
+    """A change to a user or organization, for the change feed
+
+    These are written in the same transaction as the change which caused them,
+    along with its cache invalidation, so clients which miss an invalidation can
+    catch up by reading the changes since the last one they saw.  They are read
+    in order of the transaction which wrote them, as IDs are assigned before a
+    transaction commits, and so are not in commit order.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(
+        _("model"),
+        max_length=12,
+        choices=(("user", _("User")), ("organization", _("Organization"))),
+        help_text=_("The type of object which changed"),
+    )
+    uuid = models.UUIDField(
+        _("UUID"), help_text=_("The UUID of the object which changed")
+    )
+    txid = models.BigIntegerField(
+        _("transaction ID"),
+        default=TxidCurrent,
+        help_text=_("The ID of the database transaction which made this change"),
+    )
+    created_at = AutoCreatedField(
+        _("created at"), db_index=True, help_text=_("When this change was made")
+    )
+
+    class Meta:
+        ordering = ("txid", "pk")
+        indexes = [models.Index(fields=["txid", "id"], name="oidc_change_txid_idx")]
+
+    def __str__(self):
+        return f"Change: {self.model} {self.uuid}"
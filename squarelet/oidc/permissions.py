@@ -12,7 +12,9 @@ class ScopePermission(permissions.BasePermission):
         if not hasattr(request, "auth") or not request.auth:
             return False
 
-        auth_scopes = set(request.auth.scope)
+        auth_scopes = request.auth.scope
+        if not isinstance(auth_scopes, frozenset):
+            auth_scopes = set(auth_scopes)
 
         if request.method in permissions.SAFE_METHODS:
             return read_scopes and read_scopes <= auth_scopes
@@ -0,0 +1,77 @@
+# Django
+from celery import states
+from celery.signals import task_postrun, task_prerun
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# Third Party
+from oidc_provider.models import Client, Token
+
+# Squarelet
+from squarelet.oidc.middleware import (
+    CACHE_INVALIDATION_SET,
+    delete_cache_invalidation_set,
+    init_cache_invalidation_set,
+    send_cache_invalidation_set,
+)
+from squarelet.oidc.models import ClientProfile
+from squarelet.oidc.targets import invalidate_webhook_targets
+from squarelet.oidc.tokens import invalidate_token
+
+
+@task_prerun.connect(
+    dispatch_uid="squarelet.oidc.signals.init_task_cache_invalidations"
+)
+def init_task_cache_invalidations(task_id, **kwargs):
+    """Batch cache invalidations for the duration of each celery task"""
+    # pylint: disable=unused-argument
+    # do not take over a batch which is already in progress, such as an eager
+    # task being run from inside of a request
+    if not hasattr(CACHE_INVALIDATION_SET, "set"):
+        init_cache_invalidation_set()
+        CACHE_INVALIDATION_SET.task_id = task_id
+
+
+@task_postrun.connect(
+    dispatch_uid="squarelet.oidc.signals.send_task_cache_invalidations"
+)
+def send_task_cache_invalidations(task_id, state, **kwargs):
+    """Send the task's cache invalidations if it succeeded"""
+    # pylint: disable=unused-argument
+    if getattr(CACHE_INVALIDATION_SET, "task_id", None) != task_id:
+        return
+    try:
+        if state == states.SUCCESS:
+            send_cache_invalidation_set()
+    finally:
+        delete_cache_invalidation_set()
+        del CACHE_INVALIDATION_SET.task_id
+
+
+@receiver(
+    [post_save, post_delete],
+    sender=ClientProfile,
+    dispatch_uid="squarelet.oidc.signals.client_profile_changed",
+)
+@receiver(
+    [post_save, post_delete],
+    sender=Client,
+    dispatch_uid="squarelet.oidc.signals.client_changed",
+)
+def client_changed(**kwargs):
+    """Reload the webhook targets once a client change has been committed"""
+    # pylint: disable=unused-argument
+    transaction.on_commit(invalidate_webhook_targets)
+
+
+@receiver(
+    [post_save, post_delete],
+    sender=Token,
+    dispatch_uid="squarelet.oidc.signals.token_changed",
+)
+def token_changed(instance, **kwargs):
+    """Remove revoked or changed tokens from the token cache"""
+    # pylint: disable=unused-argument
+    access_token = instance.access_token
+    transaction.on_commit(lambda: invalidate_token(access_token))
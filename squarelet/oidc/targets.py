@@ -0,0 +1,54 @@
+"""An in-process cache of the clients which should receive webhooks
+
+The list of clients with a webhook URL almost never changes, but it is needed
+every time a user or organization changes.  Each process keeps its own copy,
+tagged with a version number kept in the shared cache.  Saving or deleting a
+client bumps the version, which causes every process to reload on its next use.
+"""
+
+# Django
+from django.core.cache import cache
+
+# Standard Library
+import threading
+from uuid import uuid4
+
+# Local
+from .models import ClientProfile
+
+VERSION_KEY = "oidc:webhook_targets:version"
+
+_lock = threading.Lock()
+_local = {"version": None, "targets": None}
+
+
+def _current_version():
+    # if the version has been evicted from the cache, start a new one, so any
+    # process holding an old copy will reload
+    return cache.get_or_set(VERSION_KEY, lambda: uuid4().hex, timeout=None)
+
+
+def get_webhook_targets():
+    """All clients which should receive webhooks, as a tuple of WebhookTargets"""
+    version = _current_version()
+    with _lock:
+        if _local["version"] == version:
+            return _local["targets"]
+    targets = tuple(
+        client_profile.webhook_target
+        for client_profile in ClientProfile.objects.exclude(webhook_url="")
+        .select_related("client")
+        .order_by("pk")
+    )
+    with _lock:
+        _local["version"] = version
+        _local["targets"] = targets
+    return targets
+
+
+def invalidate_webhook_targets():
+    """Force all processes to reload the webhook targets"""
+    with _lock:
+        _local["version"] = None
+        _local["targets"] = None
+    cache.set(VERSION_KEY, uuid4().hex, timeout=None)
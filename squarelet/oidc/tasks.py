@@ -1,11 +1,86 @@
 # Django
-from celery.task import task
+from celery.exceptions import MaxRetriesExceededError
+from celery.schedules import crontab
+from celery.task import periodic_task, task
+from django.conf import settings
+from django.utils import timezone
+
+# Standard Library
+import logging
+from datetime import timedelta
 
 # Local
-from .models import ClientProfile
+from . import webhooks
+from .models import Change, ClientProfile
+from .targets import get_webhook_targets
+
+logger = logging.getLogger(__name__)
 
 
 @task(name="squarelet.oidc.tasks.send_cache_invalidation")
 def send_cache_invalidation(client_profile_pk, model, uuids):
     client_profile = ClientProfile.objects.get(pk=client_profile_pk)
     client_profile.send_cache_invalidation(model, uuids)
+
+
+@task(bind=True, name="squarelet.oidc.tasks.send_cache_invalidations")
+def send_cache_invalidations(self, model, uuids, targets=None):
+    """Send a cache invalidation to all clients concurrently
+
+    `targets` is the list of WebhookTargets to send to, serialized as lists.
+    It is looked up if it is not given, for messages queued before it was added.
+    Targets which could not be delivered to, including those whose circuit is
+    open, are retried later by this task with only the failed targets, as the
+    invalidation has already been removed from the outbox.
+    """
+    if targets is None:
+        targets = get_webhook_targets()
+    else:
+        targets = [webhooks.WebhookTarget(*target) for target in targets]
+    deliveries = [
+        (target, (target.name, target.url, kwargs))
+        for target in targets
+        for kwargs in target.cache_invalidation_requests(model, uuids)
+    ]
+    results = webhooks.deliver_all([delivery for _target, delivery in deliveries])
+    failed = []
+    for (target, _delivery), (_name, result) in zip(deliveries, results):
+        if isinstance(result, Exception) and target not in failed:
+            failed.append(target)
+    if failed:
+        try:
+            raise self.retry(
+                args=(model, uuids, failed),
+                countdown=settings.WEBHOOK_TASK_BACKOFF * 2 ** self.request.retries,
+                max_retries=settings.WEBHOOK_TASK_RETRIES,
+            )
+        except MaxRetriesExceededError:
+            logger.error(
+                "Giving up on cache invalidation for %s %s to: %s",
+                model,
+                uuids,
+                ", ".join(target.name for target in failed),
+            )
+
+
+@periodic_task(
+    run_every=crontab(minute="*"),
+    name="squarelet.oidc.tasks.drain_cache_invalidations",
+)
+def drain_cache_invalidations():
+    """Fallback drainer for the cache invalidation outbox, in case the
+    drain_cache_invalidations command is not running"""
+    # utils imports this module, so import it here to avoid a circular import
+    from squarelet.oidc.utils import drain_cache_invalidations as drain
+
+    while drain():
+        pass
+
+
+@periodic_task(
+    run_every=crontab(hour=3, minute=15), name="squarelet.oidc.tasks.prune_changes"
+)
+def prune_changes():
+    """Remove changes which are too old to be read from the change feed"""
+    cutoff = timezone.now() - timedelta(days=settings.CHANGE_FEED_RETENTION)
+    Change.objects.filter(created_at__lt=cutoff).delete()
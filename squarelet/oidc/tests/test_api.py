@@ -1,5 +1,11 @@
+# Django
+from django.db import connection, transaction
+from django.test import override_settings
+
 # Standard Library
 import json
+import threading
+from uuid import uuid4
 
 # Third Party
 import pytest
@@ -7,6 +13,7 @@ from oidc_provider.models import Client
 from rest_framework import status
 
 # Squarelet
+from squarelet.oidc.models import Change
 from squarelet.oidc.serializers import ClientSerializer
 from squarelet.oidc.tests.factories import ClientFactory
 
@@ -162,3 +169,89 @@ class TestClientAPI:
         api_client.force_authenticate(user=user)
         response = api_client.delete(f"/pp-api/clients/{client.pk}/")
         assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+# changes are only read from transactions which have finished, so the test's
+# own transaction must be committed
+@pytest.mark.django_db(transaction=True)
+class TestChangeAPI:
+    @override_settings(CHANGE_FEED_PAGE_SIZE=2)
+    def test_list(self, api_client, user_factory, mocker):
+        """Page through the changes since a cursor"""
+        mocker.patch(
+            "squarelet.organizations.models.Customer.stripe_customer",
+            default_source=None,
+        )
+        user = user_factory(is_staff=True)
+        api_client.force_authenticate(user=user)
+        users, organizations = set(), set()
+        since = 0
+        has_more = True
+        while has_more:
+            response = api_client.get(f"/api/changes/?since={since}")
+            assert response.status_code == status.HTTP_200_OK
+            response_json = json.loads(response.content)
+            users.update(u["uuid"] for u in response_json["users"])
+            organizations.update(o["uuid"] for o in response_json["organizations"])
+            since = response_json["cursor"]
+            has_more = response_json["has_more"]
+        assert str(user.uuid) in users
+        last = Change.objects.last()
+        assert since == f"{last.txid}.{last.pk}"
+
+        # nothing has changed since the last cursor
+        response = api_client.get(f"/api/changes/?since={since}")
+        response_json = json.loads(response.content)
+        assert response_json["cursor"] == since
+        assert response_json["users"] == []
+
+        deleted = uuid4()
+        Change.objects.create(model="organization", uuid=deleted)
+        response = api_client.get(f"/api/changes/?since={since}")
+        response_json = json.loads(response.content)
+        assert response_json["deleted"]["organizations"] == [str(deleted)]
+
+    def test_list_bad_since(self, api_client, user_factory):
+        """The cursor must be valid"""
+        api_client.force_authenticate(user=user_factory(is_staff=True))
+        response = api_client.get("/api/changes/?since=bad")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_list_open_transaction(self, api_client, user_factory):
+        """Changes are held back while an older transaction is still open, even
+        those from newer transactions which have committed"""
+        api_client.force_authenticate(user=user_factory(is_staff=True))
+        since = json.loads(api_client.get("/api/changes/").content)["cursor"]
+        opened, finish = threading.Event(), threading.Event()
+        older, newer = uuid4(), uuid4()
+
+        def open_transaction():
+            try:
+                with transaction.atomic():
+                    Change.objects.create(model="organization", uuid=older)
+                    opened.set()
+                    finish.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=open_transaction)
+        thread.start()
+        try:
+            assert opened.wait(10)
+            Change.objects.create(model="organization", uuid=newer)
+            response = api_client.get(f"/api/changes/?since={since}")
+            response_json = json.loads(response.content)
+            assert response_json["cursor"] == since
+            assert response_json["deleted"]["organizations"] == []
+        finally:
+            finish.set()
+            thread.join()
+
+        # once it commits, its change is read before the newer transaction's
+        with override_settings(CHANGE_FEED_PAGE_SIZE=1):
+            response = api_client.get(f"/api/changes/?since={since}")
+            response_json = json.loads(response.content)
+            assert response_json["deleted"]["organizations"] == [str(older)]
+            response = api_client.get(f"/api/changes/?since={response_json['cursor']}")
+            response_json = json.loads(response.content)
+            assert response_json["deleted"]["organizations"] == [str(newer)]
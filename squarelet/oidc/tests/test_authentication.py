@@ -0,0 +1,77 @@
+# Django
+from django.test import override_settings
+from django.utils import timezone
+
+# Standard Library
+from datetime import timedelta
+from uuid import uuid4
+
+# Third Party
+import pytest
+from oidc_provider.models import Token
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+# Squarelet
+from squarelet.oidc.authentication import OidcOauth2Authentication
+from squarelet.oidc.tests.factories import ClientFactory
+
+
+def make_token(user, expires_at=None):
+    return Token.objects.create(
+        client=ClientFactory(),
+        user=user,
+        expires_at=expires_at or timezone.now() + timedelta(hours=1),
+        access_token=uuid4().hex,
+        refresh_token=uuid4().hex,
+        _scope="read_user read_organization",
+    )
+
+
+def authenticate(token):
+    request = APIRequestFactory().get(
+        "/api/users/", HTTP_AUTHORIZATION=f"Bearer {token.access_token}"
+    )
+    return OidcOauth2Authentication().authenticate(Request(request))
+
+
+@pytest.mark.django_db(transaction=True)
+class TestOidcOauth2Authentication:
+    def test_authenticate(self, user_factory, django_assert_num_queries):
+        """Tokens are cached after the first request"""
+        user = user_factory()
+        token = make_token(user)
+        with django_assert_num_queries(1):
+            auth_user, auth = authenticate(token)
+        assert auth.scope == frozenset(["read_user", "read_organization"])
+        assert auth.client_id == token.client_id
+        with django_assert_num_queries(0):
+            auth_user, auth = authenticate(token)
+        # the user is only loaded when it is used
+        with django_assert_num_queries(1):
+            assert auth_user.pk == user.pk
+
+    @override_settings(OIDC_TOKEN_CACHE_TIMEOUT=0)
+    def test_authenticate_uncached(self, user_factory, django_assert_num_queries):
+        """The token cache may be disabled"""
+        token = make_token(user_factory())
+        authenticate(token)
+        with django_assert_num_queries(1):
+            authenticate(token)
+
+    def test_revoke(self, user_factory):
+        """Deleted tokens are removed from the cache"""
+        token = make_token(user_factory())
+        authenticate(token)
+        token.delete()
+        with pytest.raises(exceptions.AuthenticationFailed):
+            authenticate(token)
+
+    def test_expired(self, user_factory):
+        """Expired tokens are rejected"""
+        token = make_token(
+            user_factory(), expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        with pytest.raises(exceptions.AuthenticationFailed):
+            authenticate(token)
@@ -0,0 +1,56 @@
+# Django
+from django.test import override_settings
+
+# Standard Library
+import gzip
+import hashlib
+import hmac
+import json
+from uuid import uuid4
+
+# Squarelet
+from squarelet.oidc.models import ClientProfile
+from squarelet.oidc.tests.factories import ClientFactory
+
+
+class TestClientProfile:
+    """Unit tests for ClientProfile model"""
+
+    def test_cache_invalidation_data(self):
+        client_profile = ClientProfile(client=ClientFactory.build())
+        uuids = [str(uuid4()), str(uuid4())]
+        data = client_profile.cache_invalidation_data("user", uuids)
+        assert data["type"] == "user"
+        assert data["uuids"] == uuids
+        assert (
+            data["signature"]
+            == hmac.new(
+                key=client_profile.client.client_secret.encode("utf8"),
+                msg="{}user{}".format(data["timestamp"], "".join(uuids)).encode("utf8"),
+                digestmod=hashlib.sha256,
+            ).hexdigest()
+        )
+
+    @override_settings(CACHE_INVALIDATION_CHUNK_SIZE=2)
+    def test_cache_invalidation_requests_chunked(self):
+        """Large lists of UUIDs are split into separately signed chunks"""
+        client_profile = ClientProfile(client=ClientFactory.build())
+        uuids = [str(uuid4()) for _ in range(5)]
+        requests = client_profile.cache_invalidation_requests("user", uuids)
+        assert [r["data"]["uuids"] for r in requests] == [
+            uuids[0:2],
+            uuids[2:4],
+            uuids[4:5],
+        ]
+        assert len({r["data"]["signature"] for r in requests}) == 3
+
+    def test_cache_invalidation_requests_compressed(self):
+        """Clients may opt in to gzip compressed JSON"""
+        client_profile = ClientProfile(
+            client=ClientFactory.build(), compress_webhooks=True
+        )
+        uuids = [str(uuid4())]
+        (request,) = client_profile.cache_invalidation_requests("user", uuids)
+        assert request["headers"]["Content-Encoding"] == "gzip"
+        data = json.loads(gzip.decompress(request["data"]).decode("utf8"))
+        assert data["uuids"] == uuids
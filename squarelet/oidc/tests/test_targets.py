@@ -0,0 +1,78 @@
+# Django
+from celery.exceptions import Retry
+
+# Standard Library
+from unittest.mock import Mock
+from uuid import uuid4
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.oidc import tasks, webhooks
+from squarelet.oidc.models import ClientProfile
+from squarelet.oidc.targets import get_webhook_targets, invalidate_webhook_targets
+from squarelet.oidc.tests.factories import ClientFactory
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_webhook_targets(django_assert_num_queries):
+    """Webhook targets are cached until a client changes"""
+    invalidate_webhook_targets()
+    client_profile = ClientProfile.objects.create(
+        client=ClientFactory(), webhook_url="https://www.example.com/webhook/"
+    )
+    ClientProfile.objects.create(client=ClientFactory())
+
+    (target,) = get_webhook_targets()
+    assert target.pk == client_profile.pk
+    assert target.url == client_profile.webhook_url
+    assert target.secret == client_profile.client.client_secret
+    with django_assert_num_queries(0):
+        assert get_webhook_targets() == (target,)
+
+    client_profile.webhook_url = "https://www.example.com/new-webhook/"
+    client_profile.save()
+    (target,) = get_webhook_targets()
+    assert target.url == "https://www.example.com/new-webhook/"
+
+    client_profile.client.delete()
+    assert get_webhook_targets() == ()
+
+
+def test_send_cache_invalidations_targets(mocker):
+    """The task sends to the targets it is given without hitting the database"""
+    deliver_all = mocker.patch("squarelet.oidc.webhooks.deliver_all")
+    uuid = str(uuid4())
+    # targets arrive from celery as plain lists
+    tasks.send_cache_invalidations(
+        "user", [uuid], [[1, "Client", "https://www.example.com/", "secret", False]]
+    )
+    ((deliveries,), _kwargs) = deliver_all.call_args
+    ((name, url, kwargs),) = deliveries
+    assert name == "Client"
+    assert url == "https://www.example.com/"
+    assert kwargs["data"]["uuids"] == [uuid]
+
+
+def test_send_cache_invalidations_retry(mocker):
+    """Only the targets which failed are retried"""
+    targets = [
+        [1, "Up", "https://www.example.com/", "secret", False],
+        [2, "Down", "https://down.example.com/", "secret", False],
+    ]
+    mocker.patch(
+        "squarelet.oidc.webhooks.deliver_all",
+        return_value=[
+            ("Up", Mock(status_code=200)),
+            ("Down", webhooks.CircuitOpenError("down.example.com")),
+        ],
+    )
+    retry = mocker.patch.object(
+        tasks.send_cache_invalidations, "retry", side_effect=Retry()
+    )
+    uuid = str(uuid4())
+    with pytest.raises(Retry):
+        tasks.send_cache_invalidations("user", [uuid], targets)
+    _args, kwargs = retry.call_args
+    assert kwargs["args"] == ("user", [uuid], [webhooks.WebhookTarget(*targets[1])])
@@ -0,0 +1,137 @@
+# Django
+from django.db import transaction
+from django.test import override_settings
+
+# Standard Library
+from uuid import uuid4
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.oidc import middleware, signals, utils
+from squarelet.oidc.models import CacheInvalidation
+
+
+@pytest.mark.django_db()
+def test_send_cache_invalidations_outbox(mocker):
+    """Cache invalidations are written to the outbox instead of being sent"""
+    mocked = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    uuids = [uuid4(), uuid4()]
+    middleware.send_cache_invalidations("user", uuids)
+    assert set(
+        CacheInvalidation.objects.filter(model="user").values_list("uuid", flat=True)
+    ) == set(uuids)
+    mocked.assert_not_called()
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(CACHE_INVALIDATION_OUTBOX=False)
+def test_send_cache_invalidations_no_outbox(mocker):
+    """Without the outbox cache invalidations are sent immediately"""
+    mocked = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    uuid = uuid4()
+    middleware.send_cache_invalidations("user", uuid)
+    assert not CacheInvalidation.objects.exists()
+    mocked.assert_called_with("user", [uuid])
+
+
+@pytest.mark.django_db()
+def test_drain_cache_invalidations(mocker):
+    """Draining coalesces duplicate UUIDs per model"""
+    mocked = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    user_uuid, org_uuid = uuid4(), uuid4()
+    CacheInvalidation.objects.bulk_create(
+        [CacheInvalidation(model="user", uuid=user_uuid) for _ in range(3)]
+        + [CacheInvalidation(model="organization", uuid=org_uuid) for _ in range(2)]
+    )
+
+    assert utils.drain_cache_invalidations() == 5
+
+    assert mocked.call_count == 2
+    mocked.assert_any_call("user", [str(user_uuid)])
+    mocked.assert_any_call("organization", [str(org_uuid)])
+    assert not CacheInvalidation.objects.exists()
+    assert utils.drain_cache_invalidations() == 0
+
+
+@pytest.mark.django_db()
+def test_suppress_cache_invalidations(mocker):
+    """Suppressed cache invalidations are neither written nor sent"""
+    mocked = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    with middleware.suppress_cache_invalidations():
+        middleware.send_cache_invalidations("user", uuid4())
+    assert not CacheInvalidation.objects.exists()
+    mocked.assert_not_called()
+
+
+@pytest.mark.django_db()
+def test_suppress_cache_invalidations_nested():
+    """Leaving a nested suppressed block keeps the outer block suppressed"""
+    with middleware.suppress_cache_invalidations():
+        with middleware.suppress_cache_invalidations():
+            pass
+        middleware.send_cache_invalidations("user", uuid4())
+    assert not CacheInvalidation.objects.exists()
+    middleware.send_cache_invalidations("user", uuid4())
+    assert CacheInvalidation.objects.count() == 1
+
+
+@pytest.mark.django_db()
+def test_batch_cache_invalidations_outbox():
+    """Batched cache invalidations are written to the outbox once per
+    transaction, and again if a savepoint which wrote them is rolled back"""
+    uuid = uuid4()
+    with middleware.batch_cache_invalidations():
+        middleware.send_cache_invalidations("user", uuid)
+        middleware.send_cache_invalidations("user", [uuid, uuid4()])
+        assert CacheInvalidation.objects.count() == 2
+        with pytest.raises(ValueError), transaction.atomic():
+            other_uuid = uuid4()
+            middleware.send_cache_invalidations("user", other_uuid)
+            raise ValueError
+        middleware.send_cache_invalidations("user", other_uuid)
+    assert CacheInvalidation.objects.count() == 3
+    assert CacheInvalidation.objects.filter(uuid=other_uuid).exists()
+
+
+@pytest.mark.django_db()
+@override_settings(CACHE_INVALIDATION_OUTBOX=False)
+def test_batch_cache_invalidations(mocker):
+    """Batched cache invalidations are sent once, when the block exits"""
+    mocked = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    uuid = uuid4()
+    with middleware.batch_cache_invalidations():
+        with middleware.batch_cache_invalidations():
+            middleware.send_cache_invalidations("user", uuid)
+        middleware.send_cache_invalidations("user", uuid)
+        mocked.assert_not_called()
+    mocked.assert_called_once_with("user", [uuid])
+
+
+@pytest.mark.django_db()
+@override_settings(CACHE_INVALIDATION_OUTBOX=False)
+def test_batch_cache_invalidations_error(mocker):
+    """Batched cache invalidations are discarded if the block fails"""
+    mocked = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    with pytest.raises(ValueError):
+        with middleware.batch_cache_invalidations():
+            middleware.send_cache_invalidations("user", uuid4())
+            raise ValueError
+    mocked.assert_not_called()
+    assert not hasattr(middleware.CACHE_INVALIDATION_SET, "set")
+
+
+@pytest.mark.django_db()
+@override_settings(CACHE_INVALIDATION_OUTBOX=False)
+def test_task_cache_invalidations(mocker):
+    """Celery tasks batch their cache invalidations"""
+    mocked = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    uuid = uuid4()
+    signals.init_task_cache_invalidations(task_id="task")
+    middleware.send_cache_invalidations("user", uuid)
+    middleware.send_cache_invalidations("user", uuid)
+    mocked.assert_not_called()
+    signals.send_task_cache_invalidations(task_id="task", state="SUCCESS")
+    mocked.assert_called_once_with("user", [uuid])
+    assert not hasattr(middleware.CACHE_INVALIDATION_SET, "set")
@@ -0,0 +1,110 @@
+# Django
+from django.test import override_settings
+
+# Standard Library
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+
+# Third Party
+import pytest
+import requests
+
+# Squarelet
+from squarelet.oidc import webhooks
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Records each request and responds with the next queued status code"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        # pylint: disable=invalid-name
+        length = int(self.headers["Content-Length"])
+        body = self.rfile.read(length).decode("utf8")
+        self.server.requests.append((self.client_address, parse_qs(body)))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}/webhook/"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestWebhooks:
+    def test_deliver(self, stub_server):
+        """Webhooks are posted and connections are kept alive"""
+        webhooks.deliver("client", stub_server.url, data={"type": "user"})
+        webhooks.deliver("client", stub_server.url, data={"type": "user"})
+        assert len(stub_server.requests) == 2
+        assert stub_server.requests[0][1] == {"type": ["user"]}
+        # both requests came from the same connection
+        assert stub_server.requests[0][0] == stub_server.requests[1][0]
+
+    def test_retry(self, stub_server):
+        """Server errors are retried"""
+        stub_server.statuses = [500, 503]
+        webhooks.stats.reset()
+        webhooks.deliver("client", stub_server.url, data={"type": "user"})
+        assert len(stub_server.requests) == 3
+        assert webhooks.stats.snapshot()["client"]["attempts"] == 3
+
+    def test_client_error(self, stub_server):
+        """Client errors are not retried"""
+        stub_server.statuses = [400]
+        with pytest.raises(requests.HTTPError):
+            webhooks.deliver("client", stub_server.url, data={"type": "user"})
+        assert len(stub_server.requests) == 1
+
+    @override_settings(WEBHOOK_RETRIES=0, WEBHOOK_CIRCUIT_THRESHOLD=2)
+    def test_circuit_breaker(self, stub_server):
+        """Dead endpoints are not contacted until the circuit resets"""
+        stub_server.statuses = [500, 500]
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError):
+                webhooks.deliver("client", stub_server.url, data={"type": "user"})
+        with pytest.raises(webhooks.CircuitOpenError):
+            webhooks.deliver("client", stub_server.url, data={"type": "user"})
+        assert len(stub_server.requests) == 2
+
+        with override_settings(WEBHOOK_CIRCUIT_RESET=0):
+            webhooks.deliver("client", stub_server.url, data={"type": "user"})
+        assert len(stub_server.requests) == 3
+
+    def test_deliver_all(self, stub_server):
+        """Deliver to many clients at once, recording per client stats"""
+        webhooks.stats.reset()
+        stub_server.statuses = [200, 200, 200]
+        results = webhooks.deliver_all(
+            [
+                (f"client {i}", stub_server.url, {"data": {"type": "user"}})
+                for i in range(3)
+            ]
+        )
+        assert len(stub_server.requests) == 3
+        assert all(r.status_code == 200 for _name, r in results)
+        stats = webhooks.stats.snapshot()
+        for i in range(3):
+            assert stats[f"client {i}"]["sent"] == 1
+            assert stats[f"client {i}"]["failed"] == 0
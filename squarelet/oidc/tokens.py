@@ -0,0 +1,137 @@
+"""A two tier cache of OAuth2 access tokens for authenticating API requests
+
+Clients call the API many times a minute with the same few access tokens.  Each
+process keeps a small LRU of recently seen tokens in front of the shared cache,
+which in turn sits in front of the database.  Changing or deleting a token
+removes it from the shared cache and this process's LRU - other processes may
+keep accepting it until their local copy expires, which is bounded by
+OIDC_TOKEN_LOCAL_TIMEOUT.
+"""
+
+# Django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+# Standard Library
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Third Party
+from memoize import mproperty
+from oidc_provider.models import Client, Token
+
+
+class CachedToken:
+    """The parts of an access token needed to authenticate an API request"""
+
+    def __init__(self, user_id, client_id, expires_at, scope):
+        self.user_id = user_id
+        self.client_id = client_id
+        self.expires_at = expires_at
+        self.scope = frozenset(scope)
+
+    def has_expired(self):
+        return timezone.now() >= self.expires_at
+
+    @mproperty
+    def user(self):
+        if self.user_id is None:
+            return None
+        return get_user_model().objects.get(pk=self.user_id)
+
+    @mproperty
+    def client(self):
+        return Client.objects.get(pk=self.client_id)
+
+
+class LocalTokenCache:
+    """A thread safe LRU cache with a time to live, local to this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at >= settings.OIDC_TOKEN_LOCAL_TIMEOUT:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.OIDC_TOKEN_LOCAL_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalTokenCache()
+
+
+def _cache_key(access_token):
+    # do not use the token itself as the key, so it is never stored in the clear
+    digest = hashlib.sha256(access_token.encode("utf8")).hexdigest()
+    return f"oidc:token:{digest}"
+
+
+def _load_token(access_token):
+    """Load a token from the database as a plain tuple"""
+    token = (
+        Token.objects.filter(access_token=access_token)
+        .values_list("user_id", "client_id", "expires_at", "_scope")
+        .first()
+    )
+    if token is None:
+        return None
+    user_id, client_id, expires_at, scope = token
+    return (user_id, client_id, expires_at, tuple(scope.split()))
+
+
+def get_token(access_token):
+    """Get the token for an access token, or None if it does not exist"""
+    if not settings.OIDC_TOKEN_CACHE_TIMEOUT:
+        data = _load_token(access_token)
+        return CachedToken(*data) if data is not None else None
+
+    key = _cache_key(access_token)
+    data = local_cache.get(key)
+    if data is None:
+        data = cache.get(key)
+        if data is None:
+            data = _load_token(access_token)
+            if data is None:
+                return None
+            timeout = min(
+                settings.OIDC_TOKEN_CACHE_TIMEOUT,
+                int((data[2] - timezone.now()).total_seconds()),
+            )
+            if timeout > 0:
+                cache.set(key, data, timeout=timeout)
+        local_cache.set(key, data)
+    # a new object for each request, so lazily loaded relations are not shared
+    return CachedToken(*data)
+
+
+def invalidate_token(access_token):
+    """Remove a token from the caches"""
+    key = _cache_key(access_token)
+    local_cache.delete(key)
+    cache.delete(key)
@@ -2,13 +2,16 @@
 
 # Django
 from django.conf import settings
+from django.db import transaction
 
 # Standard Library
 import logging
+from collections import defaultdict
 
 # Local
 from . import tasks
-from .models import ClientProfile
+from .models import CacheInvalidation
+from .targets import get_webhook_targets
 
 logger = logging.getLogger(__name__)
 
@@ -17,5 +20,42 @@ def send_cache_invalidations(model, uuids):
     """Send a cache invalidation signal to all clients"""
     if settings.ENABLE_SEND_CACHE_INVALIDATIONS:
         logger.info("Sending cache invalidations for: %s %s", model, uuids)
-        for client_profile in ClientProfile.objects.exclude(webhook_url=""):
-            tasks.send_cache_invalidation.delay(client_profile.pk, model, uuids)
+        targets = get_webhook_targets()
+        if targets:
+            tasks.send_cache_invalidations.delay(
+                model, [str(uuid) for uuid in uuids], targets
+            )
+
+
+def drain_cache_invalidations(limit=None):
+    """Send a batch of cache invalidations from the outbox
+
+    UUIDs are coalesced per model, so each client receives one webhook per model
+    no matter how many times an object was changed since the last drain.
+    Rows are locked with SKIP LOCKED so multiple drainers may run concurrently.
+    Returns the number of outbox rows processed.
+    """
+    if limit is None:
+        limit = settings.CACHE_INVALIDATION_BATCH_SIZE
+    with transaction.atomic():
+        invalidations = list(
+            CacheInvalidation.objects.select_for_update(skip_locked=True).values_list(
+                "pk", "model", "uuid"
+            )[:limit]
+        )
+        if not invalidations:
+            return 0
+
+        uuids = defaultdict(set)
+        for _pk, model, uuid in invalidations:
+            uuids[model].add(str(uuid))
+        for model, model_uuids in uuids.items():
+            send_cache_invalidations(model, sorted(model_uuids))
+
+        # delete after sending inside the transaction, so a failure while sending
+        # leaves the rows to be retried
+        CacheInvalidation.objects.filter(
+            pk__in=[pk for pk, _model, _uuid in invalidations]
+        ).delete()
+
+    return len(invalidations)
@@ -1,4 +1,10 @@
+# Django
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
 # Standard Library
+from collections import OrderedDict
 from hashlib import sha224
 from random import randint
 from uuid import uuid4
@@ -6,10 +12,18 @@ from uuid import uuid4
 # Third Party
 from oidc_provider.models import Client, ResponseType
 from rest_framework import viewsets
-from rest_framework.permissions import DjangoObjectPermissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import DjangoObjectPermissions, IsAdminUser
+from rest_framework.response import Response
 
 # Squarelet
+from squarelet.oidc.models import Change
+from squarelet.oidc.permissions import ScopePermission
 from squarelet.oidc.serializers import ClientSerializer
+from squarelet.organizations.serializers import OrganizationSerializer
+from squarelet.organizations.viewsets import OrganizationViewSet
+from squarelet.users.serializers import UserReadSerializer
+from squarelet.users.viewsets import UserViewSet
 
 
 class ClientViewSet(viewsets.ModelViewSet):
@@ -44,3 +58,76 @@ class ClientViewSet(viewsets.ModelViewSet):
             if not serializer.instance.client_secret:
                 kwargs["client_secret"] = sha224(uuid4().hex.encode()).hexdigest()
         serializer.save(**kwargs)
+
+
+class ChangeViewSet(viewsets.ViewSet):
+    """Users and organizations which have changed since a cursor
+
+    Clients which may have missed cache invalidations can catch up by passing the
+    `cursor` from the previous page as `since`, until `has_more` is false.  Each
+    object is listed once per page, however many times it changed.  Objects
+    which no longer exist are listed under `deleted`.
+    """
+
+    permission_classes = (ScopePermission | IsAdminUser,)
+    read_scopes = ("read_user", "read_organization")
+    swagger_schema = None
+
+    def list(self, request):
+        since = request.query_params.get("since", "0.0")
+        try:
+            txid, pk = [int(part) for part in since.split(".")]
+        except ValueError:
+            raise ValidationError({"since": "Must be a cursor from the change feed"})
+
+        # changes are read in transaction order, and only from transactions
+        # older than every transaction still in progress, as those may yet
+        # commit changes which sort before the changes of newer transactions
+        changes = list(
+            Change.objects.filter(Q(txid__gt=txid) | Q(txid=txid, pk__gt=pk))
+            .filter(txid__lt=RawSQL("txid_snapshot_xmin(txid_current_snapshot())", []))
+            .values_list("txid", "pk", "model", "uuid")[
+                : settings.CHANGE_FEED_PAGE_SIZE
+            ]
+        )
+
+        cursor = f"{changes[-1][0]}.{changes[-1][1]}" if changes else since
+
+        uuids = {"user": set(), "organization": set()}
+        for _txid, _pk, model, uuid in changes:
+            uuids[model].add(uuid)
+        context = {"request": request}
+        users = UserReadSerializer(
+            UserViewSet.queryset.filter(individual_organization_id__in=uuids["user"]),
+            many=True,
+            context=context,
+        ).data
+        organizations = OrganizationSerializer(
+            OrganizationViewSet.queryset.filter(uuid__in=uuids["organization"]),
+            many=True,
+            context=context,
+        ).data
+
+        return Response(
+            OrderedDict(
+                [
+                    ("cursor", cursor),
+                    ("has_more", len(changes) == settings.CHANGE_FEED_PAGE_SIZE),
+                    ("users", users),
+                    ("organizations", organizations),
+                    (
+                        "deleted",
+                        {
+                            "users": self._missing(uuids["user"], users),
+                            "organizations": self._missing(
+                                uuids["organization"], organizations
+                            ),
+                        },
+                    ),
+                ]
+            )
+        )
+
+    def _missing(self, uuids, data):
+        found = {str(obj["uuid"]) for obj in data}
+        return sorted(str(uuid) for uuid in uuids if str(uuid) not in found)
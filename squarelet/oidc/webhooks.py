@@ -0,0 +1,255 @@
+"""Pooled, concurrent delivery of webhooks to OIDC clients
+
+Each webhook host gets its own keep-alive session, a limit on how many requests
+may be in flight to it at once, and a circuit breaker so that a dead endpoint does
+not tie up the workers with timeouts and retries.
+"""
+
+# Django
+from django.conf import settings
+
+# Standard Library
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# Third Party
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """The endpoint has failed too many times recently and is not being contacted"""
+
+
+class WebhookTarget(
+    namedtuple("WebhookTarget", ["pk", "name", "url", "secret", "compress"])
+):
+    """A client to send webhooks to
+
+    This holds everything needed to sign and send a webhook without touching the
+    database, and serializes to JSON as a plain list so it may be passed to
+    celery tasks
+    """
+
+    __slots__ = ()
+
+    def cache_invalidation_data(self, model, uuids):
+        """The signed webhook payload for a cache invalidation"""
+        timestamp = int(time.time())
+        signature = hmac.new(
+            key=self.secret.encode("utf8"),
+            msg="{}{}{}".format(timestamp, model, "".join(uuids)).encode("utf8"),
+            digestmod=hashlib.sha256,
+        ).hexdigest()
+        return {
+            "type": model,
+            "uuids": uuids,
+            "timestamp": timestamp,
+            "signature": signature,
+        }
+
+    def cache_invalidation_requests(self, model, uuids):
+        """Keyword arguments for each request needed to send a cache invalidation
+        Large lists of UUIDs are split into chunks, each signed separately
+        """
+        size = settings.CACHE_INVALIDATION_CHUNK_SIZE
+        chunks = []
+        for i in range(0, len(uuids), size):
+            data = self.cache_invalidation_data(model, uuids[i : i + size])
+            if self.compress:
+                chunks.append(
+                    {
+                        "data": gzip.compress(json.dumps(data).encode("utf8")),
+                        "headers": {
+                            "Content-Type": "application/json",
+                            "Content-Encoding": "gzip",
+                        },
+                    }
+                )
+            else:
+                chunks.append({"data": data})
+        return chunks
+
+
+class Endpoint:
+    """Connection pool, concurrency limit and circuit breaker for a webhook host"""
+
+    def __init__(self, host):
+        self.host = host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.WEBHOOK_MAX_CONCURRENCY
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.semaphore = threading.BoundedSemaphore(settings.WEBHOOK_MAX_CONCURRENCY)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+
+    def is_open(self):
+        """Is the circuit open, meaning we should not contact this endpoint?"""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < settings.WEBHOOK_CIRCUIT_RESET:
+                return True
+            # half open - let requests through, but a single failure re-opens it
+            self.opened_at = None
+            self.failures = settings.WEBHOOK_CIRCUIT_THRESHOLD - 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= settings.WEBHOOK_CIRCUIT_THRESHOLD:
+                if self.opened_at is None:
+                    logger.warning("Webhook circuit opened for %s", self.host)
+                self.opened_at = time.monotonic()
+
+    def post(self, url, **kwargs):
+        with self.semaphore:
+            return self.session.post(url, timeout=settings.WEBHOOK_TIMEOUT, **kwargs)
+
+
+class DeliveryStats:
+    """Per client latency and failure counters for this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = defaultdict(
+            lambda: {
+                "sent": 0,
+                "failed": 0,
+                "attempts": 0,
+                "total_latency": 0.0,
+                "last_latency": None,
+            }
+        )
+
+    def record(self, name, latency, attempts, success):
+        with self.lock:
+            client = self.clients[name]
+            client["sent" if success else "failed"] += 1
+            client["attempts"] += attempts
+            client["total_latency"] += latency
+            client["last_latency"] = latency
+
+    def snapshot(self):
+        """A copy of the current stats, including the average latency"""
+        with self.lock:
+            return {
+                name: dict(
+                    client,
+                    average_latency=client["total_latency"]
+                    / (client["sent"] + client["failed"]),
+                )
+                for name, client in self.clients.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.clients.clear()
+
+
+stats = DeliveryStats()
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(url):
+    """Get the shared endpoint for the URL's host"""
+    host = urlsplit(url).netloc
+    with _endpoints_lock:
+        if host not in _endpoints:
+            _endpoints[host] = Endpoint(host)
+        return _endpoints[host]
+
+
+def _is_retryable(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def deliver(name, url, **kwargs):
+    """Deliver a single webhook, retrying with exponential backoff
+
+    `name` identifies the client in the stats, the remaining keyword arguments
+    are passed through to `requests.post`
+    """
+    endpoint = get_endpoint(url)
+    start = time.monotonic()
+    attempts = 0
+    success = False
+    try:
+        for attempt in range(settings.WEBHOOK_RETRIES + 1):
+            if endpoint.is_open():
+                raise CircuitOpenError(endpoint.host)
+            attempts += 1
+            try:
+                response = endpoint.post(url, **kwargs)
+                if _is_retryable(response):
+                    response.raise_for_status()
+            except requests.RequestException:
+                endpoint.record_failure()
+                if attempt == settings.WEBHOOK_RETRIES:
+                    raise
+                time.sleep(settings.WEBHOOK_BACKOFF * 2 ** attempt)
+            else:
+                # the endpoint is up, even if it rejected this request
+                endpoint.record_success()
+                response.raise_for_status()
+                success = True
+                return response
+    finally:
+        stats.record(name, time.monotonic() - start, attempts, success)
+
+
+def deliver_all(deliveries):
+    """Deliver webhooks to many clients concurrently
+
+    `deliveries` is a list of (name, url, kwargs) tuples.  Returns a list of
+    (name, result) tuples in the same order, where the result is either the
+    response or the exception which stopped the delivery
+    """
+
+    def deliver_one(delivery):
+        name, url, kwargs = delivery
+        start = time.monotonic()
+        try:
+            result = deliver(name, url, **kwargs)
+        except (requests.RequestException, CircuitOpenError) as exc:
+            result = exc
+            logger.error(
+                "Webhook to %s failed after %.3fs: %s",
+                name,
+                time.monotonic() - start,
+                exc,
+            )
+        else:
+            logger.info(
+                "Webhook to %s succeeded in %.3fs", name, time.monotonic() - start
+            )
+        return name, result
+
+    if not deliveries:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=min(len(deliveries), settings.WEBHOOK_WORKERS)
+    ) as executor:
+        return list(executor.map(deliver_one, deliveries))
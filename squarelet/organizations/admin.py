@@ -1,12 +1,16 @@
 # Django
 from django.contrib import admin
+from django.db import transaction
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 
 # Third Party
 from reversion.admin import VersionAdmin
 
 # Squarelet
+from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.organizations.choices import StripeEventStatus
 from squarelet.organizations.models import (
     Charge,
     Customer,
@@ -19,8 +23,10 @@ from squarelet.organizations.models import (
     OrganizationType,
     Plan,
     ReceiptEmail,
+    StripeEvent,
     Subscription,
 )
+from squarelet.organizations.tasks import process_stripe_events
 from squarelet.users.models import User
 
 
@@ -127,6 +133,13 @@ class OrganizationAdmin(VersionAdmin):
 
     get_subtypes.short_description = "Subtypes"
 
+    def save_related(self, request, form, formsets, change):
+        """Changes to inlines, such as subscriptions, do not change the organization
+        itself, so send the cache invalidation for them here"""
+        super().save_related(request, form, formsets, change)
+        if any(formset.has_changed() for formset in formsets):
+            send_cache_invalidations("organization", form.instance.uuid)
+
 
 @admin.register(Plan)
 class PlanAdmin(VersionAdmin):
@@ -161,6 +174,37 @@ class ChargeAdmin(VersionAdmin):
     readonly_fields = ("organization", "amount", "created_at", "charge_id")
 
 
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ("event_id", "type", "status", "attempts", "created_at")
+    list_filter = ("status", "type")
+    search_fields = ("event_id",)
+    date_hierarchy = "created_at"
+    readonly_fields = (
+        "event_id",
+        "type",
+        "data",
+        "stripe_account",
+        "status",
+        "attempts",
+        "error",
+        "created_at",
+        "retry_at",
+        "processed_at",
+    )
+    actions = ["retry"]
+
+    def retry(self, request, queryset):
+        """Queue failed events to be processed again"""
+        count = queryset.filter(status=StripeEventStatus.failed).update(
+            status=StripeEventStatus.pending, attempts=0, retry_at=timezone.now()
+        )
+        transaction.on_commit(process_stripe_events.delay)
+        self.message_user(request, f"{count} events queued to be retried")
+
+    retry.short_description = "Retry failed events"
+
+
 @admin.register(OrganizationChangeLog)
 class OrganizationChangeLogAdmin(VersionAdmin):
     list_display = (
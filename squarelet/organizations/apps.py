@@ -9,3 +9,6 @@ class OrganizationsConfig(AppConfig):
     def ready(self):
         # pylint: disable=unused-variable
         from . import signals
+        from .stripe_client import configure
+
+        configure()
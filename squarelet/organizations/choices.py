@@ -16,3 +16,10 @@ class StripeAccounts(DjangoChoices):
     # pylint: disable=no-init
     muckrock = ChoiceItem(0, _("MuckRock"))
     presspass = ChoiceItem(1, _("PressPass"))
+
+
+class StripeEventStatus(DjangoChoices):
+    # pylint: disable=no-init
+    pending = ChoiceItem(0, _("Pending"))
+    processed = ChoiceItem(1, _("Processed"))
+    failed = ChoiceItem(2, _("Failed"))
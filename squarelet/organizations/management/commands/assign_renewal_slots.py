@@ -0,0 +1,17 @@
+# Django
+from django.core.management.base import BaseCommand
+
+# Squarelet
+from squarelet.organizations.models import Subscription
+
+
+class Command(BaseCommand):
+    """Reassign every subscription to its renewal slot, after the number of slots
+    has been changed"""
+
+    help = __doc__
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        updated = Subscription.objects.assign_renewal_slots()
+        self.stdout.write(f"Updated {updated} subscriptions")
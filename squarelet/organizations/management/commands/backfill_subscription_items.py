@@ -0,0 +1,25 @@
+# Django
+from django.core.management.base import BaseCommand
+
+# Squarelet
+from squarelet.organizations.reconcile import reconcile
+
+
+class Command(BaseCommand):
+    """Store the item ID and quantity from Stripe for every subscription"""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=20,
+            help="Maximum requests per second to Stripe",
+        )
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        reconcilers = reconcile(rate=kwargs["rate"], parts=("subscriptions",))
+        updated = sum(r.drift["subscription_items_updated"] for r in reconcilers)
+        self.stdout.write(f"Updated {updated} subscriptions")
@@ -0,0 +1,118 @@
+# Django
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+# Squarelet
+from squarelet.core.utils import (
+    insert_memberships,
+    measure,
+    rolled_back,
+    seed_users,
+    seeding,
+)
+from squarelet.organizations.models import Organization
+from squarelet.users.models import User
+
+
+class Command(BaseCommand):
+    """Compare the query plans and time needed to list and count the organizations
+    viewable by a user, when filtering with joins and DISTINCT and with subqueries,
+    on a seeded set of organizations and memberships"""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organizations",
+            type=int,
+            default=1000000,
+            help="Number of organizations to seed",
+        )
+        parser.add_argument(
+            "--users", type=int, default=100000, help="Number of users to seed"
+        )
+        parser.add_argument(
+            "--members",
+            type=int,
+            default=5,
+            help="Number of members of each organization",
+        )
+        parser.add_argument(
+            "--private-every",
+            type=int,
+            default=5,
+            help="One in this many organizations are private",
+        )
+        parser.add_argument(
+            "--explain", action="store_true", help="Show the query plans"
+        )
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        with rolled_back():
+            with seeding(self.stdout):
+                user = self.seed(
+                    kwargs["organizations"],
+                    kwargs["users"],
+                    kwargs["members"],
+                    kwargs["private_every"],
+                )
+            for name, queryset in (
+                (
+                    "distinct",
+                    Organization.objects.filter(
+                        Q(private=False) | Q(users=user)
+                    ).distinct(),
+                ),
+                ("subquery", Organization.objects.get_viewable(user)),
+            ):
+                self.benchmark(name, queryset, kwargs["explain"])
+
+    def seed(self, organizations, users, members, private_every):
+        """Seed organizations, the first of which are the individual organizations
+        for the seeded users, and give each organization `members` members
+
+        Returns one of the seeded users
+        """
+        seed_users(
+            users,
+            organizations,
+            {
+                "individual": f"n <= {users:d}",
+                "private": f"n <= {users:d} OR n %% {private_every:d} = 0",
+            },
+        )
+        # the copies are inserted by a single statement, so their IDs are
+        # consecutive
+        first_organization = Organization.objects.get(slug="benchmark-1").pk
+        first_user = User.objects.get(username="benchmark-1")
+        # membership n is in organization n % organizations, with the user
+        # offset by n / organizations, so no pair is repeated
+        insert_memberships(
+            "SELECT %s + (n / %s + n %% %s) %% %s, %s + n %% %s "
+            "FROM generate_series(0, %s) n",
+            [
+                first_user.pk,
+                organizations,
+                organizations,
+                users,
+                first_organization,
+                organizations,
+                organizations * members - 1,
+            ],
+        )
+        return first_user
+
+    def benchmark(self, name, queryset, explain):
+        # list and count a page at a time, as the API and list views do
+        page = queryset.order_by("name")[:20]
+        with measure() as listed:
+            list(page)
+        with measure() as counted:
+            queryset.count()
+        self.stdout.write(
+            f"{name}: list {listed.elapsed * 1000:.0f} ms, "
+            f"count {counted.elapsed * 1000:.0f} ms"
+        )
+        if explain:
+            self.stdout.write(page.explain(analyze=True))
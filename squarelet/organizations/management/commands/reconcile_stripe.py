@@ -0,0 +1,70 @@
+# Django
+from django.core.management.base import BaseCommand
+
+# Standard Library
+import time
+
+# Third Party
+import stripe
+
+# Squarelet
+from squarelet.organizations.choices import StripeAccounts
+from squarelet.organizations.reconcile import reconcile
+
+
+class Command(BaseCommand):
+    """Resync customers, subscriptions and recent charges with Stripe, and report
+    how far we had drifted from it"""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Number of Stripe accounts to reconcile at once",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=20,
+            help="Maximum requests per second to Stripe, across all workers",
+        )
+        parser.add_argument(
+            "--days", type=int, default=30, help="Check charges from this many days"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report drift without fixing it"
+        )
+        parser.add_argument(
+            "--api-base",
+            help="Use a different Stripe API server, such as a local stripe-mock",
+        )
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        if kwargs["api_base"]:
+            stripe.api_base = kwargs["api_base"]
+        start = time.monotonic()
+        reconcilers = reconcile(
+            workers=kwargs["workers"],
+            rate=kwargs["rate"],
+            days=kwargs["days"],
+            dry_run=kwargs["dry_run"],
+        )
+        elapsed = time.monotonic() - start
+        for reconciler in reconcilers:
+            name = StripeAccounts.values[reconciler.stripe_account]
+            self.stdout.write(
+                f"{name}: {reconciler.objects} objects in "
+                f"{reconciler.requests} requests"
+            )
+            for kind, count in sorted(reconciler.drift.items()):
+                if count:
+                    self.stdout.write(f"\t{kind}: {count}")
+        objects = sum(r.objects for r in reconcilers)
+        self.stdout.write(
+            f"{objects} objects in {elapsed:.1f}s "
+            f"({objects / elapsed if elapsed else 0:.1f} objects/s)"
+        )
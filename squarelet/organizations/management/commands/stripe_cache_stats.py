@@ -0,0 +1,26 @@
+# Django
+from django.core.management.base import BaseCommand
+
+# Squarelet
+from squarelet.organizations import stripe_cache
+
+
+class Command(BaseCommand):
+    """Show how many Stripe calls the Stripe object cache has saved"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters after showing them"
+        )
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        for name, counts in stripe_cache.stats().items():
+            total = counts["hits"] + counts["misses"]
+            rate = counts["hits"] / total if total else 0
+            self.stdout.write(
+                f"{name}: {counts['hits']} hits, {counts['misses']} misses "
+                f"({rate:.1%} hit rate)"
+            )
+        if kwargs["reset"]:
+            stripe_cache.reset_stats()
@@ -0,0 +1,47 @@
+"""Middleware for the organizations app"""
+
+# Standard Library
+import threading
+
+MEMBERSHIPS = threading.local()
+
+
+class MembershipCacheMiddleware:
+    """Cache which organizations each user is a member of for the length of the
+    request, so permission checks on many organizations only need one query
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        MEMBERSHIPS.maps = {}
+        try:
+            return self.get_response(request)
+        finally:
+            del MEMBERSHIPS.maps
+
+
+def membership_map(user):
+    """Map the IDs of the organizations the user is a member of to whether they
+    are an admin of it
+
+    This is loaded once per request - outside of a request it returns None, and
+    the caller should query the memberships directly
+    """
+    maps = getattr(MEMBERSHIPS, "maps", None)
+    if maps is None:
+        return None
+    if not user.is_authenticated:
+        return {}
+    if user.pk not in maps:
+        maps[user.pk] = dict(user.memberships.values_list("organization_id", "admin"))
+    return maps[user.pk]
+
+
+def clear_membership_map(user_id):
+    """Reload the user's memberships the next time they are needed in this
+    request, after they have changed"""
+    maps = getattr(MEMBERSHIPS, "maps", None)
+    if maps is not None:
+        maps.pop(user_id, None)
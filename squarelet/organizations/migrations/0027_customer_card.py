@@ -0,0 +1,43 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0026_auto_20210222_1538'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='card_brand',
+            field=models.CharField(blank=True, help_text='The brand of the default card, blank if there is no card', max_length=20, verbose_name='card brand'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='card_exp_month',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='The expiration month of the default card', null=True, verbose_name='card expiration month'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='card_exp_year',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='The expiration year of the default card', null=True, verbose_name='card expiration year'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='card_last4',
+            field=models.CharField(blank=True, help_text='The last four digits of the default card', max_length=4, verbose_name='card last four'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='card_updated_at',
+            field=models.DateTimeField(blank=True, help_text='When the card details were last copied from stripe - blank if they never have been', null=True, verbose_name='card updated at'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='default_source',
+            field=models.CharField(blank=True, help_text="The ID of the customer's default payment source on stripe", max_length=255, verbose_name='default source'),
+        ),
+    ]
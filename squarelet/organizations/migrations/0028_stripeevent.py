@@ -0,0 +1,39 @@
+# Generated by Django 2.1.7 on 2026-10-18 14:10
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.utils.timezone
+import squarelet.core.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0027_customer_card'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(help_text='The stripe ID for the event', max_length=255, unique=True, verbose_name='event id')),
+                ('type', models.CharField(help_text='The type of event', max_length=255, verbose_name='type')),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(help_text='The event as received from stripe', verbose_name='data')),
+                ('stripe_account', models.PositiveSmallIntegerField(choices=[(0, 'MuckRock'), (1, 'PressPass')], default=0, help_text="Which company's stripe account sent this event", verbose_name='stripe account')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Pending'), (1, 'Processed'), (2, 'Failed')], default=0, help_text='Whether this event has been processed', verbose_name='status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='The number of times we have tried to process this event', verbose_name='attempts')),
+                ('error', models.TextField(blank=True, help_text='The error from the last failed attempt to process this event', verbose_name='error')),
+                ('created_at', squarelet.core.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, help_text='When this event was received', verbose_name='created at')),
+                ('retry_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Do not try to process this event again before this time', verbose_name='retry at')),
+                ('processed_at', models.DateTimeField(blank=True, help_text='When this event was processed', null=True, verbose_name='processed at')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(fields=['status', 'retry_at'], name='organizatio_status_ae0dde_idx'),
+        ),
+    ]
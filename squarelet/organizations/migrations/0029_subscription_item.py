@@ -0,0 +1,23 @@
+# Generated by Django 2.1.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0028_stripeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='quantity',
+            field=models.PositiveIntegerField(blank=True, help_text='The number of seats last set on the subscription on stripe', null=True, verbose_name='quantity'),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='subscription_item_id',
+            field=models.CharField(blank=True, help_text="The ID on stripe of the subscription's item for its plan", max_length=255, verbose_name='subscription item id'),
+        ),
+    ]
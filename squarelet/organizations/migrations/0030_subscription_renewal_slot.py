@@ -0,0 +1,31 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_renewal_slots(apps, schema_editor):
+    """Spread existing subscriptions across the renewal slots by organization,
+    leaving their update dates unchanged"""
+    Subscription = apps.get_model('organizations', 'Subscription')
+    slots = {}
+    for pk, uuid in Subscription.objects.values_list('pk', 'organization__uuid'):
+        slots.setdefault(uuid.int % settings.RESTORE_SLOTS, []).append(pk)
+    for slot, pks in slots.items():
+        Subscription.objects.filter(pk__in=pks).update(renewal_slot=slot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0029_subscription_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='renewal_slot',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='The time of day at which monthly resources are restored', null=True, verbose_name='renewal slot'),
+        ),
+        migrations.RunPython(assign_renewal_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.7 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0030_subscription_renewal_slot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='charge',
+            index=models.Index(fields=['created_at', 'id'], name='organizatio_created_42f605_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(fields=['updated_at', 'id'], name='organizatio_updated_59a0f7_idx'),
+        ),
+    ]
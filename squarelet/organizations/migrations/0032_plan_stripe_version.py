@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0031_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='stripe_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='How many times this plan has been replaced on stripe', verbose_name='stripe version'),
+        ),
+    ]
@@ -18,10 +18,11 @@ from sorl.thumbnail import ImageField
 # Squarelet
 from squarelet.core.fields import AutoCreatedField, AutoLastModifiedField
 from squarelet.core.mail import ORG_TO_ADMINS, send_mail
-from squarelet.core.mixins import AvatarMixin
+from squarelet.core.mixins import AvatarMixin, ChangeTrackingMixin
 from squarelet.core.utils import file_path
 from squarelet.oidc.middleware import send_cache_invalidations
 from squarelet.organizations.choices import ChangeLogReason, StripeAccounts
+from squarelet.organizations.middleware import membership_map
 from squarelet.organizations.models.payment import Charge
 from squarelet.organizations.querysets import (
     InvitationQuerySet,
@@ -36,9 +37,21 @@ def organization_file_path(instance, filename):
     return file_path("org_avatars", instance, filename)
 
 
-class Organization(AvatarMixin, models.Model):
+class Organization(ChangeTrackingMixin, AvatarMixin, models.Model):
     """Orginization to allow pooled requests and collaboration"""
 
+    client_fields = (
+        "uuid",
+        "name",
+        "slug",
+        "avatar",
+        "individual",
+        "private",
+        "verified_journalist",
+        "max_users",
+        "payment_failed",
+    )
+
     objects = OrganizationQuerySet.as_manager()
 
     uuid = models.UUIDField(
@@ -188,6 +201,8 @@ class Organization(AvatarMixin, models.Model):
 
     class Meta:
         ordering = ("slug",)
+        # for paging through organizations in the API
+        indexes = [models.Index(fields=["updated_at", "id"])]
 
     def __str__(self):
         if self.individual:
@@ -197,11 +212,11 @@ class Organization(AvatarMixin, models.Model):
 
     def save(self, *args, **kwargs):
         # pylint: disable=arguments-differ
+        changed = self.has_changed(*self.client_fields)
         with transaction.atomic():
             super().save(*args, **kwargs)
-            transaction.on_commit(
-                lambda: send_cache_invalidations("organization", self.uuid)
-            )
+            if changed:
+                send_cache_invalidations("organization", self.uuid)
 
     def get_absolute_url(self):
         """The url for this object"""
@@ -230,10 +245,16 @@ class Organization(AvatarMixin, models.Model):
     # User Management
     def has_admin(self, user):
         """Is the given user an admin of this organization"""
+        memberships = membership_map(user)
+        if memberships is not None:
+            return memberships.get(self.pk, False)
         return self.users.filter(pk=user.pk, memberships__admin=True).exists()
 
     def has_member(self, user):
         """Is the user a member?"""
+        memberships = membership_map(user)
+        if memberships is not None:
+            return self.pk in memberships
         return self.users.filter(pk=user.pk).exists()
 
     def user_count(self):
@@ -284,10 +305,11 @@ class Organization(AvatarMixin, models.Model):
         if token:
             self.save_card(token, plan.stripe_account)
 
-        customer = self.customer(plan.stripe_account).stripe_customer
-        if not customer.email:
-            customer.email = self.email
-            customer.save()
+        customer = self.customer(plan.stripe_account)
+        if not customer.stripe_customer.email:
+            customer.stripe_customer.email = self.email
+            customer.stripe_customer.save()
+            customer.invalidate_stripe_customer()
 
         self.subscriptions.start(organization=self, plan=plan)
 
@@ -312,6 +334,8 @@ class Organization(AvatarMixin, models.Model):
         elif self.plan and plan:
             # modify the subscription
             self.subscription.modify(plan)
+        # the plan is stored on the subscription, not the organization
+        send_cache_invalidations("organization", self.uuid)
 
         self.change_logs.create(
             user=user,
@@ -331,6 +355,7 @@ class Organization(AvatarMixin, models.Model):
             to_max_users=self.max_users,
         )
         self.subscription.delete()
+        send_cache_invalidations("organization", self.uuid)
 
     def charge(
         self,
@@ -359,7 +384,7 @@ class Organization(AvatarMixin, models.Model):
         )
 
 
-class Membership(models.Model):
+class Membership(ChangeTrackingMixin, models.Model):
     """Through table for organization membership"""
 
     objects = MembershipQuerySet.as_manager()
@@ -391,19 +416,17 @@ class Membership(models.Model):
 
     def save(self, *args, **kwargs):
         # pylint: disable=arguments-differ
+        changed = self.has_changed("user", "organization", "admin")
         with transaction.atomic():
             super().save(*args, **kwargs)
-            transaction.on_commit(
-                lambda: send_cache_invalidations("user", self.user.uuid)
-            )
+            if changed:
+                send_cache_invalidations("user", self.user.uuid)
 
     def delete(self, *args, **kwargs):
         # pylint: disable=arguments-differ
         with transaction.atomic():
             super().delete(*args, **kwargs)
-            transaction.on_commit(
-                lambda: send_cache_invalidations("user", self.user.uuid)
-            )
+            send_cache_invalidations("user", self.user.uuid)
 
 
 class Invitation(models.Model):
@@ -3,10 +3,12 @@ from django.conf import settings
 from django.contrib.postgres.fields import JSONField
 from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 # Standard Library
 import logging
+from collections import namedtuple
 
 # Third Party
 import stripe
@@ -14,8 +16,12 @@ from autoslug import AutoSlugField
 from memoize import mproperty
 
 # Squarelet
+from squarelet.core.fields import AutoCreatedField
 from squarelet.core.mail import ORG_TO_RECEIPTS, send_mail
-from squarelet.organizations.choices import StripeAccounts
+from squarelet.core.mixins import ChangeTrackingMixin
+from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.organizations import stripe_cache
+from squarelet.organizations.choices import StripeAccounts, StripeEventStatus
 from squarelet.organizations.querysets import (
     ChargeQuerySet,
     EntitlementQuerySet,
@@ -26,6 +32,8 @@ from squarelet.organizations.querysets import (
 stripe.api_version = "2018-09-24"
 logger = logging.getLogger(__name__)
 
+Card = namedtuple("Card", ["id", "brand", "last4", "exp_month", "exp_year"])
+
 
 class Customer(models.Model):
     """A customer on stripe"""
@@ -50,6 +58,48 @@ class Customer(models.Model):
         help_text=_("The customer's corresponding ID on stripe"),
     )
 
+    # a copy of the customer's default card, so that it may be displayed without
+    # contacting stripe
+    default_source = models.CharField(
+        _("default source"),
+        max_length=255,
+        blank=True,
+        help_text=_("The ID of the customer's default payment source on stripe"),
+    )
+    card_brand = models.CharField(
+        _("card brand"),
+        max_length=20,
+        blank=True,
+        help_text=_("The brand of the default card, blank if there is no card"),
+    )
+    card_last4 = models.CharField(
+        _("card last four"),
+        max_length=4,
+        blank=True,
+        help_text=_("The last four digits of the default card"),
+    )
+    card_exp_month = models.PositiveSmallIntegerField(
+        _("card expiration month"),
+        null=True,
+        blank=True,
+        help_text=_("The expiration month of the default card"),
+    )
+    card_exp_year = models.PositiveSmallIntegerField(
+        _("card expiration year"),
+        null=True,
+        blank=True,
+        help_text=_("The expiration year of the default card"),
+    )
+    card_updated_at = models.DateTimeField(
+        _("card updated at"),
+        null=True,
+        blank=True,
+        help_text=_(
+            "When the card details were last copied from stripe - "
+            "blank if they never have been"
+        ),
+    )
+
     class Meta:
         unique_together = ("organization", "stripe_account")
 
@@ -64,9 +114,8 @@ class Customer(models.Model):
         # first try to find an existing stripe customer
         if self.customer_id:
             try:
-                stripe_customer = stripe.Customer.retrieve(
-                    self.customer_id,
-                    api_key=settings.STRIPE_SECRET_KEYS[self.stripe_account],
+                stripe_customer = stripe_cache.retrieve(
+                    stripe.Customer, self.customer_id, self.stripe_account
                 )
                 return stripe_customer
             except stripe.error.InvalidRequestError:
@@ -89,17 +138,22 @@ class Customer(models.Model):
             customer.save()
             return stripe_customer
 
-    @mproperty
+    @property
     def card(self):
-        """Retrieve the customer's default credit card on file, if there is one"""
-        if self.stripe_customer.default_source:
-            source = self.stripe_customer.sources.retrieve(
-                self.stripe_customer.default_source
+        """The customer's default credit card on file, if there is one
+
+        This is read from the local copy of the card only, and never from
+        stripe - customers whose card has never been copied may be backfilled
+        with the backfill_customer_cards command
+        """
+        if self.card_last4:
+            return Card(
+                id=self.default_source,
+                brand=self.card_brand,
+                last4=self.card_last4,
+                exp_month=self.card_exp_month,
+                exp_year=self.card_exp_year,
             )
-            if source.object == "card":
-                return source
-            else:
-                return None
         else:
             return None
 
@@ -110,10 +164,62 @@ class Customer(models.Model):
         else:
             return ""
 
+    def sync_card(self, stripe_customer=None, save=True):
+        """Copy the default card from the stripe customer"""
+        if stripe_customer is None:
+            stripe_customer = self.stripe_customer
+        default_source = stripe_customer.default_source
+        source = self.included_source(stripe_customer)
+        if default_source and source is None:
+            source = stripe.Customer.retrieve_source(
+                stripe_customer.id,
+                default_source,
+                api_key=settings.STRIPE_SECRET_KEYS[self.stripe_account],
+            )
+        self.set_card(default_source, source, save=save)
+
+    @staticmethod
+    def included_source(stripe_customer):
+        """The customer's default source, if it was included with the customer,
+        as it usually is, so it does not need to be fetched"""
+        default_source = stripe_customer.default_source
+        if not default_source:
+            return None
+        sources = getattr(getattr(stripe_customer, "sources", None), "data", [])
+        return next((s for s in sources if s.id == default_source), None)
+
+    def set_card(self, default_source, source, save=True):
+        """Set the local copy of the default card from a stripe source"""
+        self.default_source = default_source or ""
+        if source is not None and source.object == "card":
+            self.card_brand = source.brand
+            self.card_last4 = source.last4
+            self.card_exp_month = source.exp_month
+            self.card_exp_year = source.exp_year
+        else:
+            self.card_brand = ""
+            self.card_last4 = ""
+            self.card_exp_month = None
+            self.card_exp_year = None
+        self.card_updated_at = timezone.now()
+        if save and self.pk:
+            self.save(
+                update_fields=[
+                    "default_source",
+                    "card_brand",
+                    "card_last4",
+                    "card_exp_month",
+                    "card_exp_year",
+                    "card_updated_at",
+                ]
+            )
+
     def save_card(self, token):
         """Save a new default card"""
         self.stripe_customer.source = token
         self.stripe_customer.save()
+        self.invalidate_stripe_customer()
+        self.sync_card(self.stripe_customer)
 
     def remove_card(self):
         """Remove the default card"""
@@ -122,6 +228,14 @@ class Customer(models.Model):
             self.stripe_customer.default_source,
             api_key=settings.STRIPE_SECRET_KEYS[self.stripe_account],
         )
+        self.invalidate_stripe_customer()
+        # if stripe picks a new default source, we will be told by the
+        # customer.updated webhook
+        self.set_card(None, None)
+
+    def invalidate_stripe_customer(self):
+        """Remove the stripe customer from the shared cache after changing it"""
+        stripe_cache.invalidate(stripe.Customer, self.customer_id, self.stripe_account)
 
     def add_source(self, token):
         """Add a non-default source"""
@@ -160,6 +274,25 @@ class Subscription(models.Model):
 
     cancelled = models.BooleanField(default=False)
 
+    subscription_item_id = models.CharField(
+        _("subscription item id"),
+        max_length=255,
+        blank=True,
+        help_text=_("The ID on stripe of the subscription's item for its plan"),
+    )
+    quantity = models.PositiveIntegerField(
+        _("quantity"),
+        blank=True,
+        null=True,
+        help_text=_("The number of seats last set on the subscription on stripe"),
+    )
+    renewal_slot = models.PositiveSmallIntegerField(
+        _("renewal slot"),
+        blank=True,
+        null=True,
+        help_text=_("The time of day at which monthly resources are restored"),
+    )
+
     class Meta:
         unique_together = ("organization", "plan")
         ordering = ("plan",)
@@ -168,13 +301,24 @@ class Subscription(models.Model):
         plan_name = self.plan.name if self.plan else "Free"
         return f"Subscription: {self.organization} to {plan_name}"
 
+    def save(self, *args, **kwargs):
+        # pylint: disable=arguments-differ
+        if self._state.adding and self.renewal_slot is None:
+            self.renewal_slot = self.slot_for(self.organization.uuid)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def slot_for(uuid):
+        """The renewal slot for an organization, spreading renewals evenly across
+        the day - this depends only on the organization's UUID, so it is stable"""
+        return uuid.int % settings.RESTORE_SLOTS
+
     @mproperty
     def stripe_subscription(self):
         if self.subscription_id:
             try:
-                return stripe.Subscription.retrieve(
-                    self.subscription_id,
-                    api_key=settings.STRIPE_SECRET_KEYS[self.plan.stripe_account],
+                return stripe_cache.retrieve(
+                    stripe.Subscription, self.subscription_id, self.plan.stripe_account,
                 )
             except stripe.error.InvalidRequestError:  # pragma: no cover
                 return None
@@ -190,9 +334,8 @@ class Subscription(models.Model):
             )
             return
         if self.plan and not self.plan.free:
-            stripe_subscription = self.organization.customer(
-                self.plan.stripe_account
-            ).stripe_customer.subscriptions.create(
+            customer = self.organization.customer(self.plan.stripe_account)
+            stripe_subscription = customer.stripe_customer.subscriptions.create(
                 items=[
                     {
                         "plan": self.plan.stripe_id,
@@ -203,11 +346,14 @@ class Subscription(models.Model):
                 days_until_due=30 if self.plan.annual else None,
             )
             self.subscription_id = stripe_subscription.id
+            self.set_item(stripe_subscription)
+            customer.invalidate_stripe_customer()
 
     def cancel(self):
         if self.stripe_subscription:
             self.stripe_subscription.cancel_at_period_end = True
             self.stripe_subscription.save()
+            self.invalidate_stripe_subscription()
 
         self.cancelled = True
         self.save()
@@ -226,7 +372,10 @@ class Subscription(models.Model):
         elif not old_plan.free and plan.free:
             # cancel subscription on stripe
             self.stripe_subscription.delete()
+            self.invalidate_stripe_subscription()
             self.subscription_id = None
+            self.subscription_item_id = ""
+            self.quantity = None
         elif not old_plan.free and not plan.free:
             # modify plan
             self.stripe_modify()
@@ -235,25 +384,67 @@ class Subscription(models.Model):
 
     def stripe_modify(self):
         """Update stripe subscription to match local subscription"""
-        if self.stripe_subscription:
-            stripe.Subscription.modify(
-                self.subscription_id,
-                cancel_at_period_end=False,
-                items=[
-                    {
-                        # pylint: disable=unsubscriptable-object
-                        "id": self.stripe_subscription["items"]["data"][0].id,
-                        "plan": self.plan.stripe_id,
-                        "quantity": self.organization.max_users,
-                    }
-                ],
-                billing="send_invoice" if self.plan.annual else "charge_automatically",
-                days_until_due=30 if self.plan.annual else None,
-                api_key=settings.STRIPE_SECRET_KEYS[self.plan.stripe_account],
-            )
+        if not self.subscription_id:
+            return
+        item_id = self.subscription_item_id
+        if not item_id:
+            # the item ID has not been stored for this subscription yet
+            if not self.stripe_subscription:
+                return
+            # pylint: disable=unsubscriptable-object
+            item_id = self.stripe_subscription["items"]["data"][0].id
+        stripe_subscription = stripe.Subscription.modify(
+            self.subscription_id,
+            cancel_at_period_end=False,
+            items=[
+                {
+                    "id": item_id,
+                    "plan": self.plan.stripe_id,
+                    "quantity": self.organization.max_users,
+                }
+            ],
+            billing="send_invoice" if self.plan.annual else "charge_automatically",
+            days_until_due=30 if self.plan.annual else None,
+            api_key=settings.STRIPE_SECRET_KEYS[self.plan.stripe_account],
+        )
+        self.invalidate_stripe_subscription()
+        self.set_item(stripe_subscription)
+        if self.pk:
+            self.save(update_fields=["subscription_item_id", "quantity"])
+
+    def update_quantity(self):
+        """Update the number of seats on stripe to match the organization,
+        if it has changed"""
+        if self.quantity != self.organization.max_users:
+            self.stripe_modify()
+
+    def set_item(self, stripe_subscription):
+        """Store the plan's item from the stripe subscription, so it does not need
+        to be retrieved before modifying the subscription"""
+        item = stripe_subscription["items"]["data"][0]
+        self.subscription_item_id = item["id"]
+        self.quantity = item["quantity"]
+
+    def invalidate_stripe_subscription(self):
+        """Remove the stripe subscription from the shared cache after changing it"""
+        stripe_cache.invalidate(
+            stripe.Subscription, self.subscription_id, self.plan.stripe_account
+        )
+
+
+def send_subscriber_invalidations(**filters):
+    """Send cache invalidations for the organizations with subscriptions matching
+    `filters`, after their plan or its entitlements have changed"""
+    uuids = list(
+        Subscription.objects.filter(**filters)
+        .values_list("organization__uuid", flat=True)
+        .distinct()
+    )
+    if uuids:
+        send_cache_invalidations("organization", uuids)
 
 
-class Plan(models.Model):
+class Plan(ChangeTrackingMixin, models.Model):
     """Plans that organizations can subscribe to"""
 
     objects = PlanQuerySet.as_manager()
@@ -341,12 +532,37 @@ class Plan(models.Model):
         ),
     )
 
+    stripe_version = models.PositiveIntegerField(
+        _("stripe version"),
+        default=0,
+        editable=False,
+        help_text=_("How many times this plan has been replaced on stripe"),
+    )
+
+    # fields which determine the plan's price on stripe
+    pricing_fields = (
+        "minimum_users",
+        "base_price",
+        "price_per_user",
+        "annual",
+        "for_groups",
+    )
+    client_fields = ("slug",)
+
     class Meta:
         ordering = ("slug",)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # pylint: disable=arguments-differ
+        changed = not self._state.adding and self.has_changed(*self.client_fields)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if changed:
+                send_subscriber_invalidations(plan=self)
+
     @property
     def free(self):
         return self.base_price == 0 and self.price_per_user == 0
@@ -365,50 +581,73 @@ class Plan(models.Model):
 
     @property
     def stripe_id(self):
-        """Namespace the stripe ID to not conflict with previous plans we have made"""
+        """Namespace the stripe ID to not conflict with previous plans we have made,
+        and version it, as the plan is replaced on stripe when its pricing changes"""
+        if self.stripe_version:
+            return f"squarelet_plan_{self.slug}_v{self.stripe_version}"
         return f"squarelet_plan_{self.slug}"
 
     def make_stripe_plan(self):
         """Create the plan on stripe"""
         if not self.free:
             try:
-                # set up the pricing for groups and individuals
-                # convert dollar amounts to cents for stripe
-                if self.for_groups:
-                    kwargs = {
-                        "billing_scheme": "tiered",
-                        "tiers": [
-                            {
-                                "flat_amount": 100 * self.base_price,
-                                "up_to": self.minimum_users,
-                            },
-                            {"unit_amount": 100 * self.price_per_user, "up_to": "inf"},
-                        ],
-                        "tiers_mode": "graduated",
-                    }
-                else:
-                    kwargs = {
-                        "billing_scheme": "per_unit",
-                        "amount": 100 * self.base_price,
-                    }
-                stripe.Plan.create(
-                    id=self.stripe_id,
-                    currency="usd",
-                    interval="year" if self.annual else "month",
-                    product={"name": self.name, "unit_label": "Seats"},
-                    api_key=settings.STRIPE_SECRET_KEYS[self.stripe_account],
-                    **kwargs,
-                )
+                self.create_stripe_plan()
             except stripe.error.InvalidRequestError:  # pragma: no cover
                 # if the plan already exists, just skip
                 pass
 
-    def delete_stripe_plan(self):
-        """Remove a stripe plan"""
+    def create_stripe_plan(self):
+        """Create the plan on stripe, raising any errors from stripe"""
+        # set up the pricing for groups and individuals
+        # convert dollar amounts to cents for stripe
+        if self.for_groups:
+            kwargs = {
+                "billing_scheme": "tiered",
+                "tiers": [
+                    {"flat_amount": 100 * self.base_price, "up_to": self.minimum_users},
+                    {"unit_amount": 100 * self.price_per_user, "up_to": "inf"},
+                ],
+                "tiers_mode": "graduated",
+            }
+        else:
+            kwargs = {"billing_scheme": "per_unit", "amount": 100 * self.base_price}
+        stripe.Plan.create(
+            id=self.stripe_id,
+            currency="usd",
+            interval="year" if self.annual else "month",
+            product={"name": self.name, "unit_label": "Seats"},
+            api_key=settings.STRIPE_SECRET_KEYS[self.stripe_account],
+            **kwargs,
+        )
+
+    def update_stripe_plan(self):
+        """Replace the plan on stripe after its pricing has changed
+
+        Stripe does not allow changing the price of a plan, so a new plan is
+        created under the next version of the stripe ID, and only once it exists
+        is the plan switched over to it and the old plan removed.  Existing
+        subscriptions keep their price until they are modified.  Unlike creating
+        or deleting a plan, errors from stripe creating the new plan are raised,
+        leaving the old plan in place.  A plan which is now free is only removed.
+        """
+        old_stripe_id = self.stripe_id
+        if not self.free:
+            self.stripe_version += 1
+            try:
+                self.create_stripe_plan()
+            except stripe.error.StripeError:
+                self.stripe_version -= 1
+                raise
+            Plan.objects.filter(pk=self.pk).update(stripe_version=self.stripe_version)
+        self.delete_stripe_plan(old_stripe_id)
+
+    def delete_stripe_plan(self, stripe_id=None):
+        """Remove a stripe plan, by default the plan's current one"""
+        if stripe_id is None:
+            stripe_id = self.stripe_id
         try:
             plan = stripe.Plan.retrieve(
-                id=self.stripe_id,
-                api_key=settings.STRIPE_SECRET_KEYS[self.stripe_account],
+                id=stripe_id, api_key=settings.STRIPE_SECRET_KEYS[self.stripe_account]
             )
             # We also want to remove the associated product
             product = stripe.Product.retrieve(
@@ -462,6 +701,8 @@ class Charge(models.Model):
 
     class Meta:
         ordering = ("-created_at",)
+        # for paging through charges in the API
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return f"${self.amount / 100:.2f} charge to {self.organization.name}"
@@ -506,13 +747,75 @@ class Charge(models.Model):
             return [{"name": self.description, "price": self.amount_dollars}]
 
 
+class StripeEvent(models.Model):
+    """A log of every event received from the Stripe webhook
+
+    Events are recorded as they arrive, before they are acted on, so duplicate
+    deliveries are ignored and events which fail to process may be retried
+    """
+
+    event_id = models.CharField(
+        _("event id"),
+        max_length=255,
+        unique=True,
+        help_text=_("The stripe ID for the event"),
+    )
+    type = models.CharField(_("type"), max_length=255, help_text=_("The type of event"))
+    data = JSONField(_("data"), help_text=_("The event as received from stripe"))
+    stripe_account = models.PositiveSmallIntegerField(
+        _("stripe account"),
+        choices=StripeAccounts.choices,
+        default=StripeAccounts.muckrock,
+        help_text=_("Which company's stripe account sent this event"),
+    )
+    status = models.PositiveSmallIntegerField(
+        _("status"),
+        choices=StripeEventStatus.choices,
+        default=StripeEventStatus.pending,
+        help_text=_("Whether this event has been processed"),
+    )
+    attempts = models.PositiveSmallIntegerField(
+        _("attempts"),
+        default=0,
+        help_text=_("The number of times we have tried to process this event"),
+    )
+    error = models.TextField(
+        _("error"),
+        blank=True,
+        help_text=_("The error from the last failed attempt to process this event"),
+    )
+    created_at = AutoCreatedField(
+        _("created at"), help_text=_("When this event was received")
+    )
+    retry_at = models.DateTimeField(
+        _("retry at"),
+        default=timezone.now,
+        help_text=_("Do not try to process this event again before this time"),
+    )
+    processed_at = models.DateTimeField(
+        _("processed at"),
+        blank=True,
+        null=True,
+        help_text=_("When this event was processed"),
+    )
+
+    class Meta:
+        ordering = ("pk",)
+        indexes = [models.Index(fields=["status", "retry_at"])]
+
+    def __str__(self):
+        return f"Stripe Event: {self.type} {self.event_id}"
+
+
 def entitlement_slug(instance):
     return f"{instance.client.name}-{instance.name}"
 
 
-class Entitlement(models.Model):
+class Entitlement(ChangeTrackingMixin, models.Model):
     """Grants access to some service for a given client"""
 
+    client_fields = ("name", "slug", "description", "resources")
+
     name = models.CharField(
         _("name"), max_length=255, help_text=_("The entitlement's name")
     )
@@ -550,6 +853,14 @@ class Entitlement(models.Model):
     def __str__(self):
         return f"{self.client} - {self.name}"
 
+    def save(self, *args, **kwargs):
+        # pylint: disable=arguments-differ
+        changed = not self._state.adding and self.has_changed(*self.client_fields)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if changed:
+                send_subscriber_invalidations(plan__entitlements=self)
+
     @property
     def public(self):
         return self.plans.filter(public=True).exists()
@@ -24,7 +24,9 @@ class OrganizationQuerySet(models.QuerySet):
             return self
         elif user.is_authenticated:
             # other users may not see private organizations unless they are a member
-            return self.filter(Q(private=False) | Q(users=user)).distinct()
+            return self.filter(
+                Q(private=False) | Q(pk__in=user.memberships.values("organization"))
+            )
         else:
             # anonymous users may not see any private organizations
             return self.filter(private=False)
@@ -63,9 +65,8 @@ class PlanQuerySet(models.QuerySet):
         elif user.is_authenticated:
             return self.filter(
                 Q(public=True)
-                | Q(organizations__in=user.organizations.all())
-                | Q(private_organizations__in=user.organizations.all())
-            ).distinct()
+                | self._for_organizations(user.memberships.values("organization"))
+            )
         else:
             return self.filter(public=True)
 
@@ -83,11 +84,24 @@ class PlanQuerySet(models.QuerySet):
 
         # show public plans, the organizations current plan, and any custom plan
         # to which they have been granted explicit access
-        return queryset.filter(
-            Q(public=True)
-            | Q(organizations=organization)
-            | Q(private_organizations=organization)
-        ).distinct()
+        return queryset.filter(Q(public=True) | self._for_organizations([organization]))
+
+    def _for_organizations(self, organizations):
+        """Filter for plans which any of the organizations are subscribed to or
+        have been granted access to
+
+        This uses subqueries instead of joins, so no rows are repeated and the
+        queryset does not need to be made distinct
+        """
+        return Q(
+            pk__in=self.model.organizations.through.objects.filter(
+                organization__in=organizations
+            ).values("plan")
+        ) | Q(
+            pk__in=self.model.private_organizations.through.objects.filter(
+                organization__in=organizations
+            ).values("plan")
+        )
 
     def free(self):
         """Free plans"""
@@ -102,9 +116,9 @@ class EntitlementQuerySet(models.QuerySet):
         if user.is_staff:
             return self
         elif user.is_authenticated:
-            return self.filter(Q(plans__public=True) | Q(client__owner=user)).distinct()
+            return self.filter(self._in_plans(public=True) | Q(client__owner=user))
         else:
-            return self.filter(plans__public=True)
+            return self.filter(self._in_plans(public=True))
 
     def get_public(self):
         return self.get_viewable(AnonymousUser())
@@ -112,8 +126,12 @@ class EntitlementQuerySet(models.QuerySet):
     def get_subscribed(self, user):
         if user.is_authenticated:
             return self.filter(
-                plans__organizations__in=user.organizations.all()
-            ).distinct()
+                self._in_plans(
+                    subscriptions__organization__in=user.memberships.values(
+                        "organization"
+                    )
+                )
+            )
         else:
             return self.none()
 
@@ -123,6 +141,15 @@ class EntitlementQuerySet(models.QuerySet):
         else:
             return self.none()
 
+    def _in_plans(self, **plan_filters):
+        """Filter for entitlements in any plan matching `plan_filters`, using a
+        subquery so the queryset does not need to be made distinct"""
+        return Q(
+            pk__in=self.model.plans.through.objects.filter(
+                **{f"plan__{k}": v for k, v in plan_filters.items()}
+            ).values("entitlement")
+        )
+
 
 class InvitationQuerySet(models.QuerySet):
     def get_open(self):
@@ -150,7 +177,7 @@ class ChargeQuerySet(models.QuerySet):
         if token:
             source = customer.add_source(token)
         else:
-            source = customer.card
+            source = customer.card.id if customer.card else None
 
         stripe_charge = stripe.Charge.create(
             amount=amount,
@@ -194,10 +221,24 @@ class SubscriptionQuerySet(models.QuerySet):
             organization=organization,
             plan=plan,
             update_on=date.today() + relativedelta(months=1),
+            renewal_slot=self.model.slot_for(organization.uuid),
         )
         subscription.start()
         subscription.save()
         return subscription
 
+    def assign_renewal_slots(self):
+        """Set the renewal slot for each subscription from its organization,
+        returning how many were changed"""
+        slots = {}
+        for pk, slot, uuid in self.values_list(
+            "pk", "renewal_slot", "organization__uuid"
+        ):
+            if slot != self.model.slot_for(uuid):
+                slots.setdefault(self.model.slot_for(uuid), []).append(pk)
+        for slot, pks in slots.items():
+            self.model.objects.filter(pk__in=pks).update(renewal_slot=slot)
+        return sum(len(pks) for pks in slots.values())
+
     def muckrock(self):
         return self.filter(plan__stripe_account=StripeAccounts.muckrock)
@@ -0,0 +1,307 @@
+"""Reconcile our copies of customers, subscriptions and charges with Stripe
+
+Each Stripe account is walked through Stripe's list endpoints a page at a time,
+and compared against our rows for that account in bulk.  Differences are counted
+as drift, and fixed with bulk updates and inserts, committed a page at a time,
+along with cache invalidations for the organizations whose data changed.
+Accounts are reconciled concurrently, sharing a limit on the rate of requests to
+Stripe.
+"""
+
+# Django
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.timezone import get_current_timezone
+
+# Standard Library
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Third Party
+import stripe
+
+# Squarelet
+from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.organizations.models import Charge, Customer, Subscription
+from squarelet.organizations.tasks import charge_description
+
+PAGE_SIZE = 100
+
+PARTS = ("customers", "subscriptions", "charges")
+
+CARD_FIELDS = (
+    "default_source",
+    "card_brand",
+    "card_last4",
+    "card_exp_month",
+    "card_exp_year",
+)
+
+
+def bulk_update(objs, fields):
+    """Save `fields` on many objects of the same model with one query per batch
+
+    Each field is set with a CASE over the primary keys
+    """
+    for i in range(0, len(objs), PAGE_SIZE):
+        batch = objs[i : i + PAGE_SIZE]
+        # pylint: disable=protected-access
+        model = type(batch[0])
+        updates = {
+            field: Case(
+                *[When(pk=obj.pk, then=Value(getattr(obj, field))) for obj in batch],
+                output_field=model._meta.get_field(field),
+            )
+            for field in fields
+        }
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+class RateLimiter:
+    """Space out calls across all threads to at most `rate` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Reconciler:
+    """Reconcile one Stripe account"""
+
+    def __init__(self, stripe_account, limiter, since, dry_run=False):
+        self.stripe_account = stripe_account
+        self.api_key = settings.STRIPE_SECRET_KEYS[stripe_account]
+        self.limiter = limiter
+        self.since = since
+        self.dry_run = dry_run
+        self.drift = Counter()
+        self.requests = 0
+        self.objects = 0
+        # products retrieved for charge descriptions
+        self.products = {}
+
+    def request(self, method, *args, **kwargs):
+        """Call Stripe within the rate limit"""
+        self.limiter.wait()
+        self.requests += 1
+        return method(*args, api_key=self.api_key, **kwargs)
+
+    def pages(self, resource, **params):
+        """Iterate over every page of objects from a list endpoint"""
+        starting_after = None
+        while True:
+            page = self.request(
+                resource.list, limit=PAGE_SIZE, starting_after=starting_after, **params,
+            )
+            self.objects += len(page.data)
+            if page.data:
+                yield page.data
+            if not page.has_more or not page.data:
+                return
+            starting_after = page.data[-1].id
+
+    @contextmanager
+    def atomic(self):
+        """Commit the changes for one page, unless this is a dry run"""
+        with transaction.atomic():
+            yield
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+    def reconcile(self, parts=PARTS):
+        for part in parts:
+            getattr(self, f"reconcile_{part}")()
+
+    def reconcile_customers(self):
+        """Update our copies of each customer's default card"""
+        customers = {
+            c.customer_id: c
+            for c in Customer.objects.filter(
+                stripe_account=self.stripe_account, customer_id__isnull=False
+            ).annotate(organization_uuid=F("organization__uuid"))
+        }
+        updated = 0
+        for page in self.pages(stripe.Customer):
+            changed = []
+            uuids = set()
+            for stripe_customer in page:
+                customer = customers.pop(stripe_customer.id, None)
+                if customer is None:
+                    continue
+                card = tuple(getattr(customer, field) for field in CARD_FIELDS)
+                copied = customer.card_updated_at is not None
+                source = customer.included_source(stripe_customer)
+                if stripe_customer.default_source and source is None:
+                    source = self.request(
+                        stripe.Customer.retrieve_source,
+                        stripe_customer.id,
+                        stripe_customer.default_source,
+                    )
+                customer.set_card(stripe_customer.default_source, source, save=False)
+                if card != tuple(getattr(customer, field) for field in CARD_FIELDS):
+                    updated += 1
+                    changed.append(customer)
+                    uuids.add(customer.organization_uuid)
+                elif not copied:
+                    # record that the card has been copied, even if it is blank
+                    changed.append(customer)
+            with self.atomic():
+                bulk_update(changed, CARD_FIELDS + ("card_updated_at",))
+                if uuids:
+                    send_cache_invalidations("organization", list(uuids))
+        self.drift["customers_missing"] += len(customers)
+        self.drift["cards_updated"] += updated
+
+    def reconcile_subscriptions(self):
+        """Update which subscriptions are set to cancel, and our copies of their
+        items"""
+        subscriptions = {
+            s.subscription_id: s
+            for s in Subscription.objects.filter(
+                plan__stripe_account=self.stripe_account, subscription_id__isnull=False
+            ).annotate(organization_uuid=F("organization__uuid"))
+        }
+        for page in self.pages(stripe.Subscription, status="all"):
+            changed = []
+            for stripe_subscription in page:
+                subscription = subscriptions.pop(stripe_subscription.id, None)
+                if subscription is None:
+                    continue
+                if stripe_subscription.status == "canceled":
+                    # ending a subscription changes the organization's plan,
+                    # which should be looked at by a person
+                    self.drift["subscriptions_ended"] += 1
+                    continue
+                item = (subscription.subscription_item_id, subscription.quantity)
+                subscription.set_item(stripe_subscription)
+                item_changed = item != (
+                    subscription.subscription_item_id,
+                    subscription.quantity,
+                )
+                cancel_changed = (
+                    subscription.cancelled != stripe_subscription.cancel_at_period_end
+                )
+                subscription.cancelled = stripe_subscription.cancel_at_period_end
+                self.drift["subscription_items_updated"] += int(item_changed)
+                self.drift["subscriptions_updated"] += int(cancel_changed)
+                if item_changed or cancel_changed:
+                    changed.append(subscription)
+            with self.atomic():
+                bulk_update(changed, ["cancelled", "subscription_item_id", "quantity"])
+                uuids = {subscription.organization_uuid for subscription in changed}
+                if uuids:
+                    send_cache_invalidations("organization", list(uuids))
+        self.drift["subscriptions_missing"] += len(subscriptions)
+
+    def reconcile_charges(self):
+        """Record any charges made since `since` which we missed"""
+        organizations = dict(
+            Customer.objects.filter(stripe_account=self.stripe_account).values_list(
+                "customer_id", "organization_id"
+            )
+        )
+        charge_ids = set(
+            Charge.objects.filter(
+                stripe_account=self.stripe_account, created_at__gte=self.since
+            ).values_list("charge_id", flat=True)
+        )
+        created = 0
+        for page in self.pages(
+            stripe.Charge,
+            created={"gte": int(self.since.timestamp())},
+            expand=["data.invoice"],
+        ):
+            missed = []
+            for stripe_charge in page:
+                if stripe_charge.id in charge_ids:
+                    charge_ids.discard(stripe_charge.id)
+                    continue
+                if (
+                    stripe_charge.status != "succeeded"
+                    or stripe_charge.customer not in organizations
+                ):
+                    continue
+                if stripe_charge.invoice:
+                    self.expand_product(stripe_charge.invoice)
+                description = charge_description(
+                    stripe_charge, stripe_charge.invoice, self.stripe_account
+                )
+                if description is None:
+                    continue
+                missed.append(
+                    Charge(
+                        charge_id=stripe_charge.id,
+                        amount=stripe_charge.amount,
+                        fee_amount=int(stripe_charge.metadata.get("fee amount", 0)),
+                        organization_id=organizations[stripe_charge.customer],
+                        created_at=datetime.fromtimestamp(
+                            stripe_charge.created, tz=get_current_timezone()
+                        ),
+                        stripe_account=self.stripe_account,
+                        description=description,
+                    )
+                )
+            created += len(missed)
+            with self.atomic():
+                Charge.objects.bulk_create(missed)
+        # charges we have which stripe does not - these are reported, not removed
+        self.drift["charges_unknown"] += len(charge_ids)
+        self.drift["charges_created"] += created
+
+    def expand_product(self, invoice):
+        """Retrieve the product of an invoice's plan within the rate limit, if it
+        is needed for the charge's description and was not expanded"""
+        plan = invoice["lines"]["data"][0]["plan"]
+        if (
+            "name" in plan
+            or isinstance(plan["product"], dict)
+            or plan["id"].startswith(("donate", "crowdfund"))
+        ):
+            return
+        if plan["product"] not in self.products:
+            self.products[plan["product"]] = self.request(
+                stripe.Product.retrieve, plan["product"]
+            )
+        plan["product"] = self.products[plan["product"]]
+
+
+def _reconcile(reconciler, parts):
+    try:
+        reconciler.reconcile(parts)
+    finally:
+        # each thread opens its own database connection
+        connection.close()
+
+
+def reconcile(workers=2, rate=20, days=30, dry_run=False, parts=PARTS):
+    """Reconcile every configured Stripe account
+
+    `parts` are the types of objects to reconcile.
+    Returns the finished Reconciler for each account
+    """
+    limiter = RateLimiter(rate)
+    since = timezone.now() - timedelta(days=days)
+    reconcilers = [
+        Reconciler(stripe_account, limiter, since, dry_run)
+        for stripe_account, api_key in enumerate(settings.STRIPE_SECRET_KEYS)
+        if api_key
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(_reconcile, r, parts) for r in reconcilers]:
+            future.result()
+    return reconcilers
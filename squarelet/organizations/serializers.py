@@ -1,4 +1,5 @@
 # Django
+from django.db.models import Manager
 from django.db.models.expressions import F
 
 # Third Party
@@ -12,6 +13,7 @@ from rest_framework.exceptions import APIException
 from squarelet.organizations.choices import StripeAccounts
 from squarelet.organizations.models import (
     Charge,
+    Customer,
     Entitlement,
     Invitation,
     Membership,
@@ -21,6 +23,99 @@ from squarelet.organizations.models import (
 )
 
 
+def get_entitlements_client(context):
+    """The client whose entitlements should be serialized"""
+    client = context.get("client")
+    if not client:
+        request = context.get("request")
+        if request and hasattr(request, "auth") and request.auth:
+            client = request.auth.client
+    return client
+
+
+def resolve_entitlements(context, organization_ids):
+    """Fetch the client's entitlements for all of the given organizations in a
+    single query, and store them in the serializer context keyed by organization
+    ID.  Organizations which have already been resolved are skipped, so list
+    serializers may resolve a whole page up front and the individual
+    organization serializers will not need to query again.
+    """
+    resolved = context.setdefault("entitlements", {})
+    organization_ids = [pk for pk in organization_ids if pk not in resolved]
+    client = get_entitlements_client(context)
+    if not organization_ids or not client:
+        return
+    for pk in organization_ids:
+        resolved[pk] = []
+    entitlements = client.entitlements.filter(
+        plans__subscriptions__organization__in=organization_ids
+    ).values(
+        "name",
+        "slug",
+        "description",
+        "resources",
+        organization_id=F("plans__subscriptions__organization"),
+        update_on=F("plans__subscriptions__update_on"),
+    )
+    for entitlement in entitlements:
+        resolved[entitlement["organization_id"]].append(
+            {
+                "name": entitlement["name"],
+                "slug": entitlement["slug"],
+                "description": entitlement["description"],
+                "resources": entitlement["resources"],
+                "update_on": entitlement["update_on"],
+            }
+        )
+
+
+def resolve_plans(context, organization_ids):
+    """Fetch the plan and card for all of the given organizations, and store
+    them in the serializer context keyed by organization ID, in the same way as
+    `resolve_entitlements`
+    """
+    plans = context.setdefault("plans", {})
+    cards = context.setdefault("cards", {})
+    organization_ids = [pk for pk in organization_ids if pk not in plans]
+    if not organization_ids:
+        return
+    for pk in organization_ids:
+        plans[pk] = "free"
+        cards[pk] = ""
+    # subscriptions are ordered by plan, so the first one for each organization
+    # is the same plan as `Organization.plan`
+    subscriptions = Subscription.objects.muckrock().filter(
+        organization__in=organization_ids
+    )
+    seen = set()
+    for organization_id, slug in subscriptions.values_list(
+        "organization_id", "plan__slug"
+    ):
+        if organization_id not in seen:
+            seen.add(organization_id)
+            plans[organization_id] = slug
+    for customer in Customer.objects.filter(
+        organization__in=organization_ids, stripe_account=StripeAccounts.muckrock
+    ):
+        cards[customer.organization_id] = customer.card_display
+
+
+def resolve_organizations(context, organization_ids):
+    """Fetch everything the organization serializer needs for all of the given
+    organizations, with a constant number of queries"""
+    resolve_plans(context, organization_ids)
+    resolve_entitlements(context, organization_ids)
+
+
+class OrganizationListSerializer(serializers.ListSerializer):
+    """Resolve the plans and entitlements for all organizations at once"""
+
+    def to_representation(self, data):
+        organizations = data.all() if isinstance(data, Manager) else data
+        resolve_organizations(self.context, [o.pk for o in organizations])
+        return super().to_representation(organizations)
+
+
 class OrganizationSerializer(serializers.ModelSerializer):
     uuid = serializers.UUIDField(required=False)
     # remove plan once all clients are updated to handle entitlements
@@ -48,39 +143,45 @@ class OrganizationSerializer(serializers.ModelSerializer):
             "avatar_url",
             "update_on",
         )
+        list_serializer_class = OrganizationListSerializer
 
     def get_plan(self, obj):
+        if obj.pk in self.context.get("plans", {}):
+            return self.context["plans"][obj.pk]
         return obj.plan.slug if obj.plan else "free"
 
     def get_update_on(self, _obj):
         return None
 
     def get_entitlements(self, obj):
-        client = self.context.get("client")
-        if not client:
-            request = self.context.get("request")
-            if request and hasattr(request, "auth") and request.auth:
-                client = request.auth.client
-
-        if client:
-            return list(
-                client.entitlements.filter(plans__organizations=obj)
-                .annotate(update_on=F("plans__subscriptions__update_on"))
-                .values("name", "slug", "description", "resources", "update_on")
-            )
+        if get_entitlements_client(self.context):
+            resolve_entitlements(self.context, [obj.pk])
+            return self.context["entitlements"][obj.pk]
         return []
 
     def get_card(self, obj):
-        # this can be slow - goes to stripe for customer/card info - cache this
+        if obj.pk in self.context.get("cards", {}):
+            return self.context["cards"][obj.pk]
         return obj.customer(StripeAccounts.muckrock).card_display
 
 
+class MembershipListSerializer(serializers.ListSerializer):
+    """Resolve the plans and entitlements for all memberships' organizations at
+    once"""
+
+    def to_representation(self, data):
+        memberships = data.all() if isinstance(data, Manager) else data
+        resolve_organizations(self.context, [m.organization_id for m in memberships])
+        return super().to_representation(memberships)
+
+
 class MembershipSerializer(serializers.ModelSerializer):
     organization = OrganizationSerializer()
 
     class Meta:
         model = Membership
         fields = ("organization", "admin")
+        list_serializer_class = MembershipListSerializer
 
     def to_representation(self, instance):
         """Move fields from organization to membership representation."""
@@ -1,9 +1,15 @@
 # Django
+from django.db import transaction
 from django.db.models import signals
 from django.dispatch import receiver
 
 # Squarelet
-from squarelet.organizations.models import Plan
+from squarelet.organizations.middleware import clear_membership_map
+from squarelet.organizations.models import (
+    Membership,
+    Plan,
+    send_subscriber_invalidations,
+)
 
 
 @receiver(
@@ -12,10 +18,14 @@ from squarelet.organizations.models import Plan
     dispatch_uid="squarelet.organizations.signals.make_stripe_plan",
 )
 def make_stripe_plan(sender, instance, created, raw, using, update_fields, **kwargs):
-    """Create a stripe plan on plan creation"""
+    """Create a stripe plan on plan creation, or replace it if its pricing
+    changes"""
     # pylint: disable=unused-argument
     if created:
         instance.make_stripe_plan()
+    elif instance.has_changed(*instance.pricing_fields):
+        # stripe is only changed once the new pricing has been committed
+        transaction.on_commit(instance.update_stripe_plan)
 
 
 @receiver(
@@ -27,3 +37,34 @@ def delete_stripe_plan(sender, instance, using, **kwargs):
     """Create a stripe plan on plan creation"""
     # pylint: disable=unused-argument
     instance.delete_stripe_plan()
+
+
+@receiver(
+    [signals.post_save, signals.post_delete],
+    sender=Membership,
+    dispatch_uid="squarelet.organizations.signals.clear_memberships",
+)
+def clear_memberships(sender, instance, **kwargs):
+    """Reload the user's memberships for permission checks after they change"""
+    # pylint: disable=unused-argument
+    clear_membership_map(instance.user_id)
+
+
+@receiver(
+    signals.m2m_changed,
+    sender=Plan.entitlements.through,
+    dispatch_uid="squarelet.organizations.signals.plan_entitlements_changed",
+)
+def plan_entitlements_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """The organizations subscribed to a plan have different entitlements when
+    entitlements are added to or removed from it"""
+    # pylint: disable=unused-argument
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        send_subscriber_invalidations(plan=instance)
+    elif action == "pre_clear":
+        # the entitlement is being removed from all of its plans
+        send_subscriber_invalidations(plan__entitlements=instance)
+    else:
+        send_subscriber_invalidations(plan__in=pk_set)
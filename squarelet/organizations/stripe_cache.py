@@ -0,0 +1,161 @@
+"""A cache of objects retrieved from Stripe, shared by all processes
+
+Customers and subscriptions are retrieved from Stripe by nearly every request
+and task which deals with payments.  They are cached for a short time, keyed by
+Stripe account and object ID.  Our own changes to an object and Stripe webhooks
+about it remove it from the cache.  Hits and misses are counted per object type,
+so we can see how many calls to Stripe are being saved.
+
+Product and plan names almost never change, and are needed for every charge
+receipt, so each process also keeps its own copy of the names it has seen.
+"""
+
+# Django
+from django.conf import settings
+from django.core.cache import cache
+
+# Standard Library
+import threading
+import time
+
+# Third Party
+import stripe
+
+_names_lock = threading.Lock()
+_names = {}
+
+
+def _cache_key(resource, object_id, stripe_account):
+    return f"stripe:{stripe_account}:{resource.OBJECT_NAME}:{object_id}"
+
+
+def _stats_key(resource, result):
+    return f"stripe:stats:{resource.OBJECT_NAME}:{result}"
+
+
+def _to_values(value):
+    """Convert a stripe object, including any nested in lists, to plain values"""
+    if isinstance(value, dict):
+        return {key: _to_values(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_values(item) for item in value]
+    return value
+
+
+def _count(resource, result):
+    key = _stats_key(resource, result)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def retrieve(resource, object_id, stripe_account):
+    """Retrieve an object from Stripe, using the cached copy if there is one
+
+    `resource` is the stripe class, such as `stripe.Customer`
+    """
+    api_key = settings.STRIPE_SECRET_KEYS[stripe_account]
+    if not settings.STRIPE_CACHE_TIMEOUT:
+        return resource.retrieve(object_id, api_key=api_key)
+
+    key = _cache_key(resource, object_id, stripe_account)
+    values = cache.get(key)
+    if values is not None:
+        _count(resource, "hits")
+        return resource.construct_from(values, api_key)
+
+    _count(resource, "misses")
+    stripe_object = resource.retrieve(object_id, api_key=api_key)
+    # store the plain values, so the API key is not stored with them
+    cache.set(key, _to_values(stripe_object), settings.STRIPE_CACHE_TIMEOUT)
+    return stripe_object
+
+
+def invalidate(resource, object_id, stripe_account):
+    """Remove an object from the cache after it has been changed"""
+    if object_id:
+        cache.delete(_cache_key(resource, object_id, stripe_account))
+
+
+def invalidate_event(event, stripe_account):
+    """Remove any objects which a Stripe webhook event tells us have changed"""
+    if not event["type"].startswith("customer."):
+        return
+    data = event.get("data", {}).get("object", {})
+    if data.get("object") == "customer":
+        invalidate(stripe.Customer, data.get("id"), stripe_account)
+    else:
+        # subscriptions and sources belong to a customer, which includes them
+        invalidate(stripe.Customer, data.get("customer"), stripe_account)
+    if data.get("object") == "subscription":
+        invalidate(stripe.Subscription, data.get("id"), stripe_account)
+
+
+def stats(resources=(stripe.Customer, stripe.Subscription)):
+    """The hit and miss counts for each type of object"""
+    keys = {
+        (resource.OBJECT_NAME, result): _stats_key(resource, result)
+        for resource in resources
+        for result in ("hits", "misses")
+    }
+    counts = cache.get_many(keys.values())
+    results = {}
+    for (name, result), key in keys.items():
+        results.setdefault(name, {})[result] = counts.get(key, 0)
+    return results
+
+
+def reset_stats(resources=(stripe.Customer, stripe.Subscription)):
+    cache.delete_many(
+        [
+            _stats_key(resource, result)
+            for resource in resources
+            for result in ("hits", "misses")
+        ]
+    )
+
+
+def _get_name(key):
+    with _names_lock:
+        entry = _names.get(key)
+        if entry is None:
+            return None
+        stored_at, name = entry
+        if time.monotonic() - stored_at >= settings.STRIPE_NAME_CACHE_TIMEOUT:
+            del _names[key]
+            return None
+        return name
+
+
+def _set_name(key, name):
+    if settings.STRIPE_NAME_CACHE_TIMEOUT:
+        with _names_lock:
+            _names[key] = (time.monotonic(), name)
+
+
+def clear_names():
+    with _names_lock:
+        _names.clear()
+
+
+def plan_name(plan, stripe_account):
+    """The name of a plan from an invoice line
+
+    Plans from older API versions have their own name, otherwise it is the name
+    of the plan's product, which may have been expanded or may be an ID which
+    needs to be retrieved
+    """
+    if "name" in plan:
+        return plan["name"]
+    product = plan["product"]
+    if isinstance(product, dict):
+        _set_name((stripe_account, product["id"]), product["name"])
+        return product["name"]
+    name = _get_name((stripe_account, product))
+    if name is None:
+        name = stripe.Product.retrieve(
+            product, api_key=settings.STRIPE_SECRET_KEYS[stripe_account]
+        )["name"]
+        _set_name((stripe_account, product), name)
+    return name
@@ -0,0 +1,108 @@
+"""The HTTP client used for all calls to Stripe
+
+Unless it is given a client, the Stripe library creates a new one, with a new
+session, for every call - so every call opens a new connection.  We install one
+client for the whole process instead, which keeps connections to Stripe open in
+a pool, retries failed calls where it is safe to do so, and times every call.
+
+Calls which could not connect are retried for every method, as Stripe never
+received them.  Error responses from Stripe are only retried for GET and
+DELETE requests.
+"""
+
+# Django
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Standard Library
+import logging
+import time
+from urllib.parse import urlsplit
+
+# Third Party
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def endpoint(url):
+    """The API endpoint for a URL, with object IDs removed, so calls may be
+    grouped together - /v1/customers/cus_123/sources becomes
+    /v1/customers/:id/sources"""
+    version, *segments = urlsplit(url).path.strip("/").split("/")
+    # after the version, paths alternate between a collection and an ID
+    return "/".join(
+        ["", version]
+        + [":id" if i % 2 else segment for i, segment in enumerate(segments)]
+    )
+
+
+class TimedRequestsClient(stripe.http_client.RequestsClient):
+    """A Stripe HTTP client which reports how long each call takes"""
+
+    def request(self, method, url, headers, post_data=None):
+        start = time.perf_counter()
+        status_code = None
+        try:
+            content, status_code, response_headers = super().request(
+                method, url, headers, post_data
+            )
+            return content, status_code, response_headers
+        finally:
+            record_call(method, endpoint(url), status_code, time.perf_counter() - start)
+
+
+def record_call(method, path, status_code, elapsed):
+    """Log a call to Stripe, and pass it on to the metrics hook if there is one
+
+    `status_code` is None if no response was received
+    """
+    if elapsed >= settings.STRIPE_SLOW_CALL:
+        logger.warning(
+            "Slow Stripe call: %s %s %s %.3fs", method, path, status_code, elapsed
+        )
+    else:
+        logger.debug("Stripe call: %s %s %s %.3fs", method, path, status_code, elapsed)
+    if settings.STRIPE_METRICS_HOOK:
+        try:
+            import_string(settings.STRIPE_METRICS_HOOK)(
+                method, path, status_code, elapsed
+            )
+        except Exception:  # pylint: disable=broad-except
+            # metrics must never break a payment
+            logger.exception("Error in Stripe metrics hook")
+
+
+def make_session():
+    """A session which keeps a pool of connections to Stripe open"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.STRIPE_POOL_SIZE,
+        max_retries=Retry(
+            total=settings.STRIPE_MAX_RETRIES,
+            # the request was never sent, so this is safe for all methods
+            connect=settings.STRIPE_MAX_RETRIES,
+            read=0,
+            status=settings.STRIPE_MAX_RETRIES,
+            status_forcelist=RETRY_STATUSES,
+            method_whitelist=frozenset(["GET", "DELETE"]),
+            backoff_factor=0.5,
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure():
+    """Install our client for all calls to Stripe in this process"""
+    stripe.default_http_client = TimedRequestsClient(
+        timeout=settings.STRIPE_TIMEOUT, session=make_session()
+    )
@@ -2,12 +2,17 @@
 from celery.schedules import crontab
 from celery.task import periodic_task, task
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.timezone import get_current_timezone
 from django.utils.translation import ugettext_lazy as _
 
 # Standard Library
 import logging
-from datetime import date, datetime
+import time
+from datetime import date, datetime, timedelta
 
 # Third Party
 import stripe
@@ -16,36 +21,172 @@ import stripe
 from squarelet.core.mail import ORG_TO_ADMINS, send_mail
 from squarelet.core.models import Interval
 from squarelet.oidc.middleware import send_cache_invalidations
-from squarelet.organizations.choices import StripeAccounts
-from squarelet.organizations.models import Charge, Organization, Subscription
+from squarelet.organizations import stripe_cache
+from squarelet.organizations.choices import StripeAccounts, StripeEventStatus
+from squarelet.organizations.models import (
+    Charge,
+    Customer,
+    Organization,
+    StripeEvent,
+    Subscription,
+)
 
 logger = logging.getLogger(__name__)
 
 
 @periodic_task(
-    run_every=crontab(hour=0, minute=5),
+    run_every=crontab(minute=5),
     name="squarelet.organizations.tasks.restore_organizations",
 )
-def restore_organization():
-    """Monthly update of organizations subscriptions"""
-    subscriptions = Subscription.objects.filter(update_on__lte=date.today())
+def restore_organization(slot=None):
+    """Monthly update of organizations subscriptions
+
+    Subscriptions are renewed in the slot assigned to their organization, so
+    renewals - and the cache invalidations they send - are spread over the day.
+    This runs hourly, and by default renews the slot for the current hour.
+    Earlier slots are included, to catch up on any missed runs, and the last
+    slot of the day renews everything still due.
+
+    Due subscriptions are processed in chunks ordered by primary key, each in its
+    own transaction, so locks are only held on one chunk at a time.  Restoring a
+    subscription moves its update date forward, so a run which fails partway
+    through can simply be run again - the checkpoint lets it skip straight to
+    where it stopped.  The checkpoint is cleared once a run finishes, so later
+    runs pick up subscriptions which have become due since.
+    """
+    today = date.today()
+    if slot is None:
+        slot = timezone.localtime().hour * settings.RESTORE_SLOTS // 24
+    due = Subscription.objects.filter(update_on__lte=today)
+    if slot < settings.RESTORE_SLOTS - 1:
+        due = due.filter(renewal_slot__lte=slot)
+    checkpoint_key = f"organizations:restore:{today.isoformat()}:{slot}"
+    checkpoint = cache.get(checkpoint_key) or {"last_pk": 0, "chunks": 0, "total": 0}
+    if checkpoint["last_pk"]:
+        logger.info(
+            "Resuming subscription restore for slot %d after %d",
+            slot,
+            checkpoint["last_pk"],
+        )
+
+    while True:
+        start = time.perf_counter()
+        with transaction.atomic():
+            subscriptions = list(
+                due.filter(pk__gt=checkpoint["last_pk"])
+                .select_for_update(of=("self",))
+                .order_by("pk")
+                .values_list("pk", "cancelled", "organization__uuid")[
+                    : settings.RESTORE_CHUNK_SIZE
+                ]
+            )
+            if not subscriptions:
+                break
+            # delete cancelled subscriptions first
+            Subscription.objects.filter(
+                pk__in=[pk for pk, cancelled, _ in subscriptions if cancelled]
+            ).delete()
+            Subscription.objects.filter(
+                pk__in=[pk for pk, cancelled, _ in subscriptions if not cancelled]
+            ).update(update_on=today + Interval("1 month"))
+            # sent when this chunk commits
+            send_cache_invalidations(
+                "organization", [uuid for _, _, uuid in subscriptions]
+            )
+
+        checkpoint["last_pk"] = subscriptions[-1][0]
+        checkpoint["chunks"] += 1
+        checkpoint["total"] += len(subscriptions)
+        cache.set(checkpoint_key, checkpoint, timeout=2 * 24 * 60 * 60)
+        logger.info(
+            "Restored slot %d chunk %d: %d subscriptions in %.3fs",
+            slot,
+            checkpoint["chunks"],
+            len(subscriptions),
+            time.perf_counter() - start,
+        )
+
+    cache.delete(checkpoint_key)
+    logger.info(
+        "Restored %d subscriptions for slot %d in %d chunks",
+        checkpoint["total"],
+        slot,
+        checkpoint["chunks"],
+    )
+
+
+def retrieve_invoice(invoice_id, stripe_account=StripeAccounts.muckrock):
+    """Retrieve an invoice from stripe, with its plans' products expanded, so
+    their names do not need to be retrieved separately"""
+    return stripe.Invoice.retrieve(
+        invoice_id,
+        expand=["lines.data.plan.product"],
+        api_key=settings.STRIPE_SECRET_KEYS[stripe_account],
+    )
+
+
+def retrieve_invoices(charges_data, stripe_account=StripeAccounts.muckrock):
+    """Retrieve the invoices needed to handle a batch of charges from one stripe
+    account at once
+
+    Each invoice is retrieved once, and only for charges we have not already
+    recorded.  Invoices which can not be retrieved are left out, to be retried
+    by the charge's own handler.
+    """
+    if not charges_data:
+        return {}
+    recorded = set(
+        Charge.objects.filter(
+            charge_id__in=[charge_data["id"] for charge_data in charges_data]
+        ).values_list("charge_id", flat=True)
+    )
+    invoice_ids = {
+        charge_data["invoice"]
+        for charge_data in charges_data
+        if charge_data["customer"]
+        and charge_data["invoice"]
+        and charge_data["id"] not in recorded
+    }
+    invoices = {}
+    for invoice_id in sorted(invoice_ids):
+        try:
+            invoices[invoice_id] = retrieve_invoice(invoice_id, stripe_account)
+        except stripe.error.StripeError as exc:
+            logger.warning("Error retrieving invoice %s: %s", invoice_id, exc)
+    return invoices
+
 
-    # convert to a list so it can be serialized by celery
-    uuids = list(subscriptions.values_list("organization__uuid", flat=True))
+def charge_description(charge_data, invoice, stripe_account=StripeAccounts.muckrock):
+    """The description to record for a charge, or None if we do not record it
 
-    # delete cancelled subscriptions first
-    subscriptions.filter(cancelled=True).delete()
-    subscriptions.update(update_on=date.today() + Interval("1 month"))
+    `invoice` is the charge's invoice, if it has one
+    """
+    if invoice is None:
+        # do not send receipts for MuckRock donations and crowdfunds
+        if charge_data["metadata"].get("action") in ["donation", "crowdfund-payment"]:
+            return None
+        return charge_data["description"]
 
-    send_cache_invalidations("organization", uuids)
+    invoice_line = invoice["lines"]["data"][0]
+    if invoice_line["plan"]["id"].startswith(("donate", "crowdfund")):
+        return None
+    # depends on new or old version of API - MuckRock still uses old,
+    # Squarelet uses new
+    return stripe_cache.plan_name(invoice_line["plan"], stripe_account)
 
 
 @task(
     name="squarelet.organizations.tasks.handle_charge_succeeded",
     autoretry_for=(Organization.DoesNotExist,),
 )
-def handle_charge_succeeded(charge_data):
-    """Handle receiving a charge.succeeded event from the Stripe webhook"""
+def handle_charge_succeeded(
+    charge_data, invoices=None, stripe_account=StripeAccounts.muckrock
+):
+    """Handle receiving a charge.succeeded event from the Stripe webhook
+
+    `invoices` may hold invoices already retrieved by `retrieve_invoices`, and
+    `stripe_account` is the account which sent the event
+    """
 
     # We autorety if the organization does not exist, as that should mean the webhook
     # is being processed before the database synced the customer id to the organization
@@ -57,41 +198,23 @@ def handle_charge_succeeded(charge_data):
         # from MuckRock - no need to log those here
         return
 
+    charge = Charge.objects.filter(charge_id=charge_data["id"]).first()
+    if charge is not None:
+        # we have already recorded this charge, and sent its receipt
+        return
+
+    invoice = None
     if charge_data["invoice"]:
         # fetch the invoice from stripe if one associated with the charge
-        invoice = stripe.Invoice.retrieve(
-            charge_data["invoice"],
-            api_key=settings.STRIPE_SECRET_KEYS[StripeAccounts.muckrock],
-        )
-        invoice_line = invoice["lines"]["data"][0]
-
-    def get_description():
-        """Get the description from the charge data"""
-        if charge_data["invoice"]:
-            # depends on new or old version of API - MuckRock still uses old,
-            # Squarelet uses new
-            if "name" in invoice_line["plan"]:
-                return invoice_line["plan"]["name"]
-            else:
-                return stripe.Product.retrieve(
-                    invoice_line["plan"]["product"],
-                    api_key=settings.STRIPE_SECRET_KEYS[StripeAccounts.muckrock],
-                )["name"]
-        else:
-            return charge_data["description"]
-
-    # do not send receipts for MuckRock donations and crowdfunds
-    if charge_data["invoice"] and invoice_line["plan"]["id"].startswith(
-        ("donate", "crowdfund")
-    ):
-        return
-    if not charge_data["invoice"] and charge_data["metadata"].get("action") in [
-        "donation",
-        "crowdfund-payment",
-    ]:
+        invoice = (invoices or {}).get(charge_data["invoice"])
+        if invoice is None:
+            invoice = retrieve_invoice(charge_data["invoice"], stripe_account)
+
+    description = charge_description(charge_data, invoice, stripe_account)
+    if description is None:
         return
 
-    charge, _ = Charge.objects.get_or_create(
+    charge, created = Charge.objects.get_or_create(
         charge_id=charge_data["id"],
         defaults={
             "amount": charge_data["amount"],
@@ -102,11 +225,15 @@ def handle_charge_succeeded(charge_data):
             "created_at": datetime.fromtimestamp(
                 charge_data["created"], tz=get_current_timezone()
             ),
-            "description": get_description,
+            "description": description,
+            "stripe_account": stripe_account,
         },
     )
 
-    charge.send_receipt()
+    # only send the receipt once the charge has been saved, as the event may be
+    # rolled back and processed again
+    if created:
+        transaction.on_commit(charge.send_receipt)
 
 
 @task(name="squarelet.organizations.tasks.handle_invoice_failed")
@@ -139,10 +266,196 @@ def handle_invoice_failed(invoice_data):
     else:
         subject = _("Your payment has failed")
 
-    send_mail(
-        subject=subject,
-        template="organizations/email/payment_failed.html",
-        organization=organization,
-        organization_to=ORG_TO_ADMINS,
-        extra_context={"attempt": "final" if attempt == 4 else attempt},
+    transaction.on_commit(
+        lambda: send_mail(
+            subject=subject,
+            template="organizations/email/payment_failed.html",
+            organization=organization,
+            organization_to=ORG_TO_ADMINS,
+            extra_context={"attempt": "final" if attempt == 4 else attempt},
+        )
     )
+
+
+@task(name="squarelet.organizations.tasks.handle_customer_updated")
+def handle_customer_updated(customer_data):
+    """Handle receiving a customer.updated event from the Stripe webhook by
+    updating our copy of the customer's default card"""
+    customer = (
+        Customer.objects.filter(customer_id=customer_data["id"])
+        .select_related("organization")
+        .first()
+    )
+    if customer is None:
+        return
+    customer.sync_card(
+        stripe.Customer.construct_from(
+            customer_data, settings.STRIPE_SECRET_KEYS[customer.stripe_account]
+        )
+    )
+    send_cache_invalidations("organization", customer.organization.uuid)
+
+
+@task(name="squarelet.organizations.tasks.handle_source_changed")
+def handle_source_changed(event_type, source_data):
+    """Handle receiving a customer.source.* event from the Stripe webhook by
+    updating our copy of the customer's default card"""
+    customer = (
+        Customer.objects.filter(customer_id=source_data.get("customer"))
+        .select_related("organization")
+        .first()
+    )
+    if customer is None:
+        return
+    if (
+        event_type != "customer.source.deleted"
+        and source_data["id"] == customer.default_source
+    ):
+        # the default card itself changed, such as its expiration date
+        customer.set_card(
+            source_data["id"],
+            stripe.StripeObject.construct_from(
+                source_data, settings.STRIPE_SECRET_KEYS[customer.stripe_account]
+            ),
+        )
+    else:
+        # the default source may have changed, fetch it from stripe
+        customer.sync_card()
+    send_cache_invalidations("organization", customer.organization.uuid)
+
+
+def dispatch_stripe_event(
+    event_type, data, invoices=None, stripe_account=StripeAccounts.muckrock
+):
+    """Call the handler for a Stripe webhook event, if we have one"""
+    if event_type == "charge.succeeded":
+        handle_charge_succeeded(data, invoices, stripe_account)
+    elif event_type == "invoice.payment_failed":
+        handle_invoice_failed(data)
+    elif event_type == "customer.updated":
+        handle_customer_updated(data)
+    elif event_type.startswith("customer.source."):
+        handle_source_changed(event_type, data)
+
+
+def claim_stripe_events(limit):
+    """Claim a batch of pending events from the Stripe webhook
+
+    Rows are locked with SKIP LOCKED so multiple workers may claim events
+    concurrently, but only for as long as it takes to claim them.  Claimed
+    events are leased to this worker by moving their `retry_at` forward - if
+    the worker dies, they will be picked up again once the lease runs out.
+    """
+    now = timezone.now()
+    lease = now + timedelta(seconds=settings.STRIPE_EVENT_LEASE)
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True).filter(
+                status=StripeEventStatus.pending, retry_at__lte=now
+            )[:limit]
+        )
+        StripeEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+            attempts=F("attempts") + 1, retry_at=lease
+        )
+    for event in events:
+        event.attempts += 1
+        event.retry_at = lease
+    return events
+
+
+def process_stripe_event_batch(limit=None):
+    """Process a batch of pending events from the Stripe webhook
+
+    Each event is handled in its own transaction, along with marking it as
+    processed, so emails and other side effects are only sent for events
+    which are committed.  A failed event is retried with an exponential
+    backoff, until it has failed STRIPE_EVENT_MAX_ATTEMPTS times.  Events
+    whose lease runs out first are left to the worker which claimed them next.
+    Returns the number of events processed.
+    """
+    if limit is None:
+        limit = settings.STRIPE_EVENT_BATCH_SIZE
+    events = claim_stripe_events(limit)
+    # charges arrive in bursts when subscriptions renew, so fetch all of the
+    # invoices they need up front, from the account which sent each charge
+    invoices = {}
+    for stripe_account in {event.stripe_account for event in events}:
+        invoices.update(
+            retrieve_invoices(
+                [
+                    event.data["data"]["object"]
+                    for event in events
+                    if event.type == "charge.succeeded"
+                    and event.stripe_account == stripe_account
+                ],
+                stripe_account,
+            )
+        )
+    for event in events:
+        # the lease may have run out and the event been claimed by another
+        # worker, so only touch it while it is still leased to this one
+        leased = StripeEvent.objects.filter(
+            pk=event.pk, status=StripeEventStatus.pending, retry_at=event.retry_at
+        )
+        try:
+            with transaction.atomic():
+                if not leased.select_for_update().exists():
+                    logger.warning(
+                        "Stripe event %s (%s) lease expired, skipping",
+                        event.event_id,
+                        event.type,
+                    )
+                    continue
+                dispatch_stripe_event(
+                    event.type,
+                    event.data["data"]["object"],
+                    invoices,
+                    event.stripe_account,
+                )
+                event.status = StripeEventStatus.processed
+                event.processed_at = timezone.now()
+                event.error = ""
+                event.save(update_fields=["status", "processed_at", "error"])
+        except Exception as exc:  # pylint: disable=broad-except
+            event.error = repr(exc)
+            if event.attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+                event.status = StripeEventStatus.failed
+                logger.error(
+                    "Stripe event %s (%s) failed, giving up: %s",
+                    event.event_id,
+                    event.type,
+                    exc,
+                    exc_info=True,
+                )
+            else:
+                event.status = StripeEventStatus.pending
+                backoff = 2 ** (event.attempts - 1)
+                event.retry_at = timezone.now() + timedelta(
+                    seconds=settings.STRIPE_EVENT_RETRY_DELAY * backoff
+                )
+                logger.warning(
+                    "Stripe event %s (%s) failed, will retry: %s",
+                    event.event_id,
+                    event.type,
+                    exc,
+                )
+            leased.update(
+                status=event.status, error=event.error, retry_at=event.retry_at
+            )
+    return len(events)
+
+
+@task(name="squarelet.organizations.tasks.process_stripe_events")
+def process_stripe_events():
+    """Process all pending events from the Stripe webhook"""
+    while process_stripe_event_batch():
+        pass
+
+
+@periodic_task(
+    run_every=crontab(minute="*"),
+    name="squarelet.organizations.tasks.retry_stripe_events",
+)
+def retry_stripe_events():
+    """Pick up events which are due to be retried, or were missed"""
+    process_stripe_events()
@@ -1,3 +1,7 @@
+# Django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 # Standard Library
 import json
 import time
@@ -53,6 +57,17 @@ class TestOrganizationAPI:
             "squarelet.organizations.models.Customer.stripe_customer",
             default_source="default_source",
         )
+        mocker.patch(
+            "stripe.Customer.retrieve_source",
+            return_value=Mock(
+                id="default_source",
+                object="card",
+                brand="Visa",
+                last4="4242",
+                exp_month=1,
+                exp_year=2030,
+            ),
+        )
         user = user_factory(is_staff=True)
         data = {
             "organization": str(user.individual_organization.uuid),
@@ -73,6 +88,72 @@ class TestOrganizationAPI:
         mocked.assert_called_once()
         assert Charge.objects.filter(charge_id="charge_id").exists()
 
+    def test_list_entitlements_queries(
+        self, user_factory, subscription_with_card_factory
+    ):
+        """Plans, cards and entitlements are resolved for a whole page of
+        organizations at once"""
+        entitlement = EntitlementFactory()
+        plan = PlanFactory()
+        plan.entitlements.add(entitlement)
+        client = APIClient()
+        client.force_authenticate(
+            user=user_factory(is_staff=True),
+            token=Mock(client=entitlement.client, scope=[]),
+        )
+
+        def list_organizations():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get("/api/organizations/")
+            assert response.status_code == status.HTTP_200_OK
+            return len(queries), json.loads(response.content)["results"]
+
+        subscription_with_card_factory(1, plan=plan)
+        num_queries, _results = list_organizations()
+        subscription_with_card_factory(3, plan=plan)
+        more_num_queries, results = list_organizations()
+
+        assert num_queries == more_num_queries
+        subscribed = [r for r in results if r["entitlements"]]
+        assert len(subscribed) == 4
+        for result in subscribed:
+            assert [e["slug"] for e in result["entitlements"]] == [entitlement.slug]
+            assert result["plan"] == plan.slug
+            assert result["card"] == "Visa: 4242"
+
+    def test_list_uuid_in(self, user_factory, organization_factory):
+        """Many organizations may be fetched at once by UUID, with a constant
+        number of queries"""
+        client = APIClient()
+        client.force_authenticate(user=user_factory(is_staff=True))
+
+        def list_organizations(organizations):
+            uuids = ",".join(str(o.uuid) for o in organizations)
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get("/api/organizations/", {"uuid__in": uuids})
+            assert response.status_code == status.HTTP_200_OK
+            return len(queries), json.loads(response.content)["results"]
+
+        organizations = [s.organization for s in SubscriptionFactory.create_batch(4)]
+        organization_factory()
+        num_queries, _results = list_organizations(organizations[:1])
+        more_num_queries, results = list_organizations(organizations)
+
+        assert num_queries == more_num_queries
+        assert {r["uuid"] for r in results} == {str(o.uuid) for o in organizations}
+
+    def test_list_uuid_in_invalid(self, user_factory, organization_factory, settings):
+        """Too many or malformed UUIDs are rejected"""
+        settings.API_BULK_MAX_UUIDS = 1
+        organizations = organization_factory.create_batch(2)
+        client = APIClient()
+        client.force_authenticate(user=user_factory(is_staff=True))
+        uuids = ",".join(str(o.uuid) for o in organizations)
+        response = client.get("/api/organizations/", {"uuid__in": uuids})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = client.get("/api/organizations/", {"uuid__in": "foo"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 
 @pytest.mark.django_db()
 class TestPPOrganizationAPI:
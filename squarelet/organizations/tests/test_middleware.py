@@ -0,0 +1,41 @@
+# Django
+from django.test import RequestFactory
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.organizations.middleware import MembershipCacheMiddleware
+from squarelet.organizations.models import Membership
+
+
+def in_request(view):
+    """Run `view` inside of the middleware, as it would be for a request"""
+    return MembershipCacheMiddleware(view)(RequestFactory().get("/"))
+
+
+@pytest.mark.django_db()
+def test_membership_map(organization_factory, user_factory, django_assert_num_queries):
+    """Memberships are loaded once per request"""
+    user = user_factory()
+    admin_of = organization_factory(admins=[user])
+    member_of = organization_factory(users=[user])
+    other = organization_factory()
+
+    def view(request):
+        with django_assert_num_queries(1):
+            assert admin_of.has_admin(user)
+            assert not member_of.has_admin(user)
+            assert member_of.has_member(user)
+            assert not other.has_member(user)
+        # the memberships are reloaded after they change
+        Membership.objects.create(user=user, organization=other)
+        with django_assert_num_queries(1):
+            assert other.has_member(user)
+
+    in_request(view)
+
+    # outside of a request the memberships are queried each time
+    with django_assert_num_queries(2):
+        assert admin_of.has_admin(user)
+        assert member_of.has_member(user)
@@ -3,15 +3,26 @@ from django.conf import settings
 from django.utils import timezone
 
 # Standard Library
-from unittest.mock import Mock, PropertyMock
+from unittest.mock import MagicMock, Mock, PropertyMock
 
 # Third Party
 import pytest
+import stripe
 
 # Squarelet
 from squarelet.organizations.choices import ChangeLogReason, StripeAccounts
-from squarelet.organizations.models import ReceiptEmail
-from squarelet.organizations.tests.factories import EntitlementFactory, PlanFactory
+from squarelet.organizations.models import (
+    Card,
+    Customer,
+    Organization,
+    ReceiptEmail,
+    Subscription,
+)
+from squarelet.organizations.tests.factories import (
+    EntitlementFactory,
+    PlanFactory,
+    SubscriptionFactory,
+)
 
 # pylint: disable=invalid-name,too-many-public-methods,protected-access
 
@@ -35,6 +46,25 @@ class TestOrganization:
         organization = organization_factory()
         mocked.assert_called_with("organization", organization.uuid)
 
+    @pytest.mark.django_db(transaction=True)
+    def test_save_unchanged(self, organization_factory, mocker):
+        """Cache invalidations are only sent when fields clients see change"""
+        organization = organization_factory(payment_failed=True)
+        organization = Organization.objects.get(pk=organization.pk)
+        mocked = mocker.patch(
+            "squarelet.organizations.models.organization.send_cache_invalidations"
+        )
+        organization.payment_failed = True
+        organization.update_on = None
+        organization.save()
+        mocked.assert_not_called()
+        organization.payment_failed = False
+        organization.save()
+        mocked.assert_called_once_with("organization", organization.uuid)
+        mocked.reset_mock()
+        organization.save()
+        mocked.assert_not_called()
+
     def test_get_absolute_url(self, organization_factory):
         organization = organization_factory.build()
         assert organization.get_absolute_url() == f"/organizations/{organization.slug}/"
@@ -322,25 +352,59 @@ class TestCustomer:
 
     def test_card_existing(self, customer_factory, mocker):
         default_source = "default_source"
-        mocked = mocker.patch(
+        mocker.patch(
+            "squarelet.organizations.models.Customer.stripe_customer",
+            id="customer_id",
+            default_source=default_source,
+        )
+        mocked_retrieve = mocker.patch(
+            "stripe.Customer.retrieve_source",
+            return_value=Mock(
+                object="card", brand="Visa", last4="4242", exp_month=1, exp_year=2030
+            ),
+        )
+        customer = customer_factory.build()
+        customer.sync_card(save=False)
+        assert customer.card == Card(default_source, "Visa", "4242", 1, 2030)
+        mocked_retrieve.assert_called_with(
+            "customer_id",
+            default_source,
+            api_key=settings.STRIPE_SECRET_KEYS[StripeAccounts.muckrock],
+        )
+
+    def test_card_included_sources(self, customer_factory, mocker):
+        """Sources included with the customer are used without fetching them"""
+        default_source = "default_source"
+        source = Mock(
+            id=default_source,
+            object="card",
+            brand="Visa",
+            last4="4242",
+            exp_month=1,
+            exp_year=2030,
+        )
+        mocker.patch(
             "squarelet.organizations.models.Customer.stripe_customer",
             default_source=default_source,
+            sources=Mock(data=[source]),
         )
-        mocked.sources.retrieve.return_value.object = "card"
+        mocked_retrieve = mocker.patch("stripe.Customer.retrieve_source")
         customer = customer_factory.build()
-        assert mocked.sources.retrieve.return_value == customer.card
-        mocked.sources.retrieve.assert_called_with(default_source)
+        customer.sync_card(save=False)
+        assert customer.card == Card(default_source, "Visa", "4242", 1, 2030)
+        mocked_retrieve.assert_not_called()
 
     def test_card_ach(self, customer_factory, mocker):
         default_source = "default_source"
-        mocked = mocker.patch(
+        mocker.patch(
             "squarelet.organizations.models.Customer.stripe_customer",
             default_source=default_source,
         )
-        mocked.sources.retrieve.return_value.object = "ach"
+        mocker.patch("stripe.Customer.retrieve_source", return_value=Mock(object="ach"))
         customer = customer_factory.build()
+        customer.sync_card(save=False)
         assert customer.card is None
-        mocked.sources.retrieve.assert_called_with(default_source)
+        assert customer.default_source == default_source
 
     def test_card_blank(self, customer_factory, mocker):
         mocker.patch(
@@ -348,7 +412,35 @@ class TestCustomer:
             default_source=None,
         )
         customer = customer_factory.build()
+        customer.sync_card(save=False)
+        assert customer.card is None
+
+    @pytest.mark.django_db()
+    def test_card_local(self, customer_factory, mocker):
+        """The card is read from the local copy"""
+        customer = customer_factory()
+        customer.set_card(
+            "card_id",
+            Mock(object="card", brand="Visa", last4="4242", exp_month=1, exp_year=2030),
+        )
+        mocked = mocker.patch("squarelet.organizations.models.Customer.sync_card")
+        customer = Customer.objects.get(pk=customer.pk)
+        assert customer.card_display == "Visa: 4242"
+        mocked.assert_not_called()
+
+    def test_card_not_copied(self, customer_factory, mocker):
+        """Reading a card which has never been copied does not call stripe"""
+        mocked = mocker.patch("squarelet.organizations.models.Customer.sync_card")
+        customer = customer_factory.build(customer_id="customer_id")
+        assert customer.card is None
+        mocked.assert_not_called()
+
+    def test_card_no_customer(self, customer_factory, mocker):
+        """Reading the card does not create a stripe customer"""
+        mocked = mocker.patch("stripe.Customer.create")
+        customer = customer_factory.build(customer_id=None)
         assert customer.card is None
+        mocked.assert_not_called()
 
     def test_card_display(self, customer_factory, mocker):
         brand = "Visa"
@@ -369,13 +461,37 @@ class TestCustomer:
 
     def test_save_card(self, customer_factory, mocker):
         token = "token"
+        card = Mock(
+            id="card_id",
+            object="card",
+            brand="Visa",
+            last4="4242",
+            exp_month=1,
+            exp_year=2030,
+        )
         mocked_customer = mocker.patch(
-            "squarelet.organizations.models.Customer.stripe_customer"
+            "squarelet.organizations.models.Customer.stripe_customer",
+            default_source="card_id",
+            sources=Mock(data=[card]),
         )
         customer = customer_factory.build()
         customer.save_card(token)
         assert mocked_customer.source == token
         mocked_customer.save.assert_called_once()
+        assert customer.card == Card("card_id", "Visa", "4242", 1, 2030)
+
+    def test_remove_card(self, customer_factory, mocker):
+        mocked_delete = mocker.patch("stripe.Customer.delete_source")
+        mocker.patch(
+            "squarelet.organizations.models.Customer.stripe_customer",
+            default_source="card_id",
+        )
+        customer = customer_factory.build(
+            customer_id="customer_id", card_brand="Visa", card_last4="4242"
+        )
+        customer.remove_card()
+        mocked_delete.assert_called_once()
+        assert customer.card is None
 
 
 class TestMembership:
@@ -395,6 +511,12 @@ class TestMembership:
         )
         membership = membership_factory()
         mocked.assert_called_with("user", membership.user.uuid)
+        mocked.reset_mock()
+        membership.save()
+        mocked.assert_not_called()
+        membership.admin = not membership.admin
+        membership.save()
+        mocked.assert_called_with("user", membership.user.uuid)
 
     @pytest.mark.django_db(transaction=True)
     def test_save_delete(self, membership_factory, mocker):
@@ -418,6 +540,22 @@ class TestSubscription:
             == f"Subscription: {subscription.organization} to {subscription.plan.name}"
         )
 
+    @pytest.mark.django_db()
+    def test_save_renewal_slot(
+        self, subscription_factory, django_assert_num_queries, mocker
+    ):
+        """The renewal slot is set when the subscription is created, and saving
+        it later does not load its organization"""
+        mocker.patch("stripe.Plan.create")
+        subscription = subscription_factory()
+        assert subscription.renewal_slot == Subscription.slot_for(
+            subscription.organization.uuid
+        )
+        subscription = Subscription.objects.get(pk=subscription.pk)
+        subscription.renewal_slot = None
+        with django_assert_num_queries(1):
+            subscription.save()
+
     def test_stripe_subscription(self, subscription_factory, mocker):
         mocked = mocker.patch("stripe.Subscription.retrieve")
         stripe_subscription = "stripe_subscription"
@@ -433,7 +571,11 @@ class TestSubscription:
     def test_start(self, subscription_factory, professional_plan_factory, mocker):
         plan = professional_plan_factory.build()
         subscription = subscription_factory.build(plan=plan)
-        mocked = Mock()
+        mocked = MagicMock()
+        stripe_subscription = mocked.stripe_customer.subscriptions.create.return_value
+        stripe_subscription.__getitem__.return_value = {
+            "data": [{"id": "si_123", "quantity": 5}]
+        }
         mocker.patch(
             "squarelet.organizations.models.organization.Organization.customer",
             return_value=mocked,
@@ -449,10 +591,9 @@ class TestSubscription:
             billing="charge_automatically",
             days_until_due=None,
         )
-        assert (
-            subscription.subscription_id
-            == mocked.stripe_customer.subscriptions.create.return_value.id
-        )
+        assert subscription.subscription_id == stripe_subscription.id
+        assert subscription.subscription_item_id == "si_123"
+        assert subscription.quantity == 5
 
     def test_start_existing(self, subscription_factory, mocker):
         """If there is an existing subscription, do not start another one"""
@@ -511,10 +652,17 @@ class TestSubscription:
         self, subscription_factory, professional_plan_factory, mocker
     ):
         mocked_save = mocker.patch("squarelet.organizations.models.Subscription.save")
-        mocked_modify = mocker.patch("stripe.Subscription.modify")
-        mocker.patch("squarelet.organizations.models.Subscription.stripe_subscription")
+        mocked_modify = mocker.patch(
+            "stripe.Subscription.modify",
+            return_value={"items": {"data": [{"id": "si_1", "quantity": 5}]}},
+        )
+        mocked_stripe_subscription = mocker.patch(
+            "squarelet.organizations.models.Subscription.stripe_subscription"
+        )
         plan = professional_plan_factory.build()
-        subscription = subscription_factory.build(plan=plan)
+        subscription = subscription_factory.build(
+            plan=plan, subscription_id="sub_1", subscription_item_id="si_1"
+        )
         subscription.modify(plan)
         mocked_save.assert_called()
         mocked_modify.assert_called_with(
@@ -522,8 +670,7 @@ class TestSubscription:
             cancel_at_period_end=False,
             items=[
                 {
-                    # pylint: disable=unsubscriptable-object
-                    "id": subscription.stripe_subscription["items"]["data"][0].id,
+                    "id": "si_1",
                     "plan": subscription.plan.stripe_id,
                     "quantity": subscription.organization.max_users,
                 }
@@ -532,6 +679,22 @@ class TestSubscription:
             days_until_due=None,
             api_key=settings.STRIPE_SECRET_KEYS[plan.stripe_account],
         )
+        # the stored item ID is used instead of retrieving the subscription
+        mocked_stripe_subscription.__getitem__.assert_not_called()
+        assert subscription.quantity == 5
+
+    def test_update_quantity(self, subscription_factory, mocker):
+        """Stripe is only updated if the number of seats has changed"""
+        mocked_modify = mocker.patch(
+            "squarelet.organizations.models.Subscription.stripe_modify"
+        )
+        subscription = subscription_factory.build(subscription_id="sub_1")
+        subscription.quantity = subscription.organization.max_users
+        subscription.update_quantity()
+        mocked_modify.assert_not_called()
+        subscription.quantity -= 1
+        subscription.update_quantity()
+        mocked_modify.assert_called_once()
 
 
 class TestPlan:
@@ -592,6 +755,100 @@ class TestPlan:
             api_key=settings.STRIPE_SECRET_KEYS[plan.stripe_account],
         )
 
+    @pytest.mark.django_db()
+    def test_save_invalidates_subscribers(self, plan_factory, mocker):
+        """Subscribed organizations are invalidated when clients would see the
+        plan change"""
+        mocked = mocker.patch(
+            "squarelet.organizations.models.payment.send_cache_invalidations"
+        )
+        plan = plan_factory()
+        subscription = SubscriptionFactory(plan=plan)
+        mocked.reset_mock()
+        plan.public = not plan.public
+        plan.save()
+        mocked.assert_not_called()
+        plan.slug = "new-slug"
+        plan.save()
+        mocked.assert_called_once_with("organization", [subscription.organization.uuid])
+
+    @pytest.mark.django_db()
+    def test_update_stripe_plan(self, professional_plan_factory, mocker):
+        """The plan is replaced on stripe only when its pricing changes"""
+        mocker.patch("stripe.Plan.create")
+        mocker.patch(
+            "squarelet.organizations.signals.transaction.on_commit",
+            side_effect=lambda func: func(),
+        )
+        mocked = mocker.patch("squarelet.organizations.models.Plan.update_stripe_plan")
+        plan = professional_plan_factory()
+        plan.public = not plan.public
+        plan.save()
+        mocked.assert_not_called()
+        plan.base_price += 1
+        plan.save()
+        mocked.assert_called_once_with()
+
+    @pytest.mark.django_db()
+    def test_update_stripe_plan_replace(self, professional_plan_factory, mocker):
+        """The new plan is created before the old plan and its product are
+        deleted"""
+        create = mocker.patch("stripe.Plan.create")
+        plan = professional_plan_factory()
+        old_stripe_id = plan.stripe_id
+        manager = Mock()
+        mocker.patch("stripe.Plan.retrieve", return_value=manager.plan)
+        product = mocker.patch("stripe.Product.retrieve").return_value
+        manager.attach_mock(create, "create")
+        manager.attach_mock(product, "product")
+
+        plan.update_stripe_plan()
+
+        assert plan.stripe_id == f"squarelet_plan_{plan.slug}_v1"
+        assert [c[0] for c in manager.mock_calls] == [
+            "create",
+            "plan.delete",
+            "product.delete",
+        ]
+        assert manager.create.call_args[1]["id"] == plan.stripe_id
+        stripe.Plan.retrieve.assert_called_once_with(
+            id=old_stripe_id, api_key=settings.STRIPE_SECRET_KEYS[plan.stripe_account]
+        )
+        plan.refresh_from_db()
+        assert plan.stripe_version == 1
+
+    @pytest.mark.django_db()
+    def test_update_stripe_plan_free(self, professional_plan_factory, mocker):
+        """A plan which is now free is only removed"""
+        create = mocker.patch("stripe.Plan.create")
+        plan = professional_plan_factory()
+        create.reset_mock()
+        stripe_plan = Mock()
+        mocker.patch("stripe.Plan.retrieve", return_value=stripe_plan)
+        mocker.patch("stripe.Product.retrieve")
+        plan.base_price = plan.price_per_user = 0
+        plan.update_stripe_plan()
+        create.assert_not_called()
+        stripe_plan.delete.assert_called_once_with()
+        assert plan.stripe_version == 0
+
+    @pytest.mark.django_db()
+    def test_update_stripe_plan_error(self, professional_plan_factory, mocker):
+        """Errors creating the new plan are raised, and the old plan is kept"""
+        create = mocker.patch("stripe.Plan.create")
+        plan = professional_plan_factory()
+        old_stripe_id = plan.stripe_id
+        create.side_effect = stripe.error.InvalidRequestError(
+            "Invalid API key", None, http_status=401
+        )
+        retrieve = mocker.patch("stripe.Plan.retrieve")
+        with pytest.raises(stripe.error.InvalidRequestError):
+            plan.update_stripe_plan()
+        retrieve.assert_not_called()
+        assert plan.stripe_id == old_stripe_id
+        plan.refresh_from_db()
+        assert plan.stripe_version == 0
+
 
 class TestInvitation:
     """Unit tests for Invitation model"""
@@ -759,3 +1016,27 @@ class TestEntitlement:
 
         entitlement.plans.set([private_plan, public_plan])
         assert entitlement.public
+
+    @pytest.mark.django_db()
+    def test_save_invalidates_subscribers(self, mocker):
+        """Organizations subscribed to a plan with the entitlement are invalidated
+        when it changes, or is added to or removed from a plan"""
+        mocked = mocker.patch(
+            "squarelet.organizations.models.payment.send_cache_invalidations"
+        )
+        plan = PlanFactory()
+        subscription = SubscriptionFactory(plan=plan)
+        entitlement = EntitlementFactory()
+        mocked.reset_mock()
+
+        plan.entitlements.add(entitlement)
+        mocked.assert_called_once_with("organization", [subscription.organization.uuid])
+        mocked.reset_mock()
+
+        entitlement.resources = {"requests": 10}
+        entitlement.save()
+        mocked.assert_called_once_with("organization", [subscription.organization.uuid])
+        mocked.reset_mock()
+
+        entitlement.plans.clear()
+        mocked.assert_called_once_with("organization", [subscription.organization.uuid])
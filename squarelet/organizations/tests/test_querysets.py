@@ -1,14 +1,26 @@
 # Django
-from django.test import TestCase
+from django.test import TestCase, override_settings
+
+# Standard Library
+from datetime import date
 
 # Third Party
 import pytest
 
 # Squarelet
-from squarelet.organizations.models import Membership
+from squarelet.organizations.models import (
+    Entitlement,
+    Membership,
+    Organization,
+    Plan,
+    Subscription,
+)
 from squarelet.organizations.tests.factories import (
+    EntitlementFactory,
     MembershipFactory,
     OrganizationFactory,
+    PlanFactory,
+    SubscriptionFactory,
 )
 from squarelet.users.tests.factories import UserFactory
 
@@ -29,3 +41,89 @@ class TestMembershipQuerySet(TestCase):
 
         another_user = UserFactory()
         assert member.memberships.get_viewable(another_user).count() == 0
+
+
+class TestOrganizationQuerySet(TestCase):
+    """Unit tests for Organization queryset"""
+
+    @pytest.mark.django_db
+    def test_get_viewable(self):
+        member, user = UserFactory.create_batch(2)
+        public_org = OrganizationFactory(users=[member, user])
+        private_org = OrganizationFactory(users=[member], private=True)
+
+        viewable = Organization.objects.filter(individual=False)
+        assert set(viewable.get_viewable(member)) == {public_org, private_org}
+        assert list(viewable.get_viewable(user)) == [public_org]
+        assert "DISTINCT" not in str(viewable.get_viewable(member).query)
+
+
+class TestPlanQuerySet(TestCase):
+    """Unit tests for Plan queryset"""
+
+    @pytest.mark.django_db
+    def test_get_viewable(self):
+        user = UserFactory()
+        public_plan = PlanFactory()
+        subscribed_plan = PlanFactory(public=False)
+        private_plan = PlanFactory(public=False)
+        PlanFactory(public=False)
+        OrganizationFactory(users=[user], plans=[public_plan, subscribed_plan])
+        private_plan.private_organizations.add(user.individual_organization)
+
+        assert set(Plan.objects.get_viewable(user)) == {
+            public_plan,
+            subscribed_plan,
+            private_plan,
+        }
+        assert list(Plan.objects.get_public()) == [public_plan]
+
+
+class TestEntitlementQuerySet(TestCase):
+    """Unit tests for Entitlement queryset"""
+
+    @pytest.mark.django_db
+    def test_get_viewable(self):
+        user = UserFactory()
+        public_entitlement, private_entitlement = EntitlementFactory.create_batch(2)
+        owned_entitlement = EntitlementFactory(client__owner=user)
+        # in more than one public plan, but only listed once
+        for plan in PlanFactory.create_batch(2):
+            plan.entitlements.add(public_entitlement)
+        private_plan = PlanFactory(public=False)
+        private_plan.entitlements.add(private_entitlement)
+
+        assert set(Entitlement.objects.get_viewable(user)) == {
+            public_entitlement,
+            owned_entitlement,
+        }
+        assert list(Entitlement.objects.get_public()) == [public_entitlement]
+        assert not Entitlement.objects.get_subscribed(user).exists()
+
+        OrganizationFactory(users=[user], plans=[private_plan])
+        assert list(Entitlement.objects.get_subscribed(user)) == [private_entitlement]
+
+
+class TestSubscriptionQuerySet(TestCase):
+    """Unit tests for Subscription queryset"""
+
+    @pytest.mark.django_db
+    def test_assign_renewal_slots(self):
+        with override_settings(RESTORE_SLOTS=1):
+            subscriptions = SubscriptionFactory.create_batch(
+                4, plan=PlanFactory(), update_on=date.today()
+            )
+        assert all(s.renewal_slot == 0 for s in subscriptions)
+
+        with override_settings(RESTORE_SLOTS=24):
+            updated = Subscription.objects.assign_renewal_slots()
+            assert updated == sum(
+                1 for s in subscriptions if s.organization.uuid.int % 24
+            )
+            for subscription in subscriptions:
+                subscription.refresh_from_db()
+                assert subscription.renewal_slot == Subscription.slot_for(
+                    subscription.organization.uuid
+                )
+                # the update date is left unchanged
+                assert subscription.update_on == date.today()
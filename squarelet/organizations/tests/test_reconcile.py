@@ -0,0 +1,246 @@
+# Django
+from django.utils import timezone
+
+# Standard Library
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Third Party
+import pytest
+import stripe
+
+# Squarelet
+from squarelet.oidc.models import Change
+from squarelet.organizations.choices import StripeAccounts
+from squarelet.organizations.models import Charge, Customer
+from squarelet.organizations.reconcile import RateLimiter, Reconciler
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Serve Stripe's list and retrieve endpoints from the server's `objects`,
+    keyed by path - lists are paged the same way as Stripe pages them"""
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        self.server.paths.append(url.path)
+        obj = self.server.objects.get(url.path[len("/v1/") :])
+        if isinstance(obj, list):
+            start = 0
+            if "starting_after" in query:
+                ids = [o["id"] for o in obj]
+                start = ids.index(query["starting_after"][0]) + 1
+            end = start + int(query["limit"][0])
+            status = 200
+            body = {
+                "object": "list",
+                "url": url.path,
+                "data": obj[start:end],
+                "has_more": end < len(obj),
+            }
+        elif obj is not None:
+            status = 200
+            body = obj
+        else:
+            status = 404
+            body = {"error": {"type": "invalid_request_error", "message": "No such"}}
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def fake_stripe(mocker):
+    """A local server standing in for Stripe's API"""
+    server = HTTPServer(("127.0.0.1", 0), FakeStripeHandler)
+    server.objects = {}
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    mocker.patch.object(stripe, "api_base", f"http://127.0.0.1:{server.server_port}")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.django_db()
+def test_reconcile(customer_factory, subscription_factory, fake_stripe, mocker):
+    """Drift from stripe is counted and fixed"""
+    mocker.patch("squarelet.organizations.reconcile.PAGE_SIZE", 2)
+    send_cache_invalidations = mocker.patch(
+        "squarelet.organizations.reconcile.send_cache_invalidations"
+    )
+    customer = customer_factory(customer_id="cus_card")
+    customer_factory(customer_id="cus_missing")
+    blank_customer = customer_factory(customer_id="cus_blank")
+    subscription = subscription_factory(subscription_id="sub_cancel")
+    subscription_factory(subscription_id="sub_ended")
+    now = int(timezone.now().timestamp())
+    fake_stripe.objects = {
+        "customers": [
+            # the default card is not included, so it must be retrieved
+            {
+                "id": "cus_card",
+                "object": "customer",
+                "default_source": "card_1",
+                "sources": {"object": "list", "data": []},
+            },
+            {"id": "cus_blank", "object": "customer", "default_source": None},
+            {"id": "cus_other", "object": "customer", "default_source": None},
+        ],
+        "customers/cus_card/sources/card_1": {
+            "id": "card_1",
+            "object": "card",
+            "brand": "Visa",
+            "last4": "4242",
+            "exp_month": 1,
+            "exp_year": 2030,
+        },
+        "subscriptions": [
+            {
+                "id": "sub_cancel",
+                "object": "subscription",
+                "status": "active",
+                "cancel_at_period_end": True,
+                "items": {
+                    "object": "list",
+                    "data": [{"id": "si_cancel", "quantity": 5}],
+                },
+            },
+            {
+                "id": "sub_ended",
+                "object": "subscription",
+                "status": "canceled",
+                "cancel_at_period_end": False,
+            },
+        ],
+        "charges": [
+            {
+                "id": "ch_missed",
+                "object": "charge",
+                "status": "succeeded",
+                "customer": "cus_card",
+                "amount": 500,
+                "created": now,
+                "description": "Payment for invoice",
+                "invoice": {
+                    "id": "in_1",
+                    "object": "invoice",
+                    "lines": {
+                        "object": "list",
+                        "data": [{"plan": {"id": "pro", "product": "prod_1"}}],
+                    },
+                },
+                "metadata": {},
+            },
+            {
+                "id": "ch_donation",
+                "object": "charge",
+                "status": "succeeded",
+                "customer": "cus_card",
+                "amount": 500,
+                "created": now,
+                "description": "Donation",
+                "invoice": None,
+                "metadata": {"action": "donation"},
+            },
+        ],
+        "products/prod_1": {"id": "prod_1", "object": "product", "name": "Pro"},
+    }
+
+    reconciler = Reconciler(
+        StripeAccounts.muckrock, RateLimiter(0), timezone.now() - timedelta(days=30)
+    )
+    reconciler.reconcile()
+
+    assert fake_stripe.paths == [
+        "/v1/customers",
+        "/v1/customers/cus_card/sources/card_1",
+        "/v1/customers",
+        "/v1/subscriptions",
+        "/v1/charges",
+        "/v1/products/prod_1",
+    ]
+    assert reconciler.requests == len(fake_stripe.paths)
+    assert reconciler.drift == {
+        # including the customers the factories made for each organization
+        "customers_missing": Customer.objects.count() - 2,
+        "cards_updated": 1,
+        "subscriptions_ended": 1,
+        "subscriptions_missing": 0,
+        "subscriptions_updated": 1,
+        "subscription_items_updated": 1,
+        "charges_unknown": 0,
+        "charges_created": 1,
+    }
+    customer.refresh_from_db()
+    assert customer.card_last4 == "4242"
+    # customers without a card are recorded as copied
+    blank_customer.refresh_from_db()
+    assert blank_customer.card_updated_at is not None
+    subscription.refresh_from_db()
+    assert subscription.cancelled
+    assert subscription.subscription_item_id == "si_cancel"
+    assert subscription.quantity == 5
+    charge = Charge.objects.get(charge_id="ch_missed")
+    assert charge.organization == customer.organization
+    assert charge.description == "Pro"
+    # only the organizations whose card or subscription changed are invalidated
+    assert send_cache_invalidations.call_args_list == [
+        mocker.call("organization", [customer.organization.uuid]),
+        mocker.call("organization", [subscription.organization.uuid]),
+    ]
+
+
+@pytest.mark.django_db()
+def test_reconcile_dry_run(customer_factory, fake_stripe):
+    """A dry run counts drift without fixing it"""
+    customer = customer_factory(customer_id="cus_card")
+    fake_stripe.objects = {
+        "customers": [
+            {
+                "id": "cus_card",
+                "object": "customer",
+                "default_source": "card_1",
+                "sources": {
+                    "object": "list",
+                    "data": [
+                        {
+                            "id": "card_1",
+                            "object": "card",
+                            "brand": "Visa",
+                            "last4": "4242",
+                            "exp_month": 1,
+                            "exp_year": 2030,
+                        }
+                    ],
+                },
+            }
+        ]
+    }
+
+    changes = Change.objects.count()
+    reconciler = Reconciler(
+        StripeAccounts.muckrock,
+        RateLimiter(0),
+        timezone.now() - timedelta(days=30),
+        dry_run=True,
+    )
+    reconciler.reconcile(parts=("customers",))
+
+    assert reconciler.drift["cards_updated"] == 1
+    customer.refresh_from_db()
+    assert customer.card_last4 == ""
+    # the invalidations are rolled back with the changes
+    assert Change.objects.count() == changes
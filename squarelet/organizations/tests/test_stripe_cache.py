@@ -0,0 +1,96 @@
+# Django
+from django.test import override_settings
+
+# Standard Library
+from unittest.mock import Mock
+
+# Third Party
+import stripe
+
+# Squarelet
+from squarelet.organizations import stripe_cache
+from squarelet.organizations.choices import StripeAccounts
+
+
+def mock_retrieve(mocker, object_id):
+    stripe_object = stripe.Customer.construct_from(
+        {"id": object_id, "object": "customer", "email": "email@example.com"}, "key"
+    )
+    return mocker.patch("stripe.Customer.retrieve", return_value=stripe_object)
+
+
+@override_settings(STRIPE_CACHE_TIMEOUT=60)
+def test_retrieve(mocker):
+    """Objects are only retrieved from stripe once"""
+    mocked = mock_retrieve(mocker, "cus_retrieve")
+    stripe_cache.reset_stats()
+    for _ in range(3):
+        customer = stripe_cache.retrieve(
+            stripe.Customer, "cus_retrieve", StripeAccounts.muckrock
+        )
+        assert customer.id == "cus_retrieve"
+        assert customer.email == "email@example.com"
+    mocked.assert_called_once()
+    assert stripe_cache.stats()["customer"] == {"hits": 2, "misses": 1}
+
+
+@override_settings(STRIPE_CACHE_TIMEOUT=60)
+def test_invalidate(mocker):
+    """Changed objects are retrieved from stripe again"""
+    mocked = mock_retrieve(mocker, "cus_invalidate")
+    stripe_cache.retrieve(stripe.Customer, "cus_invalidate", StripeAccounts.muckrock)
+    stripe_cache.invalidate(stripe.Customer, "cus_invalidate", StripeAccounts.muckrock)
+    stripe_cache.retrieve(stripe.Customer, "cus_invalidate", StripeAccounts.muckrock)
+    assert mocked.call_count == 2
+
+
+@override_settings(STRIPE_CACHE_TIMEOUT=60)
+def test_invalidate_event(mocker):
+    """Webhooks about a customer's sources invalidate the customer"""
+    mocked = mock_retrieve(mocker, "cus_event")
+    stripe_cache.retrieve(stripe.Customer, "cus_event", StripeAccounts.muckrock)
+    event = {
+        "type": "customer.source.updated",
+        "data": {
+            "object": {"id": "card_123", "object": "card", "customer": "cus_event"}
+        },
+    }
+    stripe_cache.invalidate_event(event, StripeAccounts.muckrock)
+    stripe_cache.retrieve(stripe.Customer, "cus_event", StripeAccounts.muckrock)
+    assert mocked.call_count == 2
+
+
+def test_disabled(mocker):
+    """The cache is disabled during tests unless it is turned on"""
+    mocked = mocker.patch("stripe.Customer.retrieve", return_value=Mock())
+    for _ in range(2):
+        stripe_cache.retrieve(stripe.Customer, "cus_disabled", StripeAccounts.muckrock)
+    assert mocked.call_count == 2
+
+
+@override_settings(STRIPE_NAME_CACHE_TIMEOUT=60)
+def test_plan_name(mocker):
+    """Product names are only retrieved from stripe once per process"""
+    stripe_cache.clear_names()
+    mocked = mocker.patch(
+        "stripe.Product.retrieve", return_value={"name": "Organization"}
+    )
+    plan = {"id": "org", "product": "prod_name"}
+    for _ in range(3):
+        assert stripe_cache.plan_name(plan, StripeAccounts.muckrock) == "Organization"
+    mocked.assert_called_once()
+
+    # expanded products and older plans do not need to be retrieved
+    expanded = {"id": "pro", "product": {"id": "prod_pro", "name": "Professional"}}
+    assert stripe_cache.plan_name(expanded, StripeAccounts.muckrock) == "Professional"
+    assert (
+        stripe_cache.plan_name(
+            {"id": "pro", "product": "prod_pro"}, StripeAccounts.muckrock
+        )
+        == "Professional"
+    )
+    assert (
+        stripe_cache.plan_name({"id": "old", "name": "Old"}, StripeAccounts.muckrock)
+        == "Old"
+    )
+    mocked.assert_called_once()
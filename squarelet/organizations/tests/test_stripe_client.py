@@ -0,0 +1,64 @@
+# Django
+from django.conf import settings
+from django.test import override_settings
+
+# Standard Library
+from unittest.mock import Mock
+
+# Third Party
+import pytest
+import requests
+import stripe
+
+# Squarelet
+from squarelet.organizations import stripe_client
+
+calls = []
+
+
+def record(method, path, status_code, elapsed):
+    calls.append((method, path, status_code, elapsed))
+
+
+def test_endpoint():
+    assert (
+        stripe_client.endpoint(
+            "https://api.stripe.com/v1/customers/cus_123/sources/card_123?expand=x"
+        )
+        == "/v1/customers/:id/sources/:id"
+    )
+    assert stripe_client.endpoint("https://api.stripe.com/v1/charges") == "/v1/charges"
+
+
+@override_settings(
+    STRIPE_METRICS_HOOK="squarelet.organizations.tests.test_stripe_client.record"
+)
+def test_timed_client():
+    """Every call is timed, including failed calls"""
+    del calls[:]
+    session = Mock(spec=requests.Session)
+    session.request.return_value = Mock(content=b"{}", status_code=200, headers={})
+    client = stripe_client.TimedRequestsClient(session=session)
+    content, status_code, _headers = client.request(
+        "get", "https://api.stripe.com/v1/customers/cus_123", {}
+    )
+    assert (content, status_code) == (b"{}", 200)
+
+    session.request.side_effect = requests.exceptions.ConnectionError
+    with pytest.raises(stripe.error.APIConnectionError):
+        client.request("post", "https://api.stripe.com/v1/charges", {}, "amount=1")
+
+    assert [call[:3] for call in calls] == [
+        ("get", "/v1/customers/:id", 200),
+        ("post", "/v1/charges", None),
+    ]
+
+
+def test_session_retries():
+    """Only idempotent requests are retried on error responses"""
+    adapter = stripe_client.make_session().get_adapter("https://api.stripe.com/")
+    retry = adapter.max_retries
+    assert retry.is_retry("GET", 503)
+    assert not retry.is_retry("POST", 503)
+    assert retry.connect == settings.STRIPE_MAX_RETRIES
+    assert retry.read == 0
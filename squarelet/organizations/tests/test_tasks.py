@@ -1,4 +1,8 @@
 # Django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.test import override_settings
 from django.utils import timezone
 
 # Standard Library
@@ -10,13 +14,15 @@ from dateutil.relativedelta import relativedelta
 
 # Squarelet
 from squarelet.organizations import tasks
-from squarelet.organizations.models import Charge, Subscription
+from squarelet.organizations.choices import StripeEventStatus
+from squarelet.organizations.models import Charge, StripeEvent, Subscription
 from squarelet.organizations.tests.factories import SubscriptionFactory
 
 
 @pytest.mark.django_db()
 def test_restore_organization(organization_plan_factory, mocker):
     patched = mocker.patch("squarelet.organizations.tasks.send_cache_invalidations")
+    cache.clear()
     mocker.patch("stripe.Plan.create")
     today = date.today()
     organization_plan = organization_plan_factory()
@@ -31,7 +37,7 @@ def test_restore_organization(organization_plan_factory, mocker):
         update_on=today - timedelta(1), plan=organization_plan
     )
 
-    tasks.restore_organization()
+    tasks.restore_organization(slot=settings.RESTORE_SLOTS - 1)
 
     subsc_update_later.refresh_from_db()
     subsc_update.refresh_from_db()
@@ -48,10 +54,68 @@ def test_restore_organization(organization_plan_factory, mocker):
 
     patched.assert_called_with(
         "organization",
-        [subsc_update.organization.uuid, subsc_update_cancel.organization.uuid],
+        [subsc_update_cancel.organization.uuid, subsc_update.organization.uuid],
     )
 
 
+@pytest.mark.django_db()
+@override_settings(RESTORE_CHUNK_SIZE=1)
+def test_restore_organization_resume(organization_plan_factory, mocker):
+    """A restore run resumes after the last chunk it finished"""
+    patched = mocker.patch("squarelet.organizations.tasks.send_cache_invalidations")
+    mocker.patch("stripe.Plan.create")
+    cache.clear()
+    today = date.today()
+    organization_plan = organization_plan_factory()
+    subsc_done, subsc_first, subsc_second = [
+        SubscriptionFactory(update_on=today - timedelta(1), plan=organization_plan)
+        for _ in range(3)
+    ]
+    slot = settings.RESTORE_SLOTS - 1
+    checkpoint_key = f"organizations:restore:{today.isoformat()}:{slot}"
+    cache.set(checkpoint_key, {"last_pk": subsc_done.pk, "chunks": 1, "total": 1})
+
+    tasks.restore_organization(slot=slot)
+
+    subsc_done.refresh_from_db()
+    subsc_first.refresh_from_db()
+    subsc_second.refresh_from_db()
+    assert subsc_done.update_on == today - timedelta(1)
+    assert subsc_first.update_on == today + relativedelta(months=1)
+    assert subsc_second.update_on == today + relativedelta(months=1)
+    # one call per chunk
+    assert patched.call_count == 2
+    # a finished run clears its checkpoint, so the next run starts over
+    assert cache.get(checkpoint_key) is None
+    tasks.restore_organization(slot=slot)
+    subsc_done.refresh_from_db()
+    assert subsc_done.update_on == today + relativedelta(months=1)
+
+
+@pytest.mark.django_db()
+def test_restore_organization_slot(organization_plan_factory, mocker):
+    """Only subscriptions in the given or earlier slots are restored"""
+    mocker.patch("squarelet.organizations.tasks.send_cache_invalidations")
+    mocker.patch("stripe.Plan.create")
+    cache.clear()
+    today = date.today()
+    organization_plan = organization_plan_factory()
+    subsc_early, subsc_now, subsc_later = [
+        SubscriptionFactory(
+            update_on=today - timedelta(1), plan=organization_plan, renewal_slot=slot
+        )
+        for slot in (0, 1, 2)
+    ]
+
+    tasks.restore_organization(slot=1)
+
+    for subscription in (subsc_early, subsc_now, subsc_later):
+        subscription.refresh_from_db()
+    assert subsc_early.update_on == today + relativedelta(months=1)
+    assert subsc_now.update_on == today + relativedelta(months=1)
+    assert subsc_later.update_on == today - timedelta(1)
+
+
 class TestHandleChargeSucceeded:
     """Unit tests for the handle_charge_succeeded task"""
 
@@ -83,7 +147,7 @@ class TestHandleChargeSucceeded:
             },
         }
         product = {"name": "Organization"}
-        mocker.patch(
+        retrieve_invoice = mocker.patch(
             "squarelet.organizations.tasks.stripe.Invoice.retrieve",
             return_value=invoice,
         )
@@ -92,9 +156,16 @@ class TestHandleChargeSucceeded:
             return_value=product,
         )
         mocked = mocker.patch("squarelet.organizations.models.Charge.send_receipt")
+        mocker.patch(
+            "squarelet.organizations.tasks.transaction.on_commit",
+            side_effect=lambda func: func(),
+        )
 
         tasks.handle_charge_succeeded(charge_data)
 
+        _args, kwargs = retrieve_invoice.call_args
+        assert kwargs["expand"] == ["lines.data.plan.product"]
+
         charge = Charge.objects.get(charge_id=charge_data["id"])
         assert charge.amount == charge_data["amount"]
         assert charge.fee_amount == 0
@@ -120,6 +191,10 @@ class TestHandleChargeSucceeded:
             customer__customer_id=charge_data["customer"]
         )
         mocked = mocker.patch("squarelet.organizations.models.Charge.send_receipt")
+        mocker.patch(
+            "squarelet.organizations.tasks.transaction.on_commit",
+            side_effect=lambda func: func(),
+        )
 
         tasks.handle_charge_succeeded(charge_data)
 
@@ -131,6 +206,26 @@ class TestHandleChargeSucceeded:
         assert charge.description == charge_data["description"]
         mocked.assert_called_once()
 
+    @pytest.mark.django_db()
+    def test_already_recorded(self, charge_factory, mocker):
+        """A charge which was already recorded does not send its receipt again"""
+        charge = charge_factory()
+        mocked = mocker.patch("squarelet.organizations.models.Charge.send_receipt")
+        retrieve_invoice = mocker.patch(
+            "squarelet.organizations.tasks.stripe.Invoice.retrieve"
+        )
+        mocker.patch(
+            "squarelet.organizations.tasks.transaction.on_commit",
+            side_effect=lambda func: func(),
+        )
+
+        tasks.handle_charge_succeeded(
+            {"id": charge.charge_id, "customer": "cus_123", "invoice": "in_123"}
+        )
+
+        retrieve_invoice.assert_not_called()
+        mocked.assert_not_called()
+
     def test_without_customer(self):
         timestamp = timezone.now().replace(microsecond=0)
         charge_data = {
@@ -146,6 +241,7 @@ class TestHandleChargeSucceeded:
 
         tasks.handle_charge_succeeded(charge_data)
 
+    @pytest.mark.django_db()
     def test_crowdfund(self):
         timestamp = timezone.now().replace(microsecond=0)
         charge_data = {
@@ -161,6 +257,7 @@ class TestHandleChargeSucceeded:
 
         tasks.handle_charge_succeeded(charge_data)
 
+    @pytest.mark.django_db()
     def test_recurring_donation(self, mocker):
         timestamp = timezone.now().replace(microsecond=0)
         charge_data = {
@@ -193,7 +290,32 @@ class TestHandleChargeSucceeded:
 
 
 @pytest.mark.django_db()
-def test_handle_invoice_failed(organization_factory, user_factory, mailoutbox):
+def test_retrieve_invoices(charge_factory, mocker):
+    """Each invoice is retrieved once, only for charges not yet recorded"""
+    charge = charge_factory(charge_id="ch_recorded")
+    mocked = mocker.patch(
+        "squarelet.organizations.tasks.stripe.Invoice.retrieve",
+        side_effect=lambda invoice_id, **kwargs: {"id": invoice_id},
+    )
+    charges_data = [
+        {"id": "ch_1", "customer": "cus_1", "invoice": "in_1"},
+        {"id": "ch_2", "customer": "cus_1", "invoice": "in_1"},
+        {"id": "ch_3", "customer": "cus_2", "invoice": "in_2"},
+        {"id": charge.charge_id, "customer": "cus_3", "invoice": "in_3"},
+        {"id": "ch_4", "customer": "cus_4", "invoice": None},
+        {"id": "ch_5", "customer": None, "invoice": "in_5"},
+    ]
+    invoices = tasks.retrieve_invoices(charges_data)
+    assert invoices == {"in_1": {"id": "in_1"}, "in_2": {"id": "in_2"}}
+    assert mocked.call_count == 2
+
+
+@pytest.mark.django_db()
+def test_handle_invoice_failed(organization_factory, user_factory, mailoutbox, mocker):
+    mocker.patch(
+        "squarelet.organizations.tasks.transaction.on_commit",
+        side_effect=lambda func: func(),
+    )
     user = user_factory()
     customer_id = "cus_123"
     organization = organization_factory(
@@ -206,3 +328,176 @@ def test_handle_invoice_failed(organization_factory, user_factory, mailoutbox):
     mail = mailoutbox[0]
     assert mail.subject == "Your payment has failed"
     assert mail.to == [user.email]
+
+
+@pytest.mark.django_db()
+def test_handle_customer_updated(customer_factory, mocker):
+    """The local copy of the card is updated from the customer"""
+    mocker.patch("squarelet.organizations.tasks.send_cache_invalidations")
+    customer = customer_factory()
+    customer_data = {
+        "id": customer.customer_id,
+        "object": "customer",
+        "default_source": "card_123",
+        "sources": {
+            "object": "list",
+            "data": [
+                {
+                    "id": "card_123",
+                    "object": "card",
+                    "brand": "Visa",
+                    "last4": "4242",
+                    "exp_month": 1,
+                    "exp_year": 2030,
+                }
+            ],
+        },
+    }
+    tasks.handle_customer_updated(customer_data)
+    customer.refresh_from_db()
+    assert customer.default_source == "card_123"
+    assert customer.card_display == "Visa: 4242"
+    assert customer.card_exp_year == 2030
+
+
+@pytest.mark.django_db()
+def test_handle_source_changed(customer_factory, mocker):
+    """Changes to the default card are copied locally"""
+    mocker.patch("squarelet.organizations.tasks.send_cache_invalidations")
+    customer = customer_factory(
+        default_source="card_123",
+        card_brand="Visa",
+        card_last4="4242",
+        card_updated_at=timezone.now(),
+    )
+    source_data = {
+        "id": "card_123",
+        "object": "card",
+        "customer": customer.customer_id,
+        "brand": "Visa",
+        "last4": "4242",
+        "exp_month": 2,
+        "exp_year": 2031,
+    }
+    tasks.handle_source_changed("customer.source.updated", source_data)
+    customer.refresh_from_db()
+    assert customer.card_exp_month == 2
+    assert customer.card_exp_year == 2031
+
+
+def make_stripe_event(event_type, data):
+    return StripeEvent.objects.create(
+        event_id=f"evt_{StripeEvent.objects.count()}",
+        type=event_type,
+        data={"type": event_type, "data": {"object": data}},
+    )
+
+
+@pytest.mark.django_db()
+def test_process_stripe_event_batch(mocker):
+    """Pending events are dispatched to their handlers once"""
+    handle = mocker.patch("squarelet.organizations.tasks.handle_customer_updated")
+    event = make_stripe_event("customer.updated", {"id": "cus_123"})
+    ignored = make_stripe_event("customer.created", {"id": "cus_123"})
+
+    assert tasks.process_stripe_event_batch() == 2
+    handle.assert_called_once_with({"id": "cus_123"})
+    for stripe_event in (event, ignored):
+        stripe_event.refresh_from_db()
+        assert stripe_event.status == StripeEventStatus.processed
+        assert stripe_event.attempts == 1
+        assert stripe_event.processed_at is not None
+
+    assert tasks.process_stripe_event_batch() == 0
+    assert handle.call_count == 1
+
+
+@pytest.mark.django_db()
+@override_settings(STRIPE_EVENT_MAX_ATTEMPTS=2)
+def test_process_stripe_event_batch_failure(mocker):
+    """Failed events are retried later, and given up on after too many attempts"""
+    mocker.patch(
+        "squarelet.organizations.tasks.handle_invoice_failed",
+        side_effect=ValueError("failed"),
+    )
+    event = make_stripe_event("invoice.payment_failed", {"id": "in_123"})
+
+    assert tasks.process_stripe_event_batch() == 1
+    event.refresh_from_db()
+    assert event.status == StripeEventStatus.pending
+    assert event.attempts == 1
+    assert "failed" in event.error
+    assert event.retry_at > timezone.now()
+
+    # not retried until the backoff has passed
+    assert tasks.process_stripe_event_batch() == 0
+    StripeEvent.objects.update(retry_at=timezone.now())
+    assert tasks.process_stripe_event_batch() == 1
+    event.refresh_from_db()
+    assert event.status == StripeEventStatus.failed
+    assert event.attempts == 2
+
+    StripeEvent.objects.update(retry_at=timezone.now())
+    assert tasks.process_stripe_event_batch() == 0
+
+
+@pytest.mark.django_db()
+def test_claim_stripe_events():
+    """Claimed events are leased to the worker which claimed them"""
+    event = make_stripe_event("customer.updated", {"id": "cus_123"})
+    assert tasks.claim_stripe_events(10) == [event]
+    assert tasks.claim_stripe_events(10) == []
+    event.refresh_from_db()
+    assert event.status == StripeEventStatus.pending
+    assert event.attempts == 1
+    assert event.retry_at > timezone.now()
+
+
+@pytest.mark.django_db()
+def test_process_stripe_event_batch_lease_expired(mocker):
+    """Events claimed by another worker once their lease ran out are skipped"""
+    handle = mocker.patch("squarelet.organizations.tasks.handle_customer_updated")
+    event = make_stripe_event("customer.updated", {"id": "cus_123"})
+
+    claim_stripe_events = tasks.claim_stripe_events
+
+    def claim(limit):
+        events = claim_stripe_events(limit)
+        # another worker claims the event after the lease runs out
+        StripeEvent.objects.update(retry_at=timezone.now())
+        claim_stripe_events(limit)
+        return events
+
+    mocker.patch("squarelet.organizations.tasks.claim_stripe_events", side_effect=claim)
+    assert tasks.process_stripe_event_batch() == 1
+    handle.assert_not_called()
+    event.refresh_from_db()
+    assert event.status == StripeEventStatus.pending
+    assert event.attempts == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_process_stripe_event_batch_rollback(mocker):
+    """Mail from an event which fails is not sent"""
+    send = mocker.Mock()
+
+    def handle(_invoice_data):
+        transaction.on_commit(send)
+        raise ValueError("failed")
+
+    mocker.patch(
+        "squarelet.organizations.tasks.handle_invoice_failed", side_effect=handle
+    )
+    sent = make_stripe_event("customer.updated", {"id": "cus_123"})
+    mocker.patch(
+        "squarelet.organizations.tasks.handle_customer_updated",
+        side_effect=lambda _data: transaction.on_commit(send),
+    )
+    failed = make_stripe_event("invoice.payment_failed", {"id": "in_123"})
+
+    assert tasks.process_stripe_event_batch() == 2
+    send.assert_called_once_with()
+    sent.refresh_from_db()
+    assert sent.status == StripeEventStatus.processed
+    failed.refresh_from_db()
+    assert failed.status == StripeEventStatus.pending
@@ -1,4 +1,5 @@
 # Django
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import PermissionDenied
@@ -7,7 +8,10 @@ from django.test.utils import override_settings
 from django.utils import timezone
 
 # Standard Library
+import hashlib
+import hmac
 import json
+import time
 
 # Third Party
 import pytest
@@ -15,10 +19,11 @@ import stripe
 
 # Squarelet
 from squarelet.core.tests.mixins import ViewTestMixin
+from squarelet.organizations.choices import StripeAccounts
 
 # Local
-from .. import views
-from ..models import ReceiptEmail
+from .. import tasks, views
+from ..models import Charge, ReceiptEmail, StripeEvent
 
 # pylint: disable=invalid-name
 
@@ -506,11 +511,27 @@ class TestStripeWebhook:
         )
         return views.stripe_webhook(request)
 
-    def test_simple(self, rf):
+    @pytest.mark.django_db()
+    def test_simple(self, rf, mocker):
         """Succesful request"""
-        event = {"type": "test"}
+        mocked = mocker.patch("squarelet.organizations.views.transaction.on_commit")
+        event = {"id": "evt_test", "type": "test"}
         response = self.call_view(rf, event)
         assert response.status_code == 200
+        stripe_event = StripeEvent.objects.get(event_id="evt_test")
+        assert stripe_event.type == "test"
+        assert stripe_event.data == event
+        assert mocked.call_count == 1
+
+    @pytest.mark.django_db()
+    def test_duplicate(self, rf, mocker):
+        """Events delivered more than once are only processed once"""
+        mocked = mocker.patch("squarelet.organizations.views.transaction.on_commit")
+        event = {"id": "evt_test", "type": "test"}
+        assert self.call_view(rf, event).status_code == 200
+        assert self.call_view(rf, event).status_code == 200
+        assert StripeEvent.objects.filter(event_id="evt_test").count() == 1
+        assert mocked.call_count == 1
 
     def test_get(self, rf):
         """GET requests should fail"""
@@ -537,6 +558,86 @@ class TestStripeWebhook:
     @override_settings(STRIPE_WEBHOOK_SECRETS=["123"])
     def test_signature_verification(self, rf):
         """Signature verification error should fail"""
-        event = {"type": "test"}
+        event = {"id": "evt_test", "type": "test"}
         response = self.call_view(rf, event)
         assert response.status_code == 400
+
+    def call_view_signed(self, rf, data, secret):
+        payload = json.dumps(data)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret, f"{timestamp}.{payload}".encode(), hashlib.sha256
+        ).hexdigest()
+        request = rf.post(
+            "/organizations/~stripe_webhook/",
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+        return views.stripe_webhook(request)
+
+    @pytest.mark.django_db()
+    @override_settings(STRIPE_WEBHOOK_SECRETS=["muckrock_secret", "presspass_secret"])
+    def test_presspass_account(self, rf, mocker):
+        """Events are recorded against the account whose secret signed them"""
+        mocker.patch("squarelet.organizations.views.transaction.on_commit")
+        mocked = mocker.patch(
+            "squarelet.organizations.views.stripe_cache.invalidate_event"
+        )
+        event = {"id": "evt_test", "type": "test"}
+        response = self.call_view_signed(rf, event, b"presspass_secret")
+        assert response.status_code == 200
+        stripe_event = StripeEvent.objects.get(event_id="evt_test")
+        assert stripe_event.stripe_account == StripeAccounts.presspass
+        mocked.assert_called_once_with(event, StripeAccounts.presspass)
+
+    @pytest.mark.django_db()
+    @override_settings(STRIPE_WEBHOOK_SECRETS=["muckrock_secret", "presspass_secret"])
+    def test_presspass_charge(self, rf, mocker, customer_factory):
+        """Charges from PressPass fetch their invoice with the PressPass key"""
+        mocker.patch("squarelet.organizations.views.transaction.on_commit")
+        mocker.patch("squarelet.organizations.views.stripe_cache.invalidate_event")
+        mocker.patch("squarelet.organizations.tasks.transaction.on_commit")
+        customer = customer_factory(stripe_account=StripeAccounts.presspass)
+        mocked = mocker.patch(
+            "squarelet.organizations.tasks.stripe.Invoice.retrieve",
+            return_value={
+                "lines": {
+                    "data": [
+                        {
+                            "plan": {
+                                "id": "organization",
+                                "product": {"id": "prod_1", "name": "Organization"},
+                            }
+                        }
+                    ]
+                }
+            },
+        )
+        event = {
+            "id": "evt_test",
+            "type": "charge.succeeded",
+            "data": {
+                "object": {
+                    "id": "ch_presspass",
+                    "customer": customer.customer_id,
+                    "invoice": "in_presspass",
+                    "amount": 500,
+                    "created": int(time.time()),
+                    "description": "Payment for invoice",
+                    "metadata": {},
+                }
+            },
+        }
+        response = self.call_view_signed(rf, event, b"presspass_secret")
+        assert response.status_code == 200
+        tasks.process_stripe_event_batch()
+        mocked.assert_called_once_with(
+            "in_presspass",
+            expand=["lines.data.plan.product"],
+            api_key=settings.STRIPE_SECRET_KEYS[StripeAccounts.presspass],
+        )
+        charge = Charge.objects.get(charge_id="ch_presspass")
+        assert charge.stripe_account == StripeAccounts.presspass
+        assert charge.organization == customer.organization
+        assert charge.description == "Organization"
@@ -31,11 +31,18 @@ from crispy_forms.layout import Field, Layout
 # Squarelet
 from squarelet.core.mixins import AdminLinkMixin
 from squarelet.core.utils import mixpanel_event
+from squarelet.organizations import stripe_cache
 from squarelet.organizations.choices import ChangeLogReason, StripeAccounts
 from squarelet.organizations.forms import AddMemberForm, PaymentForm, UpdateForm
 from squarelet.organizations.mixins import IndividualMixin, OrganizationAdminMixin
-from squarelet.organizations.models import Charge, Invitation, Membership, Organization
-from squarelet.organizations.tasks import handle_charge_succeeded, handle_invoice_failed
+from squarelet.organizations.models import (
+    Charge,
+    Invitation,
+    Membership,
+    Organization,
+    StripeEvent,
+)
+from squarelet.organizations.tasks import process_stripe_events
 
 # How much to paginate organizations list by
 ORG_PAGINATION = 100
@@ -451,6 +458,30 @@ class ChargeDetail(UserPassesTestMixin, DetailView):
         return context
 
 
+def construct_stripe_event(payload, sig_header):
+    """Verify a webhook's signature against each Stripe account's secret
+
+    Returns the event and the account whose secret it was signed with.  If no
+    secrets are set, the event is not verified, and is from the MuckRock account
+    """
+    secrets = [
+        (stripe_account, secret)
+        for stripe_account, secret in enumerate(settings.STRIPE_WEBHOOK_SECRETS)
+        if secret
+    ]
+    if not secrets:
+        return json.loads(payload), StripeAccounts.muckrock
+    error = None
+    for stripe_account, secret in secrets:
+        try:
+            event = stripe.Webhook.construct_event(payload, sig_header, secret)
+        except stripe.error.SignatureVerificationError as exception:
+            error = exception
+        else:
+            return event, stripe_account
+    raise error
+
+
 @csrf_exempt
 def stripe_webhook(request):
     """Handle webhooks from stripe"""
@@ -460,15 +491,8 @@ def stripe_webhook(request):
     payload = request.body
     sig_header = request.META.get("HTTP_STRIPE_SIGNATURE")
     try:
-        if settings.STRIPE_WEBHOOK_SECRETS[StripeAccounts.muckrock]:
-            event = stripe.Webhook.construct_event(
-                payload,
-                sig_header,
-                settings.STRIPE_WEBHOOK_SECRETS[StripeAccounts.muckrock],
-            )
-        else:
-            event = json.loads(request.body)
-
+        event, stripe_account = construct_stripe_event(payload, sig_header)
+        event_id = event["id"]
         event_type = event["type"]
     except (TypeError, ValueError, SyntaxError) as exception:
         logger.error(
@@ -491,16 +515,19 @@ def stripe_webhook(request):
         )
         return HttpResponseBadRequest()
     # If we've made it this far, then the webhook message was successfully sent!
-    # Now it's up to us to act on it.
-    success_msg = (
-        "Received Stripe webhook\n"
-        "\tfrom:\t%(address)s\n"
-        "\ttype:\t%(type)s\n"
-        "\tdata:\t%(data)s\n"
-    ) % {"address": request.META["REMOTE_ADDR"], "type": event_type, "data": event}
-    logger.info(success_msg)
-    if event_type == "charge.succeeded":
-        handle_charge_succeeded.delay(event["data"]["object"])
-    elif event_type == "invoice.payment_failed":
-        handle_invoice_failed.delay(event["data"]["object"])
+    # Record it, and process it in the background - Stripe may deliver the same
+    # event more than once, so only new events are processed
+    logger.info(
+        "Received Stripe webhook %s (%s) from %s",
+        event_id,
+        event_type,
+        request.META["REMOTE_ADDR"],
+    )
+    stripe_cache.invalidate_event(event, stripe_account)
+    _, created = StripeEvent.objects.get_or_create(
+        event_id=event_id,
+        defaults={"type": event_type, "data": event, "stripe_account": stripe_account},
+    )
+    if created:
+        transaction.on_commit(process_stripe_events.delay)
     return HttpResponse()
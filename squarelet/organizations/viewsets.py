@@ -5,6 +5,7 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import DjangoObjectPermissions, IsAdminUser
 
 # Squarelet
+from squarelet.core.filters import UUIDInFilter
 from squarelet.core.permissions import DjangoObjectPermissionsOrAnonReadOnly
 from squarelet.oidc.permissions import ScopePermission
 from squarelet.organizations.choices import ChangeLogReason, StripeAccounts
@@ -36,6 +37,7 @@ from squarelet.users.models import User
 class OrganizationViewSet(viewsets.ModelViewSet):
     # remove _plan after clients are updated
     queryset = Organization.objects.select_related("_plan")
+    cursor_ordering = ("updated_at", "id")
     serializer_class = OrganizationSerializer
     permission_classes = (ScopePermission | IsAdminUser,)
     read_scopes = ("read_organization",)
@@ -43,9 +45,19 @@ class OrganizationViewSet(viewsets.ModelViewSet):
     lookup_field = "uuid"
     swagger_schema = None
 
+    class Filter(django_filters.FilterSet):
+        uuid__in = UUIDInFilter(field_name="uuid")
+
+        class Meta:
+            model = Organization
+            fields = []
+
+    filterset_class = Filter
+
 
 class ChargeViewSet(viewsets.ModelViewSet):
     queryset = Charge.objects.all()
+    cursor_ordering = ("created_at", "id")
     serializer_class = ChargeSerializer
     permission_classes = (ScopePermission | IsAdminUser,)
     read_scopes = ("read_charge",)
@@ -62,6 +74,7 @@ class PressPassOrganizationViewSet(
     viewsets.GenericViewSet,
 ):
     queryset = Organization.objects.none()
+    cursor_ordering = ("updated_at", "id")
     serializer_class = PressPassOrganizationSerializer
     permission_classes = (DjangoObjectPermissionsOrAnonReadOnly,)
     lookup_field = "uuid"
@@ -86,8 +99,9 @@ class PressPassOrganizationViewSet(
         )
         super().perform_update(serializer)
         if update_subscriptions:
-            for subscription in serializer.instance.subscriptions.all():
-                subscription.stripe_modify()
+            subscriptions = serializer.instance.subscriptions.select_related("plan")
+            for subscription in subscriptions:
+                subscription.update_quantity()
 
     class Filter(django_filters.FilterSet):
         user = django_filters.ModelChoiceFilter(
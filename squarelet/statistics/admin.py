@@ -25,6 +25,4 @@ class StatisticsAdmin(VersionAdmin):
         "total_users_pro",
         "total_users_org",
         "total_orgs",
-        "users_today",
-        "pro_users",
     )
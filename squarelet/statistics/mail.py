@@ -35,19 +35,15 @@ class Digest(Email):
         def format_stat(name):
             return " ".join(s.capitalize() for s in name.split("_"))
 
+        # the users are not needed for the numeric stats
+        statistics = Statistics.objects.defer("user_ids_today", "pro_user_ids")
         try:
-            current = Statistics.objects.get(date=current_date)
+            current = statistics.get(date=current_date)
         except Statistics.DoesNotExist:
             return stats
-        day = Statistics.objects.filter(
-            date=current_date - relativedelta(days=1)
-        ).first()
-        week = Statistics.objects.filter(
-            date=current_date - relativedelta(weeks=1)
-        ).first()
-        month = Statistics.objects.filter(
-            date=current_date - relativedelta(months=1)
-        ).first()
+        day = statistics.filter(date=current_date - relativedelta(days=1)).first()
+        week = statistics.filter(date=current_date - relativedelta(weeks=1)).first()
+        month = statistics.filter(date=current_date - relativedelta(months=1)).first()
 
         numeric_stats = [
             "total_users",
@@ -71,18 +67,12 @@ class Digest(Email):
         return stats
 
     def get_pro_users(self, current_date):
-        pro_users = {}
+        # the users are compared in the database
+        statistics = Statistics.objects.only("pk")
         try:
-            current = Statistics.objects.get(date=current_date)
-            yesterday = Statistics.objects.get(
-                date=current_date - relativedelta(days=1)
-            )
+            current = statistics.get(date=current_date)
+            yesterday = statistics.get(date=current_date - relativedelta(days=1))
         except Statistics.DoesNotExist:
-            return pro_users
-
-        current_pro_users = set(u.username for u in current.pro_users.all())
-        yesterday_pro_users = set(u.username for u in yesterday.pro_users.all())
-        pro_users["gained"] = current_pro_users - yesterday_pro_users
-        pro_users["lost"] = yesterday_pro_users - current_pro_users
+            return {}
 
-        return pro_users
+        return current.pro_users_changed(yesterday)
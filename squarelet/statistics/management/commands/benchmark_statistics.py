@@ -0,0 +1,101 @@
+# Django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+# Standard Library
+from datetime import date, datetime, timedelta
+
+# Squarelet
+from squarelet.core.utils import (
+    insert_memberships,
+    measure,
+    rolled_back,
+    seed_users,
+    seeding,
+)
+from squarelet.organizations.models import Organization, Plan, Subscription
+from squarelet.statistics.models import Statistics
+from squarelet.statistics.tasks import store_statistics
+from squarelet.users.models import User
+
+
+def store_statistics_separately():
+    """The statistics as they were stored before, with a query for each count and
+    the users loaded into Python"""
+    midnight = datetime.min.time().replace(tzinfo=timezone.get_current_timezone())
+    today_midnight = datetime.combine(date.today(), midnight)
+    yesterday_midnight = today_midnight - timedelta(1)
+    pro_users = User.objects.filter(organizations__plans__slug="professional")
+    Statistics.objects.create(
+        date=date.today() - timedelta(1),
+        total_users=User.objects.count(),
+        total_users_excluding_agencies=User.objects.exclude(is_agency=True).count(),
+        total_users_pro=pro_users.count(),
+        total_users_org=User.objects.filter(
+            organizations__plans__slug="organization"
+        ).count(),
+        total_orgs=Organization.objects.exclude(individual=True, plans=None).count(),
+        verified_orgs=Organization.objects.filter(verified_journalist=True).count(),
+        user_ids_today=sorted(
+            u.pk
+            for u in User.objects.filter(
+                last_login__range=(yesterday_midnight, today_midnight)
+            )
+        ),
+        pro_user_ids=sorted({u.pk for u in pro_users}),
+    )
+
+
+class Command(BaseCommand):
+    """Compare the database queries and time needed to store the daily statistics
+    with separate counts and with aggregate queries, on a seeded set of users"""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000000, help="Number of users to seed"
+        )
+        parser.add_argument(
+            "--plan-every",
+            type=int,
+            default=10,
+            help="One in this many users are on each of the paid plans",
+        )
+
+    def handle(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        with rolled_back():
+            with seeding(self.stdout):
+                self.seed(kwargs["users"], kwargs["plan_every"])
+            for name, function in (
+                ("separate", store_statistics_separately),
+                ("aggregate", store_statistics),
+            ):
+                self.benchmark(name, function)
+
+    def seed(self, users, plan_every):
+        """Seed users, each with their own individual organization, and add some
+        of them to an organization on each of the paid plans"""
+        seed_users(users)
+        for offset, slug in enumerate(("professional", "organization")):
+            plan, _ = Plan.objects.get_or_create(
+                slug=slug, defaults={"name": slug.title()}
+            )
+            organization = Organization.objects.create(name=f"Benchmark {slug}")
+            Subscription.objects.create(
+                organization=organization, plan=plan, update_on=date.today()
+            )
+            insert_memberships(
+                f"SELECT id, %s FROM {connection.ops.quote_name(User._meta.db_table)} "
+                f"WHERE username LIKE 'benchmark-%%' AND id %% %s = %s",
+                [organization.pk, plan_every, offset],
+            )
+
+    def benchmark(self, name, function):
+        with rolled_back(), measure() as result:
+            function()
+        self.stdout.write(
+            f"{name}: {result.queries} queries, {result.elapsed * 1000:.0f} ms"
+        )
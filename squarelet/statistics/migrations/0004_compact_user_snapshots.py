@@ -0,0 +1,46 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:20
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('statistics', '0003_statistics_verified_orgs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statistics',
+            name='pro_user_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, help_text='The IDs of the users who had a professional account on this date', size=None),
+        ),
+        migrations.AddField(
+            model_name='statistics',
+            name='user_ids_today',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, help_text='The IDs of the users who logged in on this date', size=None),
+        ),
+        # compact the many to many history into the arrays
+        migrations.RunSQL(
+            sql=[
+                'UPDATE statistics_statistics SET '
+                'pro_user_ids = ARRAY(SELECT user_id FROM statistics_statistics_pro_users WHERE statistics_id = statistics_statistics.id ORDER BY user_id), '
+                'user_ids_today = ARRAY(SELECT user_id FROM statistics_statistics_users_today WHERE statistics_id = statistics_statistics.id ORDER BY user_id)',
+            ],
+            reverse_sql=[
+                'INSERT INTO statistics_statistics_pro_users (statistics_id, user_id) '
+                'SELECT id, unnest(pro_user_ids) FROM statistics_statistics',
+                'INSERT INTO statistics_statistics_users_today (statistics_id, user_id) '
+                'SELECT id, unnest(user_ids_today) FROM statistics_statistics',
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='statistics',
+            name='pro_users',
+        ),
+        migrations.RemoveField(
+            model_name='statistics',
+            name='users_today',
+        ),
+    ]
@@ -1,6 +1,8 @@
 # Django
-from django.conf import settings
-from django.db import models
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -35,20 +37,42 @@ class Statistics(models.Model):
         help_text=_("The number of organizations which are verified journalists")
     )
 
-    users_today = models.ManyToManyField(
-        settings.AUTH_USER_MODEL,
-        related_name="+",
-        help_text=_("Users who logged in on this date"),
+    # users are stored as sorted arrays of IDs, rather than many to many
+    # relations, to keep a row per user per day out of the database
+    user_ids_today = ArrayField(
+        models.IntegerField(),
+        default=list,
+        help_text=_("The IDs of the users who logged in on this date"),
     )
-    pro_users = models.ManyToManyField(
-        settings.AUTH_USER_MODEL,
-        related_name="+",
-        help_text=_("The users who had a professional account on this date"),
+    pro_user_ids = ArrayField(
+        models.IntegerField(),
+        default=list,
+        help_text=_("The IDs of the users who had a professional account on this date"),
     )
 
     def __str__(self):
         return f"Stats for {self.date}"
 
+    def pro_users_changed(self, previous):
+        """The usernames of users who gained and lost a professional account since
+        the `previous` statistics - the differences are taken in the database"""
+        quote_name = connection.ops.quote_name
+        column = quote_name(self._meta.get_field("pro_user_ids").column)
+        table = quote_name(self._meta.db_table)
+        difference = (
+            f"SELECT unnest({column}) FROM {table} WHERE id = %s "
+            f"EXCEPT SELECT unnest({column}) FROM {table} WHERE id = %s"
+        )
+        users = get_user_model().objects.order_by("username")
+        return {
+            "gained": users.filter(
+                pk__in=RawSQL(difference, [self.pk, previous.pk])
+            ).values_list("username", flat=True),
+            "lost": users.filter(
+                pk__in=RawSQL(difference, [previous.pk, self.pk])
+            ).values_list("username", flat=True),
+        }
+
     class Meta:
         ordering = ["-date"]
         verbose_name_plural = "statistics"
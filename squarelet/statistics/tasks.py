@@ -1,6 +1,9 @@
 # Django
 from celery.schedules import crontab
 from celery.task import periodic_task
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
 from django.utils import timezone
 
 # Standard Library
@@ -13,46 +16,62 @@ from squarelet.statistics.models import Statistics
 from squarelet.users.models import User
 
 
+def array_of_ids(queryset):
+    """An expression for the sorted array of the primary keys selected by
+    `queryset`, which is built in the database instead of loading the objects"""
+    sql, params = queryset.order_by("pk").values("pk").query.sql_with_params()
+    return RawSQL(f"ARRAY({sql})", params)
+
+
 # This is using UTC time instead of the local timezone
 @periodic_task(
     run_every=crontab(hour=5, minute=30),
     name="squarelet.statistics.tasks.store_statistics",
 )
+@transaction.atomic
 def store_statistics():
-    """Store the daily statistics"""
-    # pylint: disable=too-many-statements
+    """Store the daily statistics
+
+    Users and organizations are each counted in a single aggregate query, and
+    users are counted at most once even if they belong to several organizations
+    on the same plan.  The snapshots of users are built in the database.
+    """
 
     midnight = time(tzinfo=timezone.get_current_timezone())
     today_midnight = datetime.combine(date.today(), midnight)
     yesterday = date.today() - timedelta(1)
     yesterday_midnight = today_midnight - timedelta(1)
 
-    kwargs = {}
-    kwargs["date"] = yesterday
-    kwargs["total_users"] = User.objects.count()
-    kwargs["total_users_excluding_agencies"] = User.objects.exclude(
-        is_agency=True
-    ).count()
-    kwargs["total_users_pro"] = User.objects.filter(
-        organizations__plans__slug="professional"
-    ).count()
-    kwargs["total_users_org"] = User.objects.filter(
-        organizations__plans__slug="organization"
-    ).count()
-    kwargs["total_orgs"] = Organization.objects.exclude(
-        individual=True, plans=None
-    ).count()
-    kwargs["verified_orgs"] = Organization.objects.filter(
-        verified_journalist=True
-    ).count()
-    stats = Statistics.objects.create(**kwargs)
-
-    # stats needs to be saved before many to many relationships can be set
-    stats.users_today.set(
-        User.objects.filter(last_login__range=(yesterday_midnight, today_midnight))
+    professional = Q(organizations__plans__slug="professional")
+    kwargs = User.objects.aggregate(
+        total_users=Count("pk", distinct=True),
+        total_users_excluding_agencies=Count(
+            "pk", distinct=True, filter=Q(is_agency=False)
+        ),
+        total_users_pro=Count("pk", distinct=True, filter=professional),
+        total_users_org=Count(
+            "pk", distinct=True, filter=Q(organizations__plans__slug="organization")
+        ),
+    )
+    kwargs.update(
+        Organization.objects.aggregate(
+            # free individual organizations are not counted
+            total_orgs=Count(
+                "pk", distinct=True, filter=Q(individual=False) | Q(plans__isnull=False)
+            ),
+            verified_orgs=Count(
+                "pk", distinct=True, filter=Q(verified_journalist=True)
+            ),
+        )
+    )
+    Statistics.objects.create(
+        date=yesterday,
+        user_ids_today=array_of_ids(
+            User.objects.filter(last_login__range=(yesterday_midnight, today_midnight))
+        ),
+        pro_user_ids=array_of_ids(User.objects.filter(professional).distinct()),
+        **kwargs,
     )
-    stats.pro_users.set(User.objects.filter(organizations__plans__slug="professional"))
-    stats.save()
 
 
 # This is using UTC time instead of the local timezone
@@ -0,0 +1,36 @@
+# Standard Library
+from datetime import date, timedelta
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.users.tests.factories import UserFactory
+
+# Local
+from ..models import Statistics
+
+
+def make_statistics(day, pro_users):
+    return Statistics.objects.create(
+        date=day,
+        total_users=0,
+        total_users_excluding_agencies=0,
+        total_users_pro=len(pro_users),
+        total_users_org=0,
+        total_orgs=0,
+        verified_orgs=0,
+        pro_user_ids=sorted(u.pk for u in pro_users),
+    )
+
+
+@pytest.mark.django_db()
+def test_pro_users_changed():
+    kept, gained, lost = UserFactory.create_batch(3)
+    yesterday = make_statistics(date.today() - timedelta(1), [kept, lost])
+    today = make_statistics(date.today(), [kept, gained])
+
+    changed = today.pro_users_changed(yesterday)
+
+    assert list(changed["gained"]) == [gained.username]
+    assert list(changed["lost"]) == [lost.username]
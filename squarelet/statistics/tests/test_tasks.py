@@ -1,9 +1,20 @@
+# Django
+from django.utils import timezone
+
 # Standard Library
 from datetime import date, timedelta
 
 # Third Party
 import pytest
 
+# Squarelet
+from squarelet.organizations.tests.factories import (
+    OrganizationFactory,
+    OrganizationPlanFactory,
+    ProfessionalPlanFactory,
+)
+from squarelet.users.tests.factories import UserFactory
+
 # Local
 from .. import tasks
 from ..models import Statistics
@@ -16,3 +27,32 @@ def test_store_statistics():
     assert stats.date == date.today() - timedelta(1)
     assert stats.total_users == 0
     assert stats.total_orgs == 0
+
+
+@pytest.mark.django_db()
+def test_store_statistics_counts(mocker):
+    """Users on a plan through several organizations are only counted once"""
+    mocker.patch("stripe.Plan.create")
+    professional = ProfessionalPlanFactory()
+    pro_user, org_user = UserFactory.create_batch(2)
+    agency_user = UserFactory(
+        is_agency=True, last_login=timezone.now() - timedelta(days=1)
+    )
+    OrganizationFactory(plans=[professional], users=[pro_user])
+    OrganizationFactory(plans=[OrganizationPlanFactory()], users=[org_user])
+    pro_user.individual_organization.subscriptions.create(
+        plan=professional, update_on=date.today()
+    )
+
+    tasks.store_statistics()
+
+    stats = Statistics.objects.first()
+    assert stats.total_users == 3
+    assert stats.total_users_excluding_agencies == 2
+    assert stats.total_users_pro == 1
+    assert stats.total_users_org == 1
+    # both group organizations and the individual organization with a plan
+    assert stats.total_orgs == 3
+    assert stats.verified_orgs == 0
+    assert stats.user_ids_today == [agency_user.pk]
+    assert stats.pro_user_ids == [pro_user.pk]
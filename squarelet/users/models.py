@@ -15,7 +15,7 @@ from sorl.thumbnail import ImageField
 
 # Squarelet
 from squarelet.core.fields import AutoCreatedField, AutoLastModifiedField
-from squarelet.core.mixins import AvatarMixin
+from squarelet.core.mixins import AvatarMixin, ChangeTrackingMixin
 from squarelet.core.utils import file_path
 from squarelet.oidc.middleware import send_cache_invalidations
 
@@ -28,7 +28,7 @@ def user_file_path(instance, filename):
     return file_path("avatars", instance, filename)
 
 
-class User(AvatarMixin, AbstractBaseUser, PermissionsMixin):
+class User(ChangeTrackingMixin, AvatarMixin, AbstractBaseUser, PermissionsMixin):
     """User model for squarelet
 
     This is a general user model which should only store information applicable
@@ -152,12 +152,26 @@ class User(AvatarMixin, AbstractBaseUser, PermissionsMixin):
     EMAIL_FIELD = "email"
     REQUIRED_FIELDS = ["email"]
 
+    client_fields = (
+        "individual_organization",
+        "name",
+        "email",
+        "username",
+        "avatar",
+        "can_change_username",
+        "is_agency",
+        "email_failed",
+        "use_autologin",
+    )
+
     default_avatar = static("images/avatars/profile.png")
 
     objects = UserManager()
 
     class Meta:
         ordering = ("username",)
+        # for paging through users in the API
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return self.username
@@ -172,9 +186,11 @@ class User(AvatarMixin, AbstractBaseUser, PermissionsMixin):
         return self.created_at
 
     def save(self, *args, **kwargs):
+        changed = self.has_changed(*self.client_fields)
         with transaction.atomic():
             super().save(*args, **kwargs)
-            transaction.on_commit(lambda: send_cache_invalidations("user", self.uuid))
+            if changed:
+                send_cache_invalidations("user", self.uuid)
 
     def get_absolute_url(self):
         return reverse("users:detail", kwargs={"username": self.username})
@@ -1,4 +1,6 @@
 # Django
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
 from django.utils.translation import ugettext_lazy as _
 
@@ -6,14 +8,23 @@ from django.utils.translation import ugettext_lazy as _
 from oidc_provider.lib.claims import ScopeClaims
 
 # Squarelet
+from squarelet.oidc.claims import claims_cache_key, claims_version
 from squarelet.organizations.serializers import MembershipSerializer
 
 
-def userinfo(claims, user):
-    claims["name"] = user.name
-    claims["preferred_username"] = user.username
-    claims["updated_at"] = user.updated_at
-    claims["picture"] = user.avatar_url
+def build_claims(user):
+    """Build the claims bundle for a user"""
+    claims = {
+        "name": user.name,
+        "preferred_username": user.username,
+        "updated_at": user.updated_at,
+        "picture": user.avatar_url,
+        "uuid": user.uuid,
+        "use_autologin": user.use_autologin,
+        # the organizations are serialized per client as they are needed, since
+        # each client sees different entitlements, and are cached separately
+        "organizations": {},
+    }
 
     try:
         email = user.emailaddress_set.get(primary=True)
@@ -27,6 +38,45 @@ def userinfo(claims, user):
     return claims
 
 
+def get_claims(user):
+    """Get the claims bundle for a user from the cache, building it if needed
+
+    The bundle is also kept on the user for the rest of the request, as the
+    userinfo and scope claims are generated separately from the same token
+    """
+    # pylint: disable=protected-access
+    if hasattr(user, "_oidc_claims"):
+        return user._oidc_claims
+    if user.pk is None:
+        # do not cache claims for unsaved users
+        user._oidc_claims = build_claims(user)
+        user._oidc_claims_version = None
+        return user._oidc_claims
+    version = claims_version(user.uuid)
+    key = claims_cache_key(user.uuid, version)
+    claims = cache.get(key)
+    if claims is None:
+        claims = build_claims(user)
+        cache.add(key, claims, settings.OIDC_CLAIMS_CACHE_TIMEOUT)
+    user._oidc_claims = claims
+    user._oidc_claims_version = version
+    return claims
+
+
+def userinfo(claims, user):
+    user_claims = get_claims(user)
+    for key in (
+        "name",
+        "preferred_username",
+        "updated_at",
+        "picture",
+        "email",
+        "email_verified",
+    ):
+        claims[key] = user_claims[key]
+    return claims
+
+
 class CustomScopeClaims(ScopeClaims):
     """Custom Scope Claims for OIDC"""
 
@@ -36,17 +86,32 @@ class CustomScopeClaims(ScopeClaims):
 
     def scope_uuid(self):
         """Populate the scope with the UUID"""
-        return {"uuid": self.user.uuid}
+        return {"uuid": get_claims(self.user)["uuid"]}
 
     def scope_organizations(self):
         """Populate the scope with the organizations"""
-        return {
-            "organizations": [
-                MembershipSerializer(m, context={"client": self.client}).data
-                for m in self.user.memberships.all()
-            ]
-        }
+        # pylint: disable=protected-access
+        claims = get_claims(self.user)
+        client_pk = self.client.pk if self.client else None
+        if client_pk not in claims["organizations"]:
+            version = self.user._oidc_claims_version
+            key = version and claims_cache_key(
+                self.user.uuid, version, f"organizations:{client_pk}"
+            )
+            organizations = cache.get(key) if key else None
+            if organizations is None:
+                organizations = list(
+                    MembershipSerializer(
+                        self.user.memberships.select_related("organization"),
+                        many=True,
+                        context={"client": self.client},
+                    ).data
+                )
+                if key:
+                    cache.add(key, organizations, settings.OIDC_CLAIMS_CACHE_TIMEOUT)
+            claims["organizations"][client_pk] = organizations
+        return {"organizations": claims["organizations"][client_pk]}
 
     def scope_preferences(self):
         """Populate the scope with user preferences"""
-        return {"use_autologin": self.user.use_autologin}
+        return {"use_autologin": get_claims(self.user)["use_autologin"]}
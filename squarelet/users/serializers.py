@@ -1,3 +1,6 @@
+# Django
+from django.db.models import Manager
+
 # Standard Library
 import random
 import re
@@ -9,7 +12,10 @@ from dj_rest_auth.registration.serializers import RegisterSerializer
 from rest_framework import serializers
 
 # Squarelet
-from squarelet.organizations.serializers import MembershipSerializer
+from squarelet.organizations.serializers import (
+    MembershipSerializer,
+    resolve_organizations,
+)
 from squarelet.users.models import User
 
 
@@ -39,6 +45,21 @@ class UserBaseSerializer(serializers.ModelSerializer):
         return self.get_primary_email_field(obj, "verified", False)
 
 
+class UserListSerializer(serializers.ListSerializer):
+    """Resolve the plans and entitlements for all users' organizations at once
+
+    The users' memberships should be prefetched
+    """
+
+    def to_representation(self, data):
+        users = data.all() if isinstance(data, Manager) else data
+        resolve_organizations(
+            self.context,
+            {m.organization_id for user in users for m in user.memberships.all()},
+        )
+        return super().to_representation(users)
+
+
 class UserReadSerializer(UserBaseSerializer):
     """Read serializer for user, for clients to pull data
     This reads email information from the primary EmailAddress object
@@ -65,6 +86,7 @@ class UserReadSerializer(UserBaseSerializer):
             "use_autologin",
             "uuid",
         )
+        list_serializer_class = UserListSerializer
 
     def get_email(self, obj):
         return self.get_primary_email_field(obj, "email", "")
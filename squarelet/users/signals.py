@@ -22,16 +22,17 @@ def email_changed(request, user, from_email_address, to_email_address, **kwargs)
     # Leave out presspass for now, as they do not have a stripe account yet
     accounts = [StripeAccounts.muckrock]
     for account in accounts:
-        customer = user.individual_organization.customer(account).stripe_customer
-        customer.email = to_email_address.email
-        customer.save()
+        customer = user.individual_organization.customer(account)
+        customer.stripe_customer.email = to_email_address.email
+        customer.stripe_customer.save()
+        customer.invalidate_stripe_customer()
 
     # clear the email failed flag
     with transaction.atomic():
         user.email_failed = False
         user.save()
         # send client sites a cache invalidation to update this user's info
-        transaction.on_commit(lambda: send_cache_invalidations("user", user.uuid))
+        send_cache_invalidations("user", user.uuid)
 
     # send the user a notification
     send_mail(
@@ -1,3 +1,7 @@
+# Django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 # Standard Library
 import json
 from unittest.mock import Mock
@@ -9,6 +13,13 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 # Squarelet
+from squarelet.core.pagination import KeysetPagination
+from squarelet.organizations.tests.factories import (
+    EntitlementFactory,
+    MembershipFactory,
+    PlanFactory,
+    SubscriptionFactory,
+)
 from squarelet.users.serializers import PressPassUserSerializer
 from squarelet.users.tests.factories import UserFactory
 
@@ -32,6 +43,80 @@ class TestUserAPI:
         assert response_json["name"] == user.name
         assert response_json["preferred_username"] == user.username
 
+    def test_retrieve_entitlements_queries(
+        self, user_factory, subscription_with_card_factory
+    ):
+        """Plans, cards and entitlements are resolved for all of a user's
+        organizations at once"""
+        user = user_factory(is_staff=True)
+        entitlement = EntitlementFactory()
+        plan = PlanFactory()
+        plan.entitlements.add(entitlement)
+        client = APIClient()
+        client.force_authenticate(
+            user=user, token=Mock(client=entitlement.client, scope=[])
+        )
+
+        def retrieve_user():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(f"/api/users/{user.individual_organization_id}/")
+            assert response.status_code == status.HTTP_200_OK
+            return len(queries), json.loads(response.content)["organizations"]
+
+        for subscription in subscription_with_card_factory(1, plan=plan):
+            MembershipFactory(user=user, organization=subscription.organization)
+        num_queries, _organizations = retrieve_user()
+        for subscription in subscription_with_card_factory(3, plan=plan):
+            MembershipFactory(user=user, organization=subscription.organization)
+        more_num_queries, organizations = retrieve_user()
+
+        assert num_queries == more_num_queries
+        subscribed = [o for o in organizations if o["entitlements"]]
+        assert len(subscribed) == 4
+        for organization in subscribed:
+            assert [e["slug"] for e in organization["entitlements"]] == [
+                entitlement.slug
+            ]
+            assert organization["plan"] == plan.slug
+            assert organization["card"] == "Visa: 4242"
+
+    def test_list_uuid_in(self, user_factory):
+        """Many users may be fetched at once by UUID, with a constant number of
+        queries"""
+        client = APIClient()
+        client.force_authenticate(user=user_factory(is_staff=True))
+
+        def list_users(users):
+            uuids = ",".join(str(u.individual_organization_id) for u in users)
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get("/api/users/", {"uuid__in": uuids})
+            assert response.status_code == status.HTTP_200_OK
+            return len(queries), json.loads(response.content)["results"]
+
+        users = user_factory.create_batch(4)
+        for user, subscription in zip(users, SubscriptionFactory.create_batch(4)):
+            MembershipFactory(user=user, organization=subscription.organization)
+        user_factory()
+        num_queries, _results = list_users(users[:1])
+        more_num_queries, results = list_users(users)
+
+        assert num_queries == more_num_queries
+        assert {r["uuid"] for r in results} == {
+            str(u.individual_organization_id) for u in users
+        }
+
+    def test_list_uuid_in_invalid(self, user_factory, settings):
+        """Too many or malformed UUIDs are rejected"""
+        settings.API_BULK_MAX_UUIDS = 1
+        users = user_factory.create_batch(2)
+        client = APIClient()
+        client.force_authenticate(user=user_factory(is_staff=True))
+        uuids = ",".join(str(u.individual_organization_id) for u in users)
+        response = client.get("/api/users/", {"uuid__in": uuids})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = client.get("/api/users/", {"uuid__in": "foo"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def test_create(self, user_factory, mocker):
         user = user_factory(is_staff=True)
         data = {
@@ -89,6 +174,28 @@ class TestPPUserAPI:
         response_json = json.loads(response.content)
         assert len(response_json["results"]) == size + 1
 
+    def test_list_cursor(self, api_client, user, mocker):
+        """List users a page at a time with a cursor"""
+        mocker.patch.object(KeysetPagination, "page_size", 2)
+        api_client.force_authenticate(user=user)
+        users = [user] + UserFactory.create_batch(4)
+        uuids = []
+        url = "/pp-api/users/?cursor="
+        while url:
+            response = api_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            response_json = json.loads(response.content)
+            assert "count" not in response_json
+            uuids.extend(u["uuid"] for u in response_json["results"])
+            url = response_json["next"]
+        assert uuids == [str(u.uuid) for u in users]
+
+    def test_list_bad_cursor(self, api_client, user):
+        """Invalid cursors are not found"""
+        api_client.force_authenticate(user=user)
+        response = api_client.get("/pp-api/users/?cursor=bad")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
     def test_retrieve(self, api_client, user):
         """Test retrieving a user"""
         api_client.force_authenticate(user=user)
@@ -1,3 +1,6 @@
+# Django
+from django.utils import timezone
+
 # Standard Library
 from urllib.parse import parse_qs, urlsplit
 
@@ -17,6 +20,19 @@ def test_save(user_factory, mocker):
     mocked.assert_called_with("user", user.uuid)
 
 
+@pytest.mark.django_db(transaction=True)
+def test_save_unchanged(user_factory, mocker):
+    """Saving fields which clients are not sent does not invalidate their caches"""
+    user = user_factory()
+    mocked = mocker.patch("squarelet.users.models.send_cache_invalidations")
+    user.last_login = timezone.now()
+    user.save(update_fields=["last_login"])
+    mocked.assert_not_called()
+    user.name = "New Name"
+    user.save()
+    mocked.assert_called_with("user", user.uuid)
+
+
 def test_get_absolute_url(user_factory):
     user = user_factory.build()
     assert user.get_absolute_url() == f"/users/{user.username}/"
@@ -1,8 +1,15 @@
 # Standard Library
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
+from uuid import uuid4
+
+# Third Party
+import pytest
 
 # Squarelet
+from squarelet.oidc.claims import claims_version, invalidate_claims
+from squarelet.organizations.models import Organization
 from squarelet.organizations.serializers import MembershipSerializer
+from squarelet.users.models import User
 
 # Local
 from .. import oidc
@@ -43,3 +50,97 @@ def test_scope_preferences(user_factory):
     claims = oidc.CustomScopeClaims(token)
     info = claims.scope_preferences()
     assert info["use_autologin"] == user.use_autologin
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claims_cached(user_factory, django_assert_num_queries):
+    """Claims are cached per user until the user changes"""
+    user = user_factory()
+    oidc.userinfo({}, User.objects.get(pk=user.pk))
+
+    fresh_user = User.objects.get(pk=user.pk)
+    with django_assert_num_queries(0):
+        claims = oidc.userinfo({}, fresh_user)
+    assert claims["name"] == user.name
+
+    user.name = "New Name"
+    user.save()
+    claims = oidc.userinfo({}, User.objects.get(pk=user.pk))
+    assert claims["name"] == "New Name"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claims_organization_invalidation(user_factory, organization_factory, mocker):
+    """Claims are cleared when one of the user's organizations changes"""
+    mocker.patch(
+        "squarelet.organizations.serializers.OrganizationSerializer.get_card",
+        return_value="",
+    )
+    user = user_factory()
+    organization = organization_factory(users=[user])
+    token = Mock(user=User.objects.get(pk=user.pk), client=None)
+    oidc.CustomScopeClaims(token).scope_organizations()
+
+    organization.name = "New Name"
+    organization.save()
+    token = Mock(user=User.objects.get(pk=user.pk), client=None)
+    info = oidc.CustomScopeClaims(token).scope_organizations()
+    names = [o["name"] for o in info["organizations"]]
+    assert "New Name" in names
+
+
+@pytest.mark.django_db()
+def test_claims_invalidated_while_building(user_factory):
+    """Claims built before an invalidation are not read after it"""
+    user = user_factory()
+
+    def build_claims(user):
+        claims = oidc.build_claims(user)
+        invalidate_claims("user", [user.uuid])
+        return claims
+
+    with patch("squarelet.users.oidc.build_claims", side_effect=build_claims):
+        oidc.userinfo({}, User.objects.get(pk=user.pk))
+
+    # update does not send a cache invalidation
+    User.objects.filter(pk=user.pk).update(name="New Name")
+    claims = oidc.userinfo({}, User.objects.get(pk=user.pk))
+    assert claims["name"] == "New Name"
+
+
+@pytest.mark.django_db()
+def test_claims_organizations_invalidated_while_building(
+    user_factory, organization_factory, mocker
+):
+    """Organizations serialized before an invalidation are not read after it"""
+    mocker.patch(
+        "squarelet.organizations.serializers.OrganizationSerializer.get_card",
+        return_value="",
+    )
+    user = user_factory()
+    organization = organization_factory(users=[user])
+    serializer = oidc.MembershipSerializer
+
+    def serialize(*args, **kwargs):
+        data = serializer(*args, **kwargs).data
+        invalidate_claims("organization", [organization.uuid])
+        return Mock(data=data)
+
+    with patch("squarelet.users.oidc.MembershipSerializer", side_effect=serialize):
+        token = Mock(user=User.objects.get(pk=user.pk), client=None)
+        oidc.CustomScopeClaims(token).scope_organizations()
+
+    Organization.objects.filter(pk=organization.pk).update(name="New Name")
+    token = Mock(user=User.objects.get(pk=user.pk), client=None)
+    info = oidc.CustomScopeClaims(token).scope_organizations()
+    assert "New Name" in [o["name"] for o in info["organizations"]]
+
+
+def test_claims_version_expires(mocker, settings):
+    """Version tokens outlive the claims cached under them, but do expire"""
+    settings.OIDC_CLAIMS_CACHE_TIMEOUT = 60
+    mocker.patch("squarelet.oidc.claims.cache.get", return_value=None)
+    add = mocker.patch("squarelet.oidc.claims.cache.add", return_value=True)
+    claims_version(uuid4())
+    (_key, _version, timeout), _kwargs = add.call_args
+    assert timeout == 120
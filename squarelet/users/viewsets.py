@@ -8,6 +8,7 @@ from django.urls import reverse
 from django.utils.translation import ugettext_lazy as _
 
 # Third Party
+import django_filters
 import sesame.utils
 from allauth.account import app_settings as allauth_settings
 from allauth.account.models import EmailAddress, EmailConfirmationHMAC
@@ -18,6 +19,7 @@ from rest_framework.permissions import DjangoObjectPermissions, IsAdminUser
 from rest_framework.response import Response
 
 # Squarelet
+from squarelet.core.filters import UUIDInFilter
 from squarelet.core.mail import send_mail
 from squarelet.oidc.permissions import ScopePermission
 from squarelet.organizations.models import Membership
@@ -32,13 +34,16 @@ from squarelet.users.serializers import (
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.prefetch_related(
-        Prefetch("memberships", queryset=Membership.objects.all()),
+        Prefetch(
+            "memberships", queryset=Membership.objects.select_related("organization")
+        ),
         Prefetch(
             "emailaddress_set",
             queryset=EmailAddress.objects.filter(primary=True),
             to_attr="primary_emails",
         ),
     ).order_by("created_at")
+    cursor_ordering = ("created_at", "id")
     permission_classes = (ScopePermission | IsAdminUser,)
     read_scopes = ("read_user",)
     write_scopes = ("write_user",)
@@ -54,6 +59,15 @@ class UserViewSet(viewsets.ModelViewSet):
         else:
             return UserReadSerializer
 
+    class Filter(django_filters.FilterSet):
+        uuid__in = UUIDInFilter(field_name="individual_organization_id")
+
+        class Meta:
+            model = User
+            fields = []
+
+    filterset_class = Filter
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -99,6 +113,7 @@ class PressPassUserViewSet(
     viewsets.GenericViewSet,
 ):
     queryset = User.objects.all()
+    cursor_ordering = ("created_at", "id")
     permission_classes = (DjangoObjectPermissions,)
     lookup_field = "individual_organization_id"
     lookup_url_kwarg = "uuid"